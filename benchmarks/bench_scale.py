@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Scale benchmark: runs full MassUpdater jobs against simulated routers served by
+# tests/fake_routeros.py and reports throughput, per-host latency, memory and CPU.
+#
+# Each simulated router gets its own loopback address (127.x.y.z), so the fake
+# server binds 0.0.0.0 and the benchmark needs Linux-style 127.0.0.0/8 routing.
+# Every job runs in a child process so memory and CPU figures are per job.
+#
+#   python benchmarks/bench_scale.py --hosts 1000 10000 --threads 10 50 200 --latency 0.02
+
+from __future__ import annotations
+
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import tempfile
+import time
+from typing import Any
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TQDM_DISABLE', '1')
+
+import mkmassupdate  # noqa: E402
+from tests.fake_routeros import FakeRouterOSServer, RouterProfile, loopback_address  # noqa: E402
+
+
+def _write_ip_list(hosts: int, port: int, use_ssl: bool) -> str:
+    suffix = '|SSL' if use_ssl else ''
+    tmp = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8')
+    with tmp:
+        for i in range(hosts):
+            tmp.write(f"{loopback_address(i)}:{port}{suffix}\n")
+    return tmp.name
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _run_job(argv: list[str], results: multiprocessing.Queue) -> None:
+    # Log formatting stays on the hot path, but output goes to /dev/null
+    log = logging.getLogger("MKMikroTikUpdater")
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    handler = logging.StreamHandler(open(os.devnull, 'w', encoding='utf-8'))
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(threadName)s - %(message)s'))
+    log.addHandler(handler)
+
+    sys.argv = ['mkmassupdate.py'] + argv
+    args = mkmassupdate._parse_args()
+    updater = mkmassupdate.MassUpdater(args)
+
+    started = time.perf_counter()
+    updater.run()
+    wall = time.perf_counter() - started
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    durations = list(updater.results.durations)
+    results.put({
+        'wall': wall,
+        'processed': updater.results.processed,
+        'failed': updater.results.failed,
+        'p50': _percentile(durations, 50),
+        'p99': _percentile(durations, 99),
+        'cpu': usage.ru_utime + usage.ru_stime,
+        'max_rss_mb': usage.ru_maxrss / 1024,
+    })
+
+
+def _wait_for_report(child: multiprocessing.Process, results: multiprocessing.Queue) -> dict[str, Any]:
+    # A child that dies before reporting would otherwise leave results.get() blocked forever
+    while True:
+        try:
+            return results.get(timeout=1.0)
+        except queue.Empty:
+            if not child.is_alive():
+                raise RuntimeError(f"Benchmark job exited with code {child.exitcode} without a report")
+
+
+def run_benchmark(hosts: int, threads: int, profile: RouterProfile, use_ssl: bool, extra_args: list[str]) -> dict[str, Any]:
+    server = FakeRouterOSServer(profile, host='0.0.0.0', use_ssl=use_ssl).start()
+    ip_list = _write_ip_list(hosts, server.port, use_ssl)
+    try:
+        argv = [
+            '-u', profile.username, '-p', profile.password,
+            '--ip-list', ip_list, '--threads', str(threads),
+            '--update-check-delay', '0.05', '--no-colors',
+        ] + extra_args
+        results: multiprocessing.Queue = multiprocessing.Queue()
+        child = multiprocessing.Process(target=_run_job, args=(argv, results))
+        child.start()
+        report = _wait_for_report(child, results)
+        child.join()
+    finally:
+        server.stop()
+        os.unlink(ip_list)
+
+    report.update(hosts=hosts, threads=threads, hosts_per_min=report['processed'] / report['wall'] * 60)
+    return report
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="MassUpdater scale benchmark against simulated routers")
+    parser.add_argument("--hosts", type=int, nargs='+', default=[1000], help="Simulated router counts to run.")
+    parser.add_argument("--threads", type=int, nargs='+', default=[5, 50], help="Worker thread counts to run.")
+    parser.add_argument("--ssl", action="store_true", help="Use API-SSL for every router.")
+    parser.add_argument("--latency", type=float, default=0.01, help="Simulated seconds per reply.")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of commands that never get a reply.")
+    parser.add_argument("--checking-polls", type=int, default=2, help="Update prints reporting 'checking' per host.")
+    parser.add_argument("--cloud-delay", type=float, default=0.0, help="Seconds per simulated cloud backup upload.")
+    parser.add_argument("--reboot-time", type=float, default=1.0, help="Seconds a router is unreachable after reboot.")
+    parser.add_argument("--no-dry-run", action="store_true", help="Install updates and reboot instead of a dry run.")
+    parser.add_argument("--mkmassupdate-args", default='', help="Extra arguments passed to mkmassupdate, e.g. '--cloud-password x'.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    profile = RouterProfile(
+        latency=args.latency, drop_rate=args.drop_rate, checking_polls=args.checking_polls,
+        cloud_delay=args.cloud_delay, reboot_time=args.reboot_time,
+    )
+    extra_args = args.mkmassupdate_args.split()
+    if not args.no_dry_run:
+        extra_args.append('--dry-run')
+
+    header = f"{'hosts':>7} {'threads':>7} {'wall s':>8} {'hosts/min':>10} {'p50 s':>7} {'p99 s':>7} {'cpu s':>7} {'rss MB':>7} {'failed':>6}"
+    print(header)
+    print('-' * len(header))
+    for hosts in args.hosts:
+        for threads in args.threads:
+            r = run_benchmark(hosts, threads, profile, args.ssl, extra_args)
+            print(
+                f"{r['hosts']:>7} {r['threads']:>7} {r['wall']:>8.1f} {r['hosts_per_min']:>10.0f} "
+                f"{r['p50']:>7.3f} {r['p99']:>7.3f} {r['cpu']:>7.1f} {r['max_rss_mb']:>7.1f} {r['failed']:>6}",
+                flush=True,
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -25,6 +25,7 @@ from __future__ import annotations
 
 import threading
 import queue
+import asyncio
 import time
 import argparse
 import librouteros
@@ -35,10 +36,51 @@ import os
 import sys
 import getpass
 import re
+import json
+import random
+import collections
+import errno
+import ipaddress
+import difflib
+import hashlib
+import hmac
+import secrets
+import sqlite3
+import zlib
+import gzip
+import shutil
+import selectors
+import contextlib
+import heapq
+import statistics
+import math
+import array
+import tempfile
+import calendar
+import csv
+import linecache
+import base64
+import http.client
 import yaml
-from typing import Any
+from typing import Any, Iterable, Iterator
 from tqdm import tqdm
 from librouteros.query import Key
+from librouteros.login import plain as plain_login
+from librouteros.protocol import parse_word
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:  # optional, --fleet-export falls back to CSV
+    pyarrow = None
 
 log_lock = threading.Lock()
 
@@ -140,63 +182,513 @@ def _setup_logger(use_colors_arg: bool, debug_level: bool = False) -> logging.Lo
 logger = logging.getLogger("MKMikroTikUpdater")
 
 
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> _NullSpan:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        return None
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullTracer:
+    enabled = False
+
+    def span(self, name: str, **attrs: Any) -> _NullSpan:
+        return _NULL_SPAN
+
+    def close(self) -> None:
+        pass
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'attrs', 'start')
+
+    def __init__(self, tracer: ChromeTracer, name: str, attrs: dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+
+    def __enter__(self) -> _Span:
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: Any) -> None:
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer._add_complete_event(self.name, self.start, end, self.attrs)
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+
+# Chrome trace event output loads in chrome://tracing, Perfetto or speedscope.
+# Each worker thread gets its own track, so the spans of one host nest under its "host" span.
+class ChromeTracer:
+    enabled = True
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._events: list[dict[str, Any]] = []
+        self._thread_names: dict[int, str] = {}
+
+    def span(self, name: str, **attrs: Any) -> _Span:
+        return _Span(self, name, attrs)
+
+    def _add_complete_event(self, name: str, start: float, end: float, attrs: dict[str, Any]) -> None:
+        thread = threading.current_thread()
+        tid = thread.ident or 0
+        if tid not in self._thread_names:
+            self._thread_names[tid] = thread.name
+        # list.append is atomic under the GIL, so no lock is needed on the hot path
+        self._events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': round((start - self._origin) * 1e6, 1),
+            'dur': round((end - start) * 1e6, 1),
+            'pid': self._pid,
+            'tid': tid,
+            'args': attrs,
+        })
+
+    def close(self) -> None:
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid, 'args': {'name': name}}
+            for tid, name in self._thread_names.items()
+        ]
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + self._events, 'displayTimeUnit': 'ms'}, f, default=str)
+        logger.info(f"Trace with {len(self._events)} spans written to {self.path}")
+
+
+tracer: NullTracer | ChromeTracer = NullTracer()
+
+
+def _setup_tracer(trace_path: str | None) -> NullTracer | ChromeTracer:
+    global tracer
+    tracer = ChromeTracer(trace_path) if trace_path else NullTracer()
+    return tracer
+
+
+_PROFILE_CATEGORIES = ('log_lock', 'queue', 'socket', 'tls', 'librouteros', 'logging', 'sleep', 'other')
+
+
+def _profile_category(filename: str, name: str) -> str | None:
+    # What a stack frame is doing, for the frames the report breaks out
+    path = filename.replace('\\', '/')
+    if path.endswith('/queue.py') and name == 'get':
+        return 'queue'
+    if path.endswith('/ssl.py'):
+        return 'tls'
+    if path.endswith(('/socket.py', '/selectors.py', '/http/client.py', '/librouteros/connections.py')):
+        return 'socket'
+    if '/librouteros/' in path:
+        return 'librouteros'
+    if '/logging/' in path or name == 'format':
+        return 'logging'
+    return None
+
+
+# Samples the stack of every other thread every `interval` seconds with sys._current_frames().
+# A sample counts as CPU when the thread's CPU clock advanced by at least half the interval since
+# the previous sample, otherwise as waiting; without per-thread CPU clocks (Windows) every sample
+# is waiting. Stacks are aggregated as they are taken, so memory does not grow with the run length.
+class SamplingProfiler:
+    def __init__(self, path: str, interval: float = 0.01) -> None:
+        self.path = path
+        self.interval = interval
+        self.samples = 0
+        self.ticks = 0
+        self.stacks: collections.Counter[tuple[str, ...]] = collections.Counter()
+        self.categories: collections.Counter[tuple[str, str]] = collections.Counter()
+        self._labels: dict[Any, str] = {}
+        self._lines: dict[tuple[Any, int], str | None] = {}
+        self._cpu_seen: dict[int, float] = {}
+        self._thread_names: dict[int, str] = {}
+        self._stop = threading.Event()
+        self._started = time.perf_counter()
+        self._elapsed = 0.0
+        self._thread = threading.Thread(target=self._run, name="Profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self._sample(own)
+
+    def _thread_name(self, ident: int) -> str:
+        name = self._thread_names.get(ident)
+        if name is None:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            # "Worker-12" and "Worker-3" share one flame graph root
+            name = re.sub(r'-\d+$', '', names.get(ident, 'thread'))
+            self._thread_names[ident] = name
+        return name
+
+    def _on_cpu(self, ident: int) -> bool:
+        clock_id = getattr(time, 'pthread_getcpuclockid', None)
+        if clock_id is None:
+            return False
+        try:
+            cpu = time.clock_gettime(clock_id(ident))
+        except (OSError, OverflowError):
+            return False
+        previous = self._cpu_seen.get(ident)
+        self._cpu_seen[ident] = cpu
+        return previous is not None and cpu - previous >= self.interval / 2
+
+    def _line_category(self, frame: Any) -> str | None:
+        # Blocking in a C call leaves the caller on the line that made it
+        key = (frame.f_code, frame.f_lineno)
+        if key not in self._lines:
+            line = linecache.getline(frame.f_code.co_filename, frame.f_lineno)
+            self._lines[key] = 'log_lock' if 'log_lock' in line else 'sleep' if 'sleep(' in line else None
+        return self._lines[key]
+
+    def _sample(self, own: int) -> None:
+        self.ticks += 1
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            state = 'cpu' if self._on_cpu(ident) else 'wait'
+            category = self._line_category(frame)
+            labels: list[str] = []
+            while frame is not None:
+                code = frame.f_code
+                label = self._labels.get(code)
+                if label is None:
+                    label = self._labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+                labels.append(label)
+                if category is None:
+                    category = _profile_category(code.co_filename, code.co_name)
+                frame = frame.f_back
+            labels.append(self._thread_name(ident))
+            labels.reverse()
+            labels.append(f"[{state}]")
+            self.stacks[tuple(labels)] += 1
+            self.categories[(category or 'other', state)] += 1
+            self.samples += 1
+
+    def report(self) -> str:
+        total = max(1, self.samples)
+        lines = [
+            f"Profile: {self.samples} samples over {self.ticks} ticks of {self.interval * 1000:g} ms "
+            f"({self._elapsed:.1f}s, {len(self._thread_names)} threads)",
+            f"  {'where':<12} {'wait':>7} {'cpu':>7}",
+        ]
+        for category in _PROFILE_CATEGORIES:
+            wait, cpu = self.categories[(category, 'wait')], self.categories[(category, 'cpu')]
+            if wait or cpu:
+                lines.append(f"  {category:<12} {100 * wait / total:>6.1f}% {100 * cpu / total:>6.1f}%")
+        leaves: collections.Counter[str] = collections.Counter()
+        for stack, count in self.stacks.items():
+            if stack[-1] == '[cpu]' and len(stack) > 2:
+                leaves[stack[-2]] += count
+        if leaves:
+            lines.append("  Top CPU frames:")
+            lines.extend(f"    {100 * count / total:>5.1f}%  {label}" for label, count in leaves.most_common(10))
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        self._elapsed = time.perf_counter() - self._started
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Folded stacks, one "root;...;leaf count" line each: flamegraph.pl, speedscope, inferno
+        with open(self.path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+        report = self.report()
+        with open(f"{self.path}.txt", 'w', encoding='utf-8') as f:
+            f.write(report + "\n")
+        logger.info(report)
+        logger.info(f"Profile written to {self.path} (folded stacks) and {self.path}.txt")
+
+
+profiler: SamplingProfiler | None = None
+
+
+def _setup_profiler(path: str | None, interval_ms: float = 10.0) -> SamplingProfiler | None:
+    global profiler
+    profiler = SamplingProfiler(path, interval_ms / 1000) if path else None
+    return profiler
+
+
+# Each worker owns one slot and is its only writer; the dashboard reads all slots on a timer,
+# so neither side takes a lock.
+class _WorkerSlot:
+    __slots__ = ('host', 'phase', 'started', 'ok', 'failed')
+
+    def __init__(self) -> None:
+        self.host: str | None = None
+        self.phase: str | None = None
+        self.started = 0.0
+        self.ok = 0
+        self.failed = 0
+
+
+_worker_slot = threading.local()
+
+
+@contextlib.contextmanager
+def _phase(phases: dict[str, float] | None, name: str, **attrs: Any) -> Iterator[Any]:
+    # A traced span whose duration is also added to `phases` (kept in --state-db for --estimate)
+    slot = getattr(_worker_slot, 'slot', None)
+    previous_phase = slot.phase if slot else None
+    if slot:
+        slot.phase = name
+    started = time.perf_counter()
+    try:
+        with tracer.span(name, **attrs) as span:
+            yield span
+    finally:
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - started
+        if slot:
+            slot.phase = previous_phase
+
+
+def _command_name(command: Any) -> str:
+    cmd_str = command[0] if isinstance(command, tuple) else command
+    return str(cmd_str)
+
+
+# Commands that legitimately take long on any link; they keep the non-adaptive timeout. Matched on
+# the last path segment, since Path calls pass just 'download' or 'install'.
+_SLOW_COMMANDS = frozenset({'check-for-updates', 'upload-file', 'download', 'install', 'upgrade', 'export', 'save'})
+
+
+# RTT samples of the host being processed by this thread and the timeouts learned for it
+# from earlier runs (None when not adapted)
+class HostTiming:
+    def __init__(self, connect_timeout: float | None, command_timeout: float | None, slow_timeout: float) -> None:
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        self.slow_timeout = slow_timeout
+        self.connect_rtts: list[float] = []
+        self.command_rtts: list[float] = []
+
+
+_host_timing = threading.local()
+# Last error caught by _execute_router_command on this thread, for the host retry decision
+_command_errors = threading.local()
+
+
+class RetryPolicy:
+    def __init__(self, max_retries: int = 3, base_delay: float = 5.0, max_delay: float = 60.0, jitter: bool = True) -> None:
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt: int) -> float:
+        # Exponential backoff with "full jitter": a uniform pick between 0 and the capped backoff,
+        # so workers that failed together do not retry in lockstep
+        cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(0, cap) if self.jitter else cap
+
+
+# Fleet-wide retry budget over a sliding window: retries are allowed while they stay
+# below `ratio` of the calls made in the window (with a small floor for quiet periods).
+class RetryBudget:
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10, window: float = 60.0) -> None:
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._lock = threading.Lock()
+        self._buckets: collections.deque[list[int]] = collections.deque()
+        self._calls = 0
+        self._retries = 0
+        self.denied = 0
+
+    def _expire(self, now: int) -> None:
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            _, calls, retries = self._buckets.popleft()
+            self._calls -= calls
+            self._retries -= retries
+
+    def _bucket(self, now: int) -> list[int]:
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0])
+        return self._buckets[-1]
+
+    def record_call(self) -> None:
+        now = int(time.monotonic())
+        with self._lock:
+            self._expire(now)
+            self._bucket(now)[1] += 1
+            self._calls += 1
+
+    def try_acquire(self) -> bool:
+        now = int(time.monotonic())
+        with self._lock:
+            self._expire(now)
+            if self._retries >= max(self.min_retries, self.ratio * self._calls):
+                self.denied += 1
+                return False
+            self._bucket(now)[2] += 1
+            self._retries += 1
+            return True
+
+
+retry_policies: dict[str, RetryPolicy] = {
+    'network': RetryPolicy(),
+    'cloud': RetryPolicy(),
+}
+retry_budget: RetryBudget | None = None
+
+
+def _setup_retry(args: argparse.Namespace) -> None:
+    global retry_budget
+    retry_policies['network'] = RetryPolicy(args.retries, args.retry_base_delay, args.retry_max_delay)
+    retry_policies['cloud'] = RetryPolicy(args.cloud_retries, args.cloud_retry_base_delay, args.retry_max_delay)
+    retry_budget = RetryBudget(args.retry_budget) if args.retry_budget else None
+
+
+_TRANSIENT_TRAP_TERMS = ('connection', 'timeout', 'connect', 'resolve')
+_AUTH_TRAP_TERMS = ('invalid user name or password', 'not logged in', 'no credential sets left', 'login failure')
+
+
+def _classify_failure(error: BaseException) -> str:
+    # 'transient' failures may pass on a later attempt; 'auth', 'trap' (rejected by the router)
+    # and 'logic' (a bug or unexpected reply) would fail the same way again
+    if isinstance(error, librouteros.exceptions.TrapError):
+        msg = (getattr(error, 'message', '') or str(error)).lower()
+        if any(term in msg for term in _AUTH_TRAP_TERMS):
+            return 'auth'
+        if any(term in msg for term in _TRANSIENT_TRAP_TERMS):
+            return 'transient'
+        return 'trap'
+    if isinstance(error, (OSError, librouteros.exceptions.ConnectionClosed, librouteros.exceptions.FatalError)):
+        return 'transient'
+    return 'logic'
+
+
+def _retry_class(command: Any, error: Exception) -> str | None:
+    # Which retry policy applies to an error, or None when retrying cannot help
+    if isinstance(error, (librouteros.exceptions.TrapError, librouteros.exceptions.MultiTrapError)):
+        cmd_str = _command_name(command)
+        msg = (getattr(error, 'message', '') or str(error)).lower()
+        if 'cloud' in cmd_str and any(term in msg for term in _TRANSIENT_TRAP_TERMS):
+            return 'cloud'
+        return None
+    if isinstance(error, (TimeoutError, socket.error, librouteros.exceptions.LibRouterosError)):
+        return 'network'
+    return None
+
+
 def execute_with_retry(
     api: librouteros.Connection,
     command: str | tuple[Any, ...],
     params: dict[str, Any] | None = None,
-    max_retries: int = 3,
-    retry_delay: int = 5,
+    max_retries: int | None = None,
+    retry_delay: float | None = None,
 ) -> list[dict[str, Any]] | None:
-    last_exception: Exception | None = None
-    for attempt in range(max_retries):
+    if retry_budget is not None:
+        retry_budget.record_call()
+    timing: HostTiming | None = getattr(_host_timing, 'current', None)
+    command_name = _command_name(command)
+    command_action = command_name.rsplit('/', 1)[-1]
+    if timing is not None and timing.command_timeout is not None:
+        slow = command_action in _SLOW_COMMANDS
+        _set_command_timeout(api, timing.slow_timeout if slow else timing.command_timeout)
+    attempt = 0
+    while True:
         try:
-            if params is not None:
-                return list(api(command, **params))
-            return list(api(command))
+            with tracer.span('attempt', command=command_name, attempt=attempt + 1):
+                started = time.perf_counter()
+                if params is not None:
+                    response = list(api(command, **params))
+                else:
+                    response = list(api(command))
+                if timing is not None and command_action == 'print':
+                    timing.command_rtts.append(time.perf_counter() - started)
+                return response
         except (TimeoutError, socket.error, librouteros.exceptions.LibRouterosError) as e:
-            last_exception = e
-            logger.warning(f"Attempt {attempt + 1} failed: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                continue
-            if last_exception:
-                raise last_exception
-        except librouteros.exceptions.TrapError as e:
-            cmd_str: Any = command[0] if isinstance(command, tuple) else command
-            is_cloud_command = isinstance(cmd_str, str) and 'cloud' in cmd_str
+            error_class = _retry_class(command, e)
+            if error_class is None:
+                raise
+            policy = retry_policies[error_class]
+            attempts_allowed = max_retries if max_retries is not None else policy.max_retries
+            if error_class == 'cloud':
+                logger.warning(f"Attempt {attempt + 1} failed for cloud command '{_command_name(command)}' due to transient TrapError: {e}")
+            else:
+                logger.warning(f"Attempt {attempt + 1} failed: {e}")
+            if attempt >= attempts_allowed - 1:
+                raise
+            if retry_budget is not None and not retry_budget.try_acquire():
+                logger.warning(f"Retry budget exhausted, not retrying '{_command_name(command)}'")
+                raise
+            delay = retry_delay if retry_delay is not None else policy.delay(attempt)
+            with tracer.span('retry_sleep', delay=round(delay, 3), error_class=error_class):
+                time.sleep(delay)
+            attempt += 1
 
-            msg = getattr(e, 'message', '') or str(e)
-            msg_lower = msg.lower()
-            is_transient = any(term in msg_lower for term in ['connection', 'timeout', 'connect', 'resolve'])
-
-            if is_cloud_command and is_transient:
-                last_exception = e
-                logger.warning(f"Attempt {attempt + 1} failed for cloud command '{cmd_str}' due to transient TrapError: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
-            raise e
-    return None
+
+# Bit flags in the last field of a host tuple; HOST_SSL alone equals the old use_ssl=True
+HOST_SSL = 1
+HOST_REST = 2
+_HOST_FLAG_WORDS = {'SSL': HOST_SSL, 'REST': HOST_REST}
+_REST_PORT = 80
+_REST_SSL_PORT = 443
+
+
+def _host_flags_suffix(flags: int) -> str:
+    return ('|REST' if flags & HOST_REST else '') + ('|SSL' if flags & HOST_SSL else '')
 
 
 def parse_host_line(
     line: str,
     default_api_port: int,
     default_ssl_port: int = 8729,
-) -> tuple[str, int, str | None, str | None, bool] | None:
+) -> tuple[str, int, str | None, str | None, int] | None:
     stripped_line = line.strip()
     try:
         parts = stripped_line.split('|')
-        use_ssl = False
-        if parts and parts[-1].strip().upper() == 'SSL':
-            use_ssl = True
-            parts = parts[:-1]
+        flags = 0
+        # Trailing "|SSL" and "|REST" flags, in any order. They follow the address or the user and
+        # password, so in "host|user|REST" the last field is the password.
+        trailing = 0
+        while trailing < len(parts) - 1 and parts[-1 - trailing].strip().upper() in _HOST_FLAG_WORDS:
+            trailing += 1
+        flag_count = next((n for n in range(trailing, -1, -1) if len(parts) - n in (1, 3)), trailing)
+        for word in parts[len(parts) - flag_count:]:
+            flags |= _HOST_FLAG_WORDS[word.strip().upper()]
+        parts = parts[:len(parts) - flag_count]
+        use_ssl = bool(flags & HOST_SSL)
 
         ip_port_str = parts[0]
         if not ip_port_str:
             raise ValueError("IP/Port part is empty")
 
-        ip_port_parts = ip_port_str.split(':')
+        if ip_port_str.startswith('['):
+            # IPv6 goes in brackets, "[2001:db8::1]:8729", so its colons are not taken for the port
+            ip, bracket, rest = ip_port_str[1:].partition(']')
+            if not bracket or (rest and not rest.startswith(':')):
+                raise ValueError("expected '[IPv6]' or '[IPv6]:port'")
+            ip_port_parts = [ip] + ([rest[1:]] if rest else [])
+        else:
+            ip_port_parts = ip_port_str.split(':')
+            if len(ip_port_parts) > 2:
+                raise ValueError("IPv6 addresses must be in brackets, e.g. '[2001:db8::1]:8728'")
         ip = ip_port_parts[0]
         if not ip:
             raise ValueError("IP address cannot be empty")
@@ -205,7 +697,10 @@ def parse_host_line(
         if has_custom_port:
             port_str = ip_port_parts[1]
         else:
-            port_str = str(default_ssl_port) if use_ssl else str(default_api_port)
+            if flags & HOST_REST:
+                port_str = str(_REST_SSL_PORT if use_ssl else _REST_PORT)
+            else:
+                port_str = str(default_ssl_port) if use_ssl else str(default_api_port)
         port = int(port_str)
         if not (1 <= port <= 65535):
             raise ValueError(f"Port number {port} out of range (1-65535)")
@@ -213,7 +708,7 @@ def parse_host_line(
         username = parts[1] if len(parts) > 1 else None
         password = parts[2] if len(parts) > 2 else None
 
-        return ip, port, username, password, use_ssl
+        return ip, port, username, password, flags
     except ValueError as e:
         logger.warning(f"Skipping malformed line in IP list: '{stripped_line}'. Error: {e}")
         return None
@@ -222,21 +717,254 @@ def parse_host_line(
         return None
 
 
+def _format_endpoint(address: str, port: int) -> str:
+    return f"[{address}]:{port}" if ':' in address else f"{address}:{port}"
+
+
+def _target_range(address: str) -> tuple[type, range] | None:
+    # "10.20.0.0/16" or "10.1.1.10-10.1.1.200" ("10.1.1.10-200" for short) as a lazy range of
+    # integer addresses; None for a single host. Hostnames may contain dashes.
+    if '/' in address:
+        network = ipaddress.ip_network(address, strict=False)
+        first, last = int(network.network_address), int(network.broadcast_address)
+        if network.num_addresses > 2:
+            # Same addresses as network.hosts(): no network/broadcast (v4), no subnet-router anycast (v6)
+            first += 1
+            if network.version == 4:
+                last -= 1
+        return type(network.network_address), range(first, last + 1)
+    start, sep, end = address.partition('-')
+    if not sep:
+        return None
+    try:
+        first_address = ipaddress.ip_address(start)
+    except ValueError:
+        return None
+    if first_address.version == 4 and end.isdigit():
+        end = f"{start.rsplit('.', 1)[0]}.{end}"
+    last_address = ipaddress.ip_address(end)
+    if last_address.version != first_address.version or last_address < first_address:
+        raise ValueError(f"invalid address range '{address}'")
+    return type(first_address), range(int(first_address), int(last_address) + 1)
+
+
+def _expand_target(
+    host_info: tuple[str, int, str | None, str | None, int],
+    addresses: tuple[type, range],
+) -> Iterator[tuple[str, int, str | None, str | None, int]]:
+    _, port, username, password, flags = host_info
+    address_type, numbers = addresses
+    for number in numbers:
+        yield str(address_type(number)), port, username, password, flags
+
+
+_CONNECT_IN_PROGRESS = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN}
+
+
+def _probe_api_ports(
+    candidates: Iterable[tuple[str, int, str | None, str | None, int]],
+    concurrency: int,
+    timeout: float,
+    stop_event: threading.Event | None = None,
+) -> Iterator[tuple[tuple[str, int, str | None, str | None, int], bool]]:
+    # Non-blocking TCP connects to the API port, at most `concurrency` in flight. Candidates are
+    # pulled lazily and every one is yielded back with whether its port accepted the connection.
+    selector = selectors.DefaultSelector()
+    pending: dict[socket.socket, tuple[Any, float]] = {}
+    candidates = iter(candidates)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency and not (stop_event and stop_event.is_set()):
+                host_info = next(candidates, None)
+                if host_info is None:
+                    exhausted = True
+                    break
+                address, port = host_info[0], host_info[1]
+                family = socket.AF_INET6 if ':' in address else socket.AF_INET
+                sock = None
+                try:
+                    sock = socket.socket(family, socket.SOCK_STREAM)
+                    sock.setblocking(False)
+                    connected = sock.connect_ex((address, port))
+                except OSError:
+                    # Out of file descriptors or an unusable address: count the port as closed
+                    connected = None
+                if connected not in _CONNECT_IN_PROGRESS:
+                    if sock is not None:
+                        sock.close()
+                    yield host_info, False
+                    continue
+                # Same timeout for every probe, so insertion order is deadline order
+                pending[sock] = (host_info, time.monotonic() + timeout)
+                selector.register(sock, selectors.EVENT_WRITE)
+            if not pending:
+                return
+
+            oldest_deadline = next(iter(pending.values()))[1]
+            for key, _ in selector.select(max(0.0, oldest_deadline - time.monotonic())):
+                sock = key.fileobj
+                host_info, _ = pending.pop(sock)
+                selector.unregister(sock)
+                responsive = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+                sock.close()
+                yield host_info, responsive
+
+            now = time.monotonic()
+            while pending:
+                sock, (host_info, deadline) = next(iter(pending.items()))
+                if deadline > now:
+                    break
+                del pending[sock]
+                selector.unregister(sock)
+                sock.close()
+                yield host_info, False
+    finally:
+        for sock in pending:
+            sock.close()
+        selector.close()
+
+
+# Seconds a failed lookup is remembered, so hosts that do not resolve are not retried by every attempt
+_DNS_NEGATIVE_TTL = 30.0
+
+
+class DnsCache:
+    # Hostname -> address cache shared by all workers and retries. The system resolver does not
+    # report record TTLs, so entries live for a fixed `ttl`. IP literals are never looked up.
+    def __init__(self, ttl: float, negative_ttl: float = _DNS_NEGATIVE_TTL) -> None:
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._entries: dict[str, tuple[float, str | OSError]] = {}
+
+    @staticmethod
+    def needs_lookup(host: str) -> bool:
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            return True
+        return False
+
+    def cached(self, host: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(host)
+        if entry is None or entry[0] < time.monotonic() or isinstance(entry[1], OSError):
+            return None
+        return entry[1]
+
+    def _store(self, host: str, result: str | OSError) -> None:
+        ttl = self.negative_ttl if isinstance(result, OSError) else self.ttl
+        with self._lock:
+            self._entries[host] = (time.monotonic() + ttl, result)
+
+    def resolve(self, host: str, port: int) -> str:
+        # Blocking lookup on a cache miss; a cached failure is raised again until it expires
+        if not self.needs_lookup(host):
+            return host
+        with self._lock:
+            entry = self._entries.get(host)
+        if entry is None or entry[0] < time.monotonic():
+            try:
+                infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+                self._store(host, infos[0][4][0])
+            except OSError as e:
+                self._store(host, e)
+            with self._lock:
+                entry = self._entries[host]
+        if isinstance(entry[1], OSError):
+            raise entry[1]
+        return entry[1]
+
+    def prefetch(self, hosts: Iterable[tuple[str, int]], concurrency: int) -> int:
+        # Resolves every uncached hostname concurrently; returns how many lookups failed
+        pending = {host: port for host, port in hosts if self.needs_lookup(host) and self.cached(host) is None}
+        if not pending:
+            return 0
+        return asyncio.run(self._prefetch(pending, concurrency))
+
+    async def _prefetch(self, pending: dict[str, int], concurrency: int) -> int:
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def lookup(host: str, port: int) -> bool:
+            async with semaphore:
+                try:
+                    infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+                except OSError as e:
+                    self._store(host, e)
+                    return False
+            self._store(host, infos[0][4][0])
+            return True
+
+        results = await asyncio.gather(*(lookup(host, port) for host, port in pending.items()))
+        return results.count(False)
+
+
+dns_cache: DnsCache | None = None
+
+
+def _setup_dns_cache(ttl: float) -> DnsCache | None:
+    global dns_cache
+    dns_cache = DnsCache(ttl) if ttl > 0 else None
+    return dns_cache
+
+
+def _credential_id(key: bytes, username: str, password: str | None) -> str:
+    # Identifies a credential set in the state cache without storing the password. The key is
+    # random per state file, so the ids cannot be checked against a precomputed password list.
+    return hmac.new(key, f"{username}\0{password or ''}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+# Login method for librouteros.connect that tries credential sets in order on the same connection.
+# `index` points at the set being tried, so it survives a reconnect.
+class CredentialChain:
+    def __init__(self, credentials: list[tuple[str, str | None]]) -> None:
+        self.credentials = credentials
+        self.index = 0
+        self.failures = 0
+        self.tried_on_connection = 0
+        self.succeeded = False
+
+    @property
+    def used(self) -> tuple[str, str | None] | None:
+        return self.credentials[self.index] if self.succeeded else None
+
+    def __call__(self, api: librouteros.Connection, username: str, password: str) -> None:
+        self.tried_on_connection = 0
+        last_error: librouteros.exceptions.TrapError | None = None
+        while self.index < len(self.credentials):
+            chain_username, chain_password = self.credentials[self.index]
+            self.tried_on_connection += 1
+            try:
+                plain_login(api, chain_username, chain_password or '')
+                self.succeeded = True
+                return
+            except librouteros.exceptions.TrapError as e:
+                self.failures += 1
+                self.index += 1
+                last_error = e
+        raise last_error or librouteros.exceptions.TrapError("no credential sets left to try")
+
+
 def _connect_to_router(
-    host_info: tuple[str, int, str | None, str | None, bool],
+    host_info: tuple[str, int, str | None, str | None, int],
     default_username: str,
     default_password: str,
     timeout: int,
     global_ssl: bool = False,
+    login: CredentialChain | None = None,
+    exact_timeout: bool = False,
 ) -> librouteros.Connection:
-    IP, port, custom_username, custom_password, use_ssl = host_info
-    use_ssl = use_ssl or global_ssl
+    IP, port, custom_username, custom_password, flags = host_info
+    use_ssl = bool(flags & HOST_SSL) or global_ssl
+    use_rest = bool(flags & HOST_REST)
     username = custom_username or default_username
     password = custom_password or default_password
-    effective_timeout = max(30, timeout)
+    effective_timeout = timeout if exact_timeout else max(30, timeout)
 
     connect_kwargs: dict[str, Any] = dict(
-        host=IP,
+        host=dns_cache.resolve(IP, port) if dns_cache else IP,
         username=username,
         password=password,
         port=int(port),
@@ -248,9 +976,237 @@ def _connect_to_router(
         ssl_context.check_hostname = False
         ssl_context.verify_mode = ssl.CERT_NONE
         ssl_context.set_ciphers('ALL:@SECLEVEL=0')
-        connect_kwargs['ssl_wrapper'] = ssl_context.wrap_socket
+        if use_rest:
+            connect_kwargs['ssl_context'] = ssl_context
+        else:
+            connect_kwargs['ssl_wrapper'] = ssl_context.wrap_socket
+
+    if login is None:
+        return _open_connection(connect_kwargs, use_ssl, use_rest)
+    if not login.credentials:
+        raise librouteros.exceptions.TrapError("no credential sets left to try (recent login failures)")
+    connect_kwargs['login_method'] = login
+    while True:
+        try:
+            return _open_connection(connect_kwargs, use_ssl, use_rest)
+        except (librouteros.exceptions.ConnectionClosed, librouteros.exceptions.FatalError, OSError):
+            # The router may drop the connection after a failed login; the rest of the chain
+            # continues on a new one. Each reconnect follows at least one failed set.
+            if login.tried_on_connection < 2:
+                raise
+            login.tried_on_connection = 0
+            logger.debug(f"{IP}: connection closed after a failed login, reconnecting for the next credential set")
+
+
+def _open_connection(connect_kwargs: dict[str, Any], use_ssl: bool, use_rest: bool = False) -> librouteros.Connection:
+    connect = _rest_connect if use_rest else librouteros.connect
+    if recorder is None:
+        return connect(**connect_kwargs)
+
+    transcript = recorder.open(connect_kwargs['host'], connect_kwargs['port'], use_ssl)
+    try:
+        return connect(**connect_kwargs, subclass=recorder.api_factory(transcript))
+    except Exception as e:
+        transcript.error(e)
+        transcript.close()
+        raise
+
+
+_REST_IDLE_PER_HOST = 2
+
+
+# Idle keep-alive HTTP connections per router, so that a reconnect to the same router (after a
+# reboot, a host retry or in the next rollout phase) skips the TCP and TLS handshakes.
+class RestSessionPool:
+    def __init__(self, idle_per_host: int = _REST_IDLE_PER_HOST) -> None:
+        self.idle_per_host = idle_per_host
+        self._idle: dict[tuple[str, int, bool], list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple[str, int, bool]) -> http.client.HTTPConnection | None:
+        with self._lock:
+            idle = self._idle.get(key)
+            return idle.pop() if idle else None
+
+    def put(self, key: tuple[str, int, bool], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+rest_sessions = RestSessionPool()
+
+
+def _rest_words(row: dict[str, Any]) -> tuple[str, ...]:
+    # REST returns every value as a string; API words let librouteros cast them as usual
+    words = []
+    for key, value in row.items():
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, list):
+            value = ','.join(str(v) for v in value)
+        words.append(f"={key}={value}")
+    return tuple(words)
+
+
+# Transport for the RouterOS v7 REST API under librouteros' Api: every command sentence becomes one
+# POST /rest/<command> on a keep-alive connection and the JSON reply is turned back into
+# !re/!trap/!done sentences, so paths, queries, traps and retries behave as over the binary API.
+class RestProtocol:
+    # No streaming replies: follow prints fall back to polling
+    streaming = False
 
-    return librouteros.connect(**connect_kwargs)
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        timeout: float,
+        ssl_context: ssl.SSLContext | None = None,
+        pool: RestSessionPool | None = None,
+    ) -> None:
+        self.pool = pool if pool is not None else rest_sessions
+        self.key = (host, port, ssl_context is not None)
+        conn = self.pool.get(self.key)
+        self.reused = conn is not None
+        if conn is None:
+            if ssl_context is not None:
+                conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=ssl_context)
+            else:
+                conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.conn = conn
+        self.settimeout(timeout)
+        self.authorization = ''
+        self.broken = False
+        self._replies: collections.deque[tuple[str, tuple[str, ...]]] = collections.deque()
+
+    def settimeout(self, timeout: float | None) -> None:
+        self.conn.timeout = timeout
+        if self.conn.sock is not None:
+            self.conn.sock.settimeout(timeout)
+
+    def writeSentence(self, cmd: str, *words: str) -> None:  # noqa N802
+        body: dict[str, Any] = {}
+        query: list[str] = []
+        for word in words:
+            if word.startswith('?'):
+                # "?=name=x" and "?#!" become the REST query words "name=x" and "#!"
+                query.append(word[2:] if word.startswith('?=') else word[1:])
+            elif word.startswith('='):
+                key, _, value = word[1:].partition('=')
+                body[key] = value.split(',') if key == '.proplist' else value
+        if query:
+            body['.query'] = query
+        if cmd == '/login':
+            # REST authenticates every request; check the credentials with a cheap read
+            credentials = f"{body.get('name', '')}:{body.get('password', '')}".encode('utf-8')
+            self.authorization = 'Basic ' + base64.b64encode(credentials).decode('ascii')
+            cmd, body = '/system/identity/print', {'.proplist': ['name']}
+            status, reply = self._post(cmd, body)
+            if status == 200:
+                self._replies.append(('!done', ()))
+                return
+        else:
+            status, reply = self._post(cmd, body)
+
+        if status == 401:
+            self._replies.append(('!trap', ('=message=invalid user name or password (REST 401)',)))
+        elif status >= 400:
+            detail = reply.get('detail') or reply.get('message') if isinstance(reply, dict) else None
+            self._replies.append(('!trap', (f"=message={detail or f'HTTP {status}'}",)))
+        else:
+            rows = reply if isinstance(reply, list) else [reply] if reply else []
+            self._replies.extend(('!re', _rest_words(row)) for row in rows)
+        self._replies.append(('!done', ()))
+
+    def _post(self, cmd: str, body: dict[str, Any]) -> tuple[int, Any]:
+        data = json.dumps(body).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'Authorization': self.authorization}
+        while True:
+            try:
+                self.conn.request('POST', '/rest' + cmd, body=data, headers=headers)
+                response = self.conn.getresponse()
+                payload = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.conn.close()
+                if not self.reused:
+                    self.broken = True
+                    raise
+                # The router closed the pooled connection while it was idle: retry once on a new one
+                self.reused = False
+            except (http.client.HTTPException, OSError) as e:
+                self.conn.close()
+                self.broken = True
+                if isinstance(e, OSError):
+                    raise
+                raise librouteros.exceptions.ConnectionClosed(f"REST: {type(e).__name__}: {e}") from e
+        self.reused = False
+        try:
+            reply = json.loads(payload) if payload.strip() else None
+        except ValueError:
+            reply = None
+        return response.status, reply
+
+    def readSentence(self) -> tuple[str, tuple[str, ...]]:  # noqa N802
+        if not self._replies:
+            raise librouteros.exceptions.ConnectionClosed("REST: no pending reply")
+        return self._replies.popleft()
+
+    def close(self) -> None:
+        if self.broken or self.conn.sock is None:
+            self.conn.close()
+        else:
+            self.pool.put(self.key, self.conn)
+
+
+def _rest_connect(
+    host: str,
+    username: str,
+    password: str,
+    timeout: float,
+    port: int = _REST_PORT,
+    ssl_context: ssl.SSLContext | None = None,
+    subclass: Any = librouteros.api.Api,
+    login_method: Any = plain_login,
+) -> librouteros.Connection:
+    # Same signature and login flow as librouteros.connect, over RestProtocol
+    protocol = RestProtocol(host, port, timeout, ssl_context)
+    api = subclass(protocol)
+    try:
+        login_method(api, username, password)
+    except Exception:
+        protocol.close()
+        raise
+    return api
+
+
+def _set_command_timeout(api: Any, timeout: float) -> None:
+    if isinstance(api, librouteros.api.Path):
+        api = api.api
+    protocol = api.protocol
+    if isinstance(protocol, _RecordingProtocol):
+        protocol = protocol.inner
+    if isinstance(protocol, RestProtocol):
+        protocol.settimeout(timeout)
+    else:
+        protocol.transport.sock.settimeout(timeout)
+
+
+_SENSITIVE_KEY_RE = re.compile(r'\b(pass(?:word|phrase)?|pwd|secret)\b')
+
+
+def _is_sensitive_key(key: str) -> bool:
+    return bool(_SENSITIVE_KEY_RE.search(key.lower()))
 
 
 def _sanitize_command_item(command_item: str | tuple[str, dict[str, Any]]) -> str | tuple[str, dict[str, Any]]:
@@ -259,7 +1215,7 @@ def _sanitize_command_item(command_item: str | tuple[str, dict[str, Any]]) -> st
         if isinstance(params, dict):
             sanitized_params: dict[str, Any] = {}
             for k, v in params.items():
-                if re.search(r'\b(pass(?:word|phrase)?|pwd|secret)\b', k.lower()):
+                if _is_sensitive_key(k):
                     sanitized_params[k] = '********'
                 else:
                     sanitized_params[k] = v
@@ -267,6 +1223,102 @@ def _sanitize_command_item(command_item: str | tuple[str, dict[str, Any]]) -> st
     return command_item
 
 
+def _sanitize_api_word(word: str) -> str:
+    # Attribute words look like "=key=value", queries like "?key=value" or "?=key=value"
+    if word[:1] not in ('=', '?'):
+        return word
+    prefix = word[0] + ('=' if word[1:2] == '=' else '')
+    key, sep, _ = word[len(prefix):].partition('=')
+    if sep and _is_sensitive_key(key):
+        return f"{prefix}{key}=********"
+    return word
+
+
+class _Transcript:
+    def __init__(self, path: str, mode: str, header: dict[str, Any]) -> None:
+        self._file = open(path, mode, encoding='utf-8')
+        self._origin = time.perf_counter()
+        self._write(dict(header, connect=time.time()))
+
+    def _write(self, record: dict[str, Any]) -> None:
+        self._file.write(json.dumps(record) + "\n")
+
+    def sentence(self, direction: str, words: list[str]) -> None:
+        self._write({
+            't': round(time.perf_counter() - self._origin, 6),
+            'dir': direction,
+            'words': [_sanitize_api_word(w) for w in words],
+        })
+
+    def error(self, exc: BaseException) -> None:
+        self._write({'t': round(time.perf_counter() - self._origin, 6), 'dir': 'error', 'error': type(exc).__name__})
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+class _RecordingProtocol:
+    def __init__(self, inner: Any, transcript: _Transcript) -> None:
+        self.inner = inner
+        self.transcript = transcript
+
+    def writeSentence(self, cmd: str, *words: str) -> None:  # noqa N802
+        self.transcript.sentence('out', [cmd, *words])
+        self.inner.writeSentence(cmd, *words)
+
+    def readSentence(self) -> tuple[str, tuple[str, ...]]:  # noqa N802
+        try:
+            reply_word, words = self.inner.readSentence()
+        except Exception as e:
+            self.transcript.error(e)
+            raise
+        self.transcript.sentence('in', [reply_word, *words])
+        return reply_word, words
+
+    def close(self) -> None:
+        try:
+            self.inner.close()
+        finally:
+            self.transcript.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+
+# Writes one JSON-lines transcript per host with every API sentence and its timing.
+# Sensitive attribute values are masked with the same rule as _sanitize_command_item.
+class SessionRecorder:
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._opened: set[str] = set()
+        self._lock = threading.Lock()
+
+    def open(self, host: str, port: int, use_ssl: bool) -> _Transcript:
+        name = f"{re.sub(r'[^A-Za-z0-9.-]', '_', host)}_{port}.jsonl"
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            mode = 'a' if path in self._opened else 'w'
+            self._opened.add(path)
+        return _Transcript(path, mode, {'host': host, 'port': port, 'ssl': use_ssl})
+
+    def api_factory(self, transcript: _Transcript) -> Any:
+        def _make_api(protocol: Any) -> librouteros.api.Api:
+            return librouteros.api.Api(protocol=_RecordingProtocol(protocol, transcript))
+        return _make_api
+
+
+recorder: SessionRecorder | None = None
+
+
+def _setup_recorder(record_dir: str | None) -> SessionRecorder | None:
+    global recorder
+    recorder = SessionRecorder(record_dir) if record_dir else None
+    return recorder
+
+
 def _execute_router_command(
     api: librouteros.Connection,
     command_item: str | tuple[str, dict[str, Any]],
@@ -280,53 +1332,249 @@ def _execute_router_command(
             response = execute_with_retry(api, command_item)
         return response
     except (TimeoutError, socket.error) as e:
+        _command_errors.last = e
         sanitized_item = _sanitize_command_item(command_item)
         entry_lines.append(f"  Error executing command {sanitized_item}: TimeoutError after retries\n")
     except Exception as e:
+        _command_errors.last = e
         sanitized_item = _sanitize_command_item(command_item)
         entry_lines.append(f"  Error executing command {sanitized_item}: {type(e).__name__}: {e}\n")
     return None
 
 
-def _process_identity(response: list[dict[str, Any]], entry_lines: list[str]) -> None:
+def _state_value(value: Any) -> str:
+    # RouterOS reports booleans as true/false or yes/no, and librouteros turns both into bool
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    text = str(value)
+    return {'yes': 'true', 'no': 'false'}.get(text, text)
+
+
+# A desired-state entry of the custom commands file: the item in `menu` identified by the `match`
+# keys should exist with these values (ensure: present) or not exist at all (ensure: absent).
+class DesiredState:
+    def __init__(
+        self,
+        menu: str,
+        match: list[str],
+        item: dict[str, Any],
+        ensure: str = 'present',
+        write_only: list[str] | None = None,
+    ) -> None:
+        if not menu.startswith('/'):
+            raise ValueError(f"menu must be an API path such as /user, got '{menu}'")
+        if not match or any(key not in item for key in match):
+            raise ValueError(f"{menu}: every match key must be set in item")
+        if ensure not in ('present', 'absent'):
+            raise ValueError(f"{menu}: ensure must be 'present' or 'absent', got '{ensure}'")
+        self.menu = menu.rstrip('/')
+        self.match = list(match)
+        self.item = dict(item)
+        self.ensure = ensure
+        # Values the router never prints back (passwords) are only sent when the item is added
+        self.write_only = set(write_only or ()) | {key for key in item if _is_sensitive_key(key)}
+
+    @classmethod
+    def from_yaml(cls, entry: dict[str, Any]) -> DesiredState:
+        match = entry.get('match', [])
+        return cls(
+            entry['menu'], [match] if isinstance(match, str) else match, entry.get('item') or {},
+            entry.get('ensure', 'present'), entry.get('write_only'),
+        )
+
+    def describe(self) -> str:
+        return f"{self.menu} " + " ".join(f"{key}={self.item[key]}" for key in self.match)
+
+
+def _apply_desired_state(
+    api: librouteros.Connection,
+    state: DesiredState,
+    menu_rows: dict[str, list[dict[str, Any]]],
+    entry_lines: list[str],
+    dry_run: bool = False,
+) -> bool:
+    # Each menu is printed once per host; later entries for the same menu use the cached rows,
+    # which are kept in step with the changes sent.
+    rows = menu_rows.get(state.menu)
+    if rows is None:
+        rows = _execute_router_command(api, f"{state.menu}/print", entry_lines)
+        if rows is None:
+            return False
+        menu_rows[state.menu] = rows
+
+    wanted = {key: _state_value(state.item[key]) for key in state.match}
+    matching = [row for row in rows if all(_state_value(row.get(key)) == value for key, value in wanted.items())]
+    action = None
+
+    if state.ensure == 'absent':
+        for row in matching:
+            if not dry_run and _execute_router_command(api, (f"{state.menu}/remove", {'.id': row['.id']}), entry_lines) is None:
+                return False
+            rows.remove(row)
+        if matching:
+            action = f"remove {len(matching)}"
+    elif not matching:
+        added = {key: value for key, value in state.item.items() if key not in state.write_only}
+        if not dry_run:
+            response = _execute_router_command(api, (f"{state.menu}/add", dict(state.item)), entry_lines)
+            if response is None:
+                return False
+            if response and 'ret' in response[0]:
+                added['.id'] = response[0]['ret']
+        rows.append(added)
+        action = "add"
+    else:
+        changed: set[str] = set()
+        for row in matching:
+            changes = {
+                key: value for key, value in state.item.items()
+                if key not in state.match and key not in state.write_only and _state_value(row.get(key)) != _state_value(value)
+            }
+            if not changes:
+                continue
+            if not dry_run and '.id' in row:
+                if _execute_router_command(api, (f"{state.menu}/set", {'.id': row['.id'], **changes}), entry_lines) is None:
+                    return False
+            row.update(changes)
+            changed.update(changes)
+        if changed:
+            action = f"set {', '.join(sorted(changed))}"
+
+    if action is None:
+        entry_lines.append(f"  Desired {state.describe()}: in sync\n")
+    else:
+        entry_lines.append(f"  Desired {state.describe()}: {'would ' if dry_run else ''}{action}\n")
+    return True
+
+
+def _process_identity(response: list[dict[str, Any]], entry_lines: list[str], facts: dict[str, Any] | None = None) -> None:
     if response:
         for res in response:
             identity = res.get('name', 'N/A')
             entry_lines.append(f"  Identity: {identity}\n")
+            if facts is not None and 'name' in res:
+                facts['identity'] = res['name']
 
 
-def _process_routerboard(response: list[dict[str, Any]], entry_lines: list[str]) -> None:
+def _process_routerboard(response: list[dict[str, Any]], entry_lines: list[str], facts: dict[str, Any] | None = None) -> None:
     if response:
         for res in response:
             model_name = res.get('board-name', res.get('model', 'N/A'))
             entry_lines.append(f"  Model: {model_name}\n")
+            if facts is not None and model_name != 'N/A':
+                facts['model'] = model_name
 
 
-def _process_resource(response: list[dict[str, Any]], entry_lines: list[str]) -> None:
+def _process_resource(response: list[dict[str, Any]], entry_lines: list[str], facts: dict[str, Any] | None = None) -> None:
     if response:
         for res in response:
             version = res.get('version', 'N/A')
             if 'stable' in res.get('build-time', ''):
                 version = f"{version} (stable)"
             entry_lines.append(f"  Version: {version}\n")
+            if facts is not None and 'version' in res:
+                facts['version'], channel = _split_version(version)
+                if channel:
+                    facts['channel'] = channel
 
 
-def _check_and_process_updates(
+_FOLLOW_TAG = 'mkmassupdate-follow'
+
+
+def _read_tagged_sentence(api: librouteros.Connection) -> tuple[str, str | None, dict[str, Any]]:
+    # librouteros' Api.readSentence cannot parse ".tag=" words, so split them off here
+    reply_word, words = api.protocol.readSentence()
+    tag: str | None = None
+    attrs: dict[str, Any] = {}
+    for word in words:
+        if word.startswith('.tag='):
+            tag = word[5:]
+        elif word.startswith('='):
+            key, value = parse_word(word)
+            attrs[key] = value
+    return reply_word, tag, attrs
+
+
+def _wait_readable(sock: socket.socket, timeout: float) -> bool:
+    # TLS sockets can hold already decrypted bytes that select() does not see
+    pending = getattr(sock, 'pending', None)
+    if pending is not None and pending():
+        return True
+    with selectors.DefaultSelector() as selector:
+        selector.register(sock, selectors.EVENT_READ)
+        return bool(selector.select(timeout))
+
+
+def _follow_update_status(api: librouteros.Connection, wait_seconds: float) -> tuple[bool, list[dict[str, Any]] | None]:
+    # Subscribes to /system/package/update with a follow print and returns as soon as the
+    # status leaves "checking". Returns (supported, [final row] or None on timeout).
+    if not getattr(api.protocol, 'streaming', True):
+        return False, None
+    sock = api.protocol.transport.sock
+    original_timeout = sock.gettimeout()
+    deadline = time.monotonic() + wait_seconds
+    api.protocol.writeSentence('/system/package/update/print', '=follow=', f'.tag={_FOLLOW_TAG}')
+    result: dict[str, Any] | None = None
+    trap: dict[str, Any] | None = None
+    finished = False
+    desynced = False
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            # Only give up between sentences, so /cancel can be sent on an aligned stream
+            if remaining <= 0 or not _wait_readable(sock, remaining):
+                break
+            sock.settimeout(max(remaining, 1.0))
+            try:
+                reply_word, tag, attrs = _read_tagged_sentence(api)
+            except TimeoutError:
+                desynced = True
+                break
+            if tag != _FOLLOW_TAG:
+                continue
+            if reply_word == '!trap':
+                trap = attrs
+            elif reply_word == '!done':
+                finished = True
+                break
+            elif reply_word == '!re':
+                status = str(attrs.get('status', '')).lower()
+                with tracer.span('update_event', status=status):
+                    pass
+                if 'checking' not in status:
+                    result = attrs
+                    break
+    finally:
+        sock.settimeout(original_timeout)
+
+    if desynced:
+        # Part of a sentence was consumed; nothing read from this connection can be trusted now
+        api.close()
+        raise TimeoutError("update status follow timed out in the middle of a reply")
+    if not finished:
+        # Cancel the follow and drain its trailing "interrupted" trap and both !done replies
+        api.protocol.writeSentence('/cancel', f'=tag={_FOLLOW_TAG}', f'.tag={_FOLLOW_TAG}-cancel')
+        pending = {_FOLLOW_TAG, f'{_FOLLOW_TAG}-cancel'}
+        while pending:
+            reply_word, tag, _ = _read_tagged_sentence(api)
+            if reply_word == '!done':
+                pending.discard(tag or '')
+    if trap is not None and result is None:
+        return False, None
+    return True, [result] if result is not None else None
+
+
+def _poll_update_status(
     api: librouteros.Connection,
     entry_lines: list[str],
-    dry_run: bool,
     check_attempts: int,
     check_delay: float,
-) -> bool:
-    entry_lines.append("  Checking for updates...\n")
-    response = _execute_router_command(api, '/system/package/update/check-for-updates', entry_lines)
-    if response is None:
-        return False
-
+) -> list[dict[str, Any]] | None:
     check_complete = False
-    for _ in range(check_attempts):
+    for poll in range(check_attempts):
         time.sleep(check_delay)
-        status_response = _execute_router_command(api, '/system/package/update/print', entry_lines)
+        with tracer.span('update_poll', poll=poll + 1):
+            status_response = _execute_router_command(api, '/system/package/update/print', entry_lines)
         if status_response:
             status = status_response[0].get('status', '').lower()
             if 'checking' not in status:
@@ -334,15 +1582,59 @@ def _check_and_process_updates(
                 check_complete = True
                 break
         else:
-            return False
+            return None
 
     if not check_complete:
         entry_lines.append("  Timeout waiting for update check to complete.\n")
-        return False
+        return None
 
-    status_response = _execute_router_command(api, '/system/package/update/print', entry_lines)
+    return _execute_router_command(api, '/system/package/update/print', entry_lines)
+
+
+def _check_for_updates(
+    api: librouteros.Connection,
+    entry_lines: list[str],
+    check_attempts: int,
+    check_delay: float,
+    follow: bool = False,
+) -> tuple[list[dict[str, Any]], bool] | None:
+    # The final /system/package/update row(s) and whether they were followed rather than polled
+    entry_lines.append("  Checking for updates...\n")
+    response = _execute_router_command(api, '/system/package/update/check-for-updates', entry_lines)
+    if response is None:
+        return None
+
+    followed = False
+    if follow:
+        with tracer.span('update_follow'):
+            followed, status_response = _follow_update_status(api, check_attempts * check_delay)
+        if followed and status_response is None:
+            entry_lines.append("  Timeout waiting for update check to complete.\n")
+            return None
+        if followed:
+            entry_lines.append(f"  Status: {str(status_response[0].get('status', '')).lower()}\n")
+        else:
+            entry_lines.append("  Update status follow not supported, falling back to polling.\n")
+    if not followed:
+        status_response = _poll_update_status(api, entry_lines, check_attempts, check_delay)
     if not status_response:
+        return None
+    return status_response, followed
+
+
+def _check_and_process_updates(
+    api: librouteros.Connection,
+    entry_lines: list[str],
+    dry_run: bool,
+    check_attempts: int,
+    check_delay: float,
+    follow: bool = False,
+    facts: dict[str, Any] | None = None,
+) -> bool:
+    checked = _check_for_updates(api, entry_lines, check_attempts, check_delay, follow)
+    if checked is None:
         return False
+    status_response, followed = checked
 
     for res in status_response:
         installed_version = res.get('installed-version', '')
@@ -351,11 +1643,15 @@ def _check_and_process_updates(
         if latest_version and latest_version != installed_version:
             entry_lines.append(f"  Updates available: {installed_version} -> {latest_version}\n")
             if not dry_run:
-                time.sleep(2)
+                if not followed:
+                    time.sleep(2)
                 try:
                     update_package_path = api.path('system', 'package', 'update')
-                    execute_with_retry(update_package_path, 'install', max_retries=2)
+                    with _phase(None, 'install', version=latest_version):
+                        execute_with_retry(update_package_path, 'install', max_retries=2)
                     entry_lines.append("  Updates installed. Rebooting...\n")
+                    if facts is not None:
+                        facts['updated_to'] = latest_version
                     return True
                 except Exception as e:
                     entry_lines.append(f"  Error installing updates: {type(e).__name__}: {e}\n")
@@ -366,58 +1662,315 @@ def _check_and_process_updates(
     return False
 
 
+def _download_updates(
+    api: librouteros.Connection,
+    status_response: list[dict[str, Any]],
+    entry_lines: list[str],
+    dry_run: bool,
+    check_attempts: int,
+    check_delay: float,
+) -> tuple[bool, str | None]:
+    # Downloads the new packages without installing them; they are installed on the next reboot.
+    # Returns whether the step succeeded and the version now staged (None if nothing was staged).
+    res = status_response[0]
+    installed_version = res.get('installed-version', '')
+    latest_version = res.get('latest-version', '')
+    if not latest_version or latest_version == installed_version:
+        return True, None
+
+    entry_lines.append(f"  Updates available: {installed_version} -> {latest_version}\n")
+    if dry_run:
+        entry_lines.append("  Dry-run: Skipping download of updates.\n")
+        return True, None
+
+    try:
+        update_package_path = api.path('system', 'package', 'update')
+        with _phase(None, 'download', version=latest_version):
+            execute_with_retry(update_package_path, 'download', max_retries=2)
+    except Exception as e:
+        entry_lines.append(f"  Error downloading updates: {type(e).__name__}: {e}\n")
+        return False, None
+
+    for attempt in range(check_attempts):
+        status_response = _execute_router_command(api, '/system/package/update/print', entry_lines)
+        if status_response is None:
+            return False, None
+        status = str(status_response[0].get('status', '')).lower() if status_response else ''
+        if 'downloaded' in status:
+            entry_lines.append(f"  Updates downloaded: {latest_version} staged for the next reboot.\n")
+            return True, latest_version
+        if attempt + 1 < check_attempts:
+            time.sleep(check_delay)
+
+    entry_lines.append(f"  Timeout waiting for the download of {latest_version} to complete (status: {status}).\n")
+    return False, None
+
+
+def _reboot_staged(
+    api: librouteros.Connection,
+    staged_version: str | None,
+    staged_firmware: bool,
+    entry_lines: list[str],
+    dry_run: bool = False,
+) -> bool:
+    status_response = _execute_router_command(api, '/system/package/update/print', entry_lines)
+    if status_response is None:
+        return False
+    res = status_response[0] if status_response else {}
+    installed_version = res.get('installed-version', '')
+    status = str(res.get('status', '')).lower()
+
+    if staged_version and installed_version == staged_version and not staged_firmware:
+        entry_lines.append(f"  Already running staged version {staged_version}. No reboot needed.\n")
+        return True
+    if staged_version and installed_version != staged_version and 'downloaded' not in status:
+        entry_lines.append(f"  Staged packages for {staged_version} not found (status: {status}). Skipping reboot.\n")
+        return False
+
+    staged = ' and '.join(
+        ([f"RouterOS {staged_version}"] if staged_version and installed_version != staged_version else [])
+        + (['firmware'] if staged_firmware else [])
+    )
+    if dry_run:
+        entry_lines.append(f"  Dry-run: Would reboot to apply staged {staged}.\n")
+        return True
+    entry_lines.append(f"  Rebooting to apply staged {staged}...\n")
+    _reboot_router(api, entry_lines)
+    return True
+
+
+# Waits between cloud backup list polls after an upload, about 9 s in total
+_CLOUD_POLL_DELAYS = (0.2, 0.4, 0.8, 1.6, 2.0, 2.0, 2.0)
+_ROUTER_TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%b/%d/%Y %H:%M:%S')
+
+
+def _router_timestamp(text: str) -> float | None:
+    # RouterOS 7 prints "2024-01-02 10:00:00", RouterOS 6 "jan/02/2024 10:00:00". The result is
+    # only compared with other router times, so the router's time zone does not matter.
+    for fmt in _ROUTER_TIME_FORMATS:
+        try:
+            return float(calendar.timegm(time.strptime(text.strip(), fmt)))
+        except ValueError:
+            continue
+    return None
+
+
+def _cloud_backup_age(
+    api: librouteros.Connection,
+    backups: list[dict[str, Any]],
+    entry_lines: list[str],
+) -> float | None:
+    # Seconds since the newest backup was taken, by the router's own clock
+    taken = [t for t in (_router_timestamp(str(b.get('date', ''))) for b in backups) if t is not None]
+    if not taken:
+        return None
+    clock = _execute_router_command(api, '/system/clock/print', entry_lines)
+    if not clock:
+        return None
+    now = _router_timestamp(f"{clock[0].get('date', '')} {clock[0].get('time', '')}")
+    return None if now is None else max(0.0, now - max(taken))
+
+
 def _perform_cloud_backup(
     api: librouteros.Connection,
     cloud_password: str,
     entry_lines: list[str],
     dry_run: bool = False,
+    max_age: float = 0.0,
+    backed_up_at: float | None = None,
+    facts: dict[str, Any] | None = None,
 ) -> bool:
+    # With max_age (seconds), a backup younger than that is kept: first by the local record
+    # (backed_up_at, from --state-db), then by the date of the backup on the router.
+    # facts['cloud_backup_at'] is set to when the kept or new backup was taken.
+    if max_age and backed_up_at is not None and time.time() - backed_up_at < max_age:
+        entry_lines.append(f"  Cloud backup: Skipped, last backup taken {_format_duration(time.time() - backed_up_at)} ago.\n")
+        return True
     if dry_run:
         entry_lines.append("  Cloud backup: Dry-run — would create and upload backup.\n")
         return True
 
-    # Sleep 3s to let slow cloud connections stabilize before querying existing backups
-    time.sleep(3)
+    started = time.perf_counter()
     existing_backups = _execute_router_command(api, '/system/backup/cloud/print', entry_lines)
     if existing_backups is None:
         entry_lines.append("  Cloud backup: Failed to retrieve list of existing backups. Aborting.\n")
         return False
 
-    if existing_backups:
-        backup_ids = [backup['.id'] for backup in existing_backups if '.id' in backup]
-        if backup_ids:
-            all_removed_successfully = True
-            for backup_id in backup_ids:
-                remove_params = {'number': backup_id}
-                response_remove = _execute_router_command(api, ('/system/backup/cloud/remove-file', remove_params), entry_lines)
-                if response_remove is None:
-                    all_removed_successfully = False
-            if not all_removed_successfully:
-                return False
+    if max_age and existing_backups:
+        age = _cloud_backup_age(api, existing_backups, entry_lines)
+        if age is not None and age < max_age:
+            entry_lines.append(f"  Cloud backup: Skipped, the backup on the router is {_format_duration(age)} old.\n")
+            if facts is not None:
+                facts['cloud_backup_at'] = time.time() - age
+            return True
+
+    backup_ids = [str(backup['.id']) for backup in existing_backups if '.id' in backup]
+    if backup_ids:
+        remove_params = {'number': ','.join(backup_ids)}
+        if _execute_router_command(api, ('/system/backup/cloud/remove-file', remove_params), entry_lines) is None:
+            return False
 
     upload_params: dict[str, str] = {
         'action': 'create-and-upload',
         'password': cloud_password
     }
-    response_upload = _execute_router_command(api, ('/system/backup/cloud/upload-file', upload_params), entry_lines)
-    if response_upload is None:
-        entry_lines.append("  Cloud backup: Failed to create and upload new backup.\n")
+    response_upload = _execute_router_command(api, ('/system/backup/cloud/upload-file', upload_params), entry_lines)
+    if response_upload is None:
+        entry_lines.append("  Cloud backup: Failed to create and upload new backup.\n")
+        return False
+    if facts is not None:
+        facts['cloud_backup_at'] = time.time()
+
+    # The new backup can take a moment to be listed with its download key. Removed .ids can be
+    # reused, so the new backup is the one whose key was not listed before.
+    old_keys = {backup.get('secret-download-key') for backup in existing_backups}
+    latest_backup: dict[str, Any] | None = None
+    for delay in _CLOUD_POLL_DELAYS:
+        time.sleep(delay)
+        listed = _execute_router_command(api, '/system/backup/cloud/print', entry_lines)
+        if listed is None:
+            break
+        new_backups = [backup for backup in listed if backup.get('secret-download-key') not in old_keys]
+        if new_backups and new_backups[0].get('secret-download-key'):
+            latest_backup = new_backups[0]
+            break
+
+    entry_lines.append(f"  Cloud backup: Successfully created and uploaded new backup in {_format_duration(time.perf_counter() - started)}.\n")
+    if latest_backup is not None:
+        entry_lines.append(f"  Cloud backup: Secret Download Key: {latest_backup['secret-download-key']}\n")
+    else:
+        entry_lines.append("  Cloud backup: Could not find secret-download-key for the latest backup.\n")
+
+    return True
+
+
+_OFFLOAD_SCRIPT = "mkmassupdate_offload"
+_OFFLOAD_STATUS_RE = re.compile(r'^mkmassupdate (\S+ \S+) (\S+)(?: (.*))?$')
+
+_OFFLOAD_FIRMWARE_BLOCK = '''
+:do {
+  :if ([/system routerboard get current-firmware] != [/system routerboard get upgrade-firmware]) do={
+    /system routerboard upgrade
+    :set firmware true
+  }
+} on-error={}'''
+
+
+def _offload_script(check_attempts: int, check_delay: float, upgrade_firmware: bool) -> str:
+    # Same sequence as a normal run (firmware, update check, install), run by the router on its own.
+    # Progress is kept in the script's comment, which survives the reboot.
+    return f'''# Installed by mkmassupdate; progress is reported in this script's comment
+:local setStatus do={{ /system script set [find name="{_OFFLOAD_SCRIPT}"] comment=("mkmassupdate " . [/system clock get date] . " " . [/system clock get time] . " " . $1) }}
+:local firmware false{_OFFLOAD_FIRMWARE_BLOCK if upgrade_firmware else ''}
+$setStatus "checking"
+/system package update check-for-updates once
+:local tries 0
+:while (([/system package update get status] ~ "checking") && $tries < {check_attempts}) do={{
+  :delay {max(1, int(check_delay * 1000))}ms
+  :set tries ($tries + 1)
+}}
+:local status [/system package update get status]
+:local installed [/system package update get installed-version]
+:local latest [/system package update get latest-version]
+# A check that failed or is still running leaves latest-version empty or stale
+:if (!($status ~ "New version|up to date|Downloaded") || ($status ~ "checking")) do={{
+  $setStatus ("failed " . $status)
+}} else={{
+  :if ($latest != "" && $latest != $installed) do={{
+    $setStatus ("installing " . $installed . " " . $latest)
+    /system package update install
+  }} else={{
+    :if ($firmware) do={{
+      $setStatus ("firmware-reboot " . $installed)
+      /system reboot
+    }} else={{
+      $setStatus ("up-to-date " . $installed)
+    }}
+  }}
+}}
+'''
+
+
+def _find_offload_script(api: librouteros.Connection) -> dict[str, Any] | None:
+    id_key, name_key, comment_key = Key('.id'), Key('name'), Key('comment')
+    scripts = list(api.path('/system', 'script').select(id_key, comment_key).where(name_key == _OFFLOAD_SCRIPT))
+    return scripts[0] if scripts else None
+
+
+def _start_offload(
+    api: librouteros.Connection,
+    entry_lines: list[str],
+    dry_run: bool,
+    upgrade_firmware: bool,
+    check_attempts: int,
+    check_delay: float,
+) -> bool:
+    # Installs the offload script and starts it in the background, then returns right away
+    if dry_run:
+        entry_lines.append(f"  Offload: Dry-run: would install and start the '{_OFFLOAD_SCRIPT}' script.\n")
+        return True
+    existing = _find_offload_script(api)
+    if existing is not None:
+        if _execute_router_command(api, ('/system/script/remove', {'numbers': existing['.id']}), entry_lines) is None:
+            return False
+    add_params: dict[str, str] = {
+        'name': _OFFLOAD_SCRIPT,
+        'source': _offload_script(check_attempts, check_delay, upgrade_firmware),
+        'policy': 'read,write,policy,reboot,test',
+        'comment': f"mkmassupdate {time.strftime('%Y-%m-%d %H:%M:%S')} queued",
+    }
+    if _execute_router_command(api, ('/system/script/add', add_params), entry_lines) is None:
+        entry_lines.append("  Offload: Failed to install the offload script.\n")
+        return False
+    started = _execute_router_command(api, ('/execute', {'script': f"/system script run {_OFFLOAD_SCRIPT}"}), entry_lines)
+    if started is None:
+        entry_lines.append("  Offload: Failed to start the offload script.\n")
         return False
+    entry_lines.append("  Offload: Update job started on the router. Collect the outcome later with --collect.\n")
+    return True
 
-    entry_lines.append("  Cloud backup: Successfully created and uploaded new backup.\n")
-    time.sleep(2)
-    latest_backups = _execute_router_command(api, '/system/backup/cloud/print', entry_lines)
 
-    if latest_backups:
-        latest_backup = latest_backups[0]
-        secret_key = latest_backup.get('secret-download-key')
-        if secret_key:
-            entry_lines.append(f"  Cloud backup: Secret Download Key: {secret_key}\n")
-        else:
-            entry_lines.append("  Cloud backup: Could not find secret-download-key for the latest backup.\n")
+def _collect_offload(
+    api: librouteros.Connection,
+    entry_lines: list[str],
+    dry_run: bool,
+    facts: dict[str, Any] | None = None,
+) -> bool:
+    script = _find_offload_script(api)
+    if script is None:
+        entry_lines.append("  Offload: No offload job found on this router.\n")
+        return False
+    match = _OFFLOAD_STATUS_RE.match(str(script.get('comment', '')))
+    if not match:
+        entry_lines.append(f"  Offload: Unrecognized job status '{script.get('comment', '')}'.\n")
+        return False
+    when, state, detail = match.groups()
+    status_response = _execute_router_command(api, '/system/package/update/print', entry_lines)
+    if not status_response:
+        return False
+    installed_version = status_response[0].get('installed-version', '')
+
+    if state == 'installing':
+        from_version, _, to_version = (detail or '').partition(' ')
+        if installed_version != to_version:
+            entry_lines.append(f"  Offload: Install of {to_version} not applied, still running {installed_version} (since {when}).\n")
+            return False
+        entry_lines.append(f"  Offload: Updated {from_version} -> {to_version} ({when}).\n")
+        if facts is not None:
+            facts['updated_to'] = to_version
+    elif state == 'up-to-date':
+        entry_lines.append(f"  Offload: Already up to date ({installed_version}).\n")
+    elif state == 'firmware-reboot':
+        entry_lines.append(f"  Offload: Firmware upgraded and rebooted ({when}).\n")
+    elif state == 'failed':
+        entry_lines.append(f"  Offload: Update check did not complete on the router: {detail or 'no status'} ({when}).\n")
+        return False
     else:
-        entry_lines.append("  Cloud backup: Failed to retrieve backup details to get secret key.\n")
+        entry_lines.append(f"  Offload: Job still running or interrupted: {state} since {when}.\n")
+        return False
 
+    if not dry_run:
+        _execute_router_command(api, ('/system/script/remove', {'numbers': script['.id']}), entry_lines)
     return True
 
 
@@ -487,6 +2040,523 @@ def _perform_firmware_upgrade(
         return True
 
 
+_EXPORT_FILE_NAME = "mkmassupdate-export"
+_FILE_READ_CHUNK = 32768
+# First line of an export is "# <date> by RouterOS <version>"; it changes on every export
+_EXPORT_HEADER_RE = re.compile(r'^# .* by RouterOS .*$', re.MULTILINE)
+
+
+def _normalize_export(text: str) -> str:
+    text = text.replace('\r\n', '\n')
+    return _EXPORT_HEADER_RE.sub('', text, count=1).lstrip('\n')
+
+
+def _read_router_file(api: librouteros.Connection, file_name: str, entry_lines: list[str]) -> str | None:
+    # /file/read (RouterOS 7.13+) streams files of any size; older versions only expose
+    # the first 4 KB through the 'contents' property of /file/print
+    chunks: list[str] = []
+    offset = 0
+    try:
+        while True:
+            response = execute_with_retry(api, '/file/read', {
+                'file': file_name, 'offset': offset, 'chunk-size': _FILE_READ_CHUNK,
+            })
+            data = str(response[0].get('data', '')) if response else ''
+            chunks.append(data)
+            offset += len(data.encode('utf-8'))
+            if len(data.encode('utf-8')) < _FILE_READ_CHUNK:
+                return ''.join(chunks)
+    except librouteros.exceptions.TrapError:
+        pass
+
+    name_key, size_key, contents_key = Key('name'), Key('size'), Key('contents')
+    files = list(api.path('/file').select(size_key, contents_key).where(name_key == file_name))
+    if not files:
+        return None
+    contents = str(files[0].get('contents', ''))
+    # A truncated export must not become the base of later deltas
+    try:
+        size: int | None = int(files[0].get('size', ''))
+    except (TypeError, ValueError):
+        size = None
+    if size != len(contents.encode('utf-8')):
+        entry_lines.append(
+            f"  Export: {file_name} is {files[0].get('size', 'of unknown size')} bytes but only "
+            f"{len(contents.encode('utf-8'))} could be read (no /file/read before RouterOS 7.13).\n"
+        )
+        return None
+    return contents
+
+
+def _fetch_export(api: librouteros.Connection, entry_lines: list[str]) -> str | None:
+    file_name = f"{_EXPORT_FILE_NAME}.rsc"
+    if _execute_router_command(api, ('/export', {'file': _EXPORT_FILE_NAME}), entry_lines) is None:
+        return None
+    try:
+        # The file can take a moment to appear on slow flash
+        name_key = Key('name')
+        for delay in (0, 0.2, 0.5, 1, 2):
+            time.sleep(delay)
+            if list(api.path('/file').select(name_key).where(name_key == file_name)):
+                return _read_router_file(api, file_name, entry_lines)
+        entry_lines.append(f"  Export: file {file_name} did not appear on the router.\n")
+        return None
+    finally:
+        _execute_router_command(api, ('/file/remove', {'numbers': file_name}), entry_lines)
+
+
+def _line_delta(base: list[str], new: list[str]) -> list[Any]:
+    # Ops are [start, end] to copy a slice of the base, or a list of new lines to insert
+    ops: list[Any] = []
+    matcher = difflib.SequenceMatcher(None, base, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            ops.append({'lines': new[j1:j2]})
+    return ops
+
+
+def _apply_line_delta(base: list[str], ops: list[Any]) -> list[str]:
+    lines: list[str] = []
+    for op in ops:
+        if isinstance(op, dict):
+            lines.extend(op['lines'])
+        else:
+            lines.extend(base[op[0]:op[1]])
+    return lines
+
+
+# Local content-addressed archive of configuration exports. Identical exports are stored
+# once; a changed export is stored as a line delta against the host's previous snapshot
+# (full copy every `max_chain` deltas). index.sqlite maps host and date to snapshots.
+class ExportArchive:
+    def __init__(self, directory: str, max_chain: int = 20) -> None:
+        self.directory = directory
+        self.max_chain = max_chain
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS objects (
+                digest TEXT PRIMARY KEY, base TEXT, depth INTEGER NOT NULL,
+                raw_size INTEGER NOT NULL, stored_size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS snapshots (
+                host TEXT NOT NULL, taken_at REAL NOT NULL, digest TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS snapshots_host_time ON snapshots (host, taken_at);
+        ''')
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'objects', digest[:2], digest[2:])
+
+    def _latest_digest(self, host: str, before: float | None = None) -> str | None:
+        query = 'SELECT digest FROM snapshots WHERE host = ?'
+        params: list[Any] = [host]
+        if before is not None:
+            query += ' AND taken_at <= ?'
+            params.append(before)
+        with self._lock:
+            row = self._db.execute(query + ' ORDER BY taken_at DESC LIMIT 1', params).fetchone()
+        return row[0] if row else None
+
+    def store(self, host: str, text: str, taken_at: float | None = None) -> tuple[str, str]:
+        # Returns (digest, how it was stored: 'unchanged', 'delta' or 'full')
+        normalized = _normalize_export(text)
+        digest = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        taken_at = time.time() if taken_at is None else taken_at
+        with self._lock:
+            known = self._db.execute('SELECT 1 FROM objects WHERE digest = ?', (digest,)).fetchone()
+            base_row = self._db.execute(
+                'SELECT o.digest, o.depth FROM snapshots s JOIN objects o ON o.digest = s.digest '
+                'WHERE s.host = ? ORDER BY s.taken_at DESC LIMIT 1', (host,)
+            ).fetchone()
+
+        kind = 'unchanged'
+        if not known:
+            payload: dict[str, Any]
+            base, depth = None, 0
+            if base_row and base_row[1] < self.max_chain:
+                base, depth = base_row[0], base_row[1] + 1
+                base_lines = self.load(base).splitlines(keepends=True)
+                payload = {'base': base, 'ops': _line_delta(base_lines, normalized.splitlines(keepends=True))}
+                kind = 'delta'
+            else:
+                payload = {'text': normalized}
+                kind = 'full'
+            blob = zlib.compress(json.dumps(payload).encode('utf-8'), 9)
+            path = self._object_path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(blob)
+            with self._lock, self._db:
+                self._db.execute(
+                    'INSERT OR IGNORE INTO objects VALUES (?, ?, ?, ?, ?)',
+                    (digest, base, depth, len(normalized.encode('utf-8')), len(blob)),
+                )
+        with self._lock, self._db:
+            self._db.execute('INSERT INTO snapshots VALUES (?, ?, ?)', (host, taken_at, digest))
+        return digest, kind
+
+    def load(self, digest: str) -> str:
+        with open(self._object_path(digest), 'rb') as f:
+            payload = json.loads(zlib.decompress(f.read()))
+        if 'text' in payload:
+            return payload['text']
+        base_lines = self.load(payload['base']).splitlines(keepends=True)
+        return ''.join(_apply_line_delta(base_lines, payload['ops']))
+
+    def get(self, host: str, at: float | None = None) -> str | None:
+        digest = self._latest_digest(host, at)
+        return self.load(digest) if digest else None
+
+    def history(self, host: str | None = None) -> list[tuple[str, float, str]]:
+        query = 'SELECT host, taken_at, digest FROM snapshots'
+        params: tuple[Any, ...] = ()
+        if host:
+            query += ' WHERE host = ?'
+            params = (host,)
+        with self._lock:
+            return self._db.execute(query + ' ORDER BY host, taken_at', params).fetchall()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            snapshots, hosts = self._db.execute('SELECT COUNT(*), COUNT(DISTINCT host) FROM snapshots').fetchone()
+            objects, raw, stored = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(stored_size), 0) FROM objects'
+            ).fetchone()
+            logical = self._db.execute(
+                'SELECT COALESCE(SUM(o.raw_size), 0) FROM snapshots s JOIN objects o ON o.digest = s.digest'
+            ).fetchone()[0]
+        return {'hosts': hosts, 'snapshots': snapshots, 'objects': objects,
+                'logical_bytes': logical, 'unique_bytes': raw, 'stored_bytes': stored}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _perform_export_backup(
+    api: librouteros.Connection,
+    archive: ExportArchive,
+    host: str,
+    entry_lines: list[str],
+) -> bool:
+    started = time.perf_counter()
+    text = _fetch_export(api, entry_lines)
+    if text is None:
+        entry_lines.append("  Export backup: Failed to export configuration.\n")
+        return False
+    digest, kind = archive.store(host, text)
+    entry_lines.append(
+        f"  Export backup: {len(text)} bytes archived ({kind}, {digest[:12]}) in {time.perf_counter() - started:.1f}s\n"
+    )
+    return True
+
+
+def _save_binary_backup(api: librouteros.Connection, entry_lines: list[str]) -> bool:
+    # The API cannot download binary files, so the .backup stays on the router's flash
+    response = _execute_router_command(
+        api, ('/system/backup/save', {'name': _EXPORT_FILE_NAME, 'dont-encrypt': 'yes'}), entry_lines
+    )
+    if response is None:
+        entry_lines.append("  Binary backup: Failed.\n")
+        return False
+    entry_lines.append(f"  Binary backup: Saved {_EXPORT_FILE_NAME}.backup on the router.\n")
+    return True
+
+
+def _error_class(success: bool, skipped: bool, facts: dict[str, Any], phases: dict[str, float]) -> str | None:
+    # Exception class that ended the host, else the last phase it reached
+    if success:
+        return None
+    if skipped:
+        return 'segment_down'
+    if facts.get('error'):
+        return facts['error']
+    return f"{next(reversed(phases))}_failed" if phases else 'failed'
+
+
+_HISTORY_COMMIT_EVERY = 200
+
+
+# Per-run, per-host results of every job, kept for the 'report' subcommand
+class RunHistory:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.run_id: int | None = None
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started REAL NOT NULL,
+                finished REAL,
+                dry_run INTEGER NOT NULL,
+                params TEXT NOT NULL,
+                hosts INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                run_id INTEGER NOT NULL,
+                host TEXT NOT NULL,
+                success INTEGER NOT NULL,
+                error TEXT,
+                identity TEXT,
+                model TEXT,
+                version TEXT,
+                updated_to TEXT,
+                duration REAL NOT NULL,
+                phases TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS results_run ON results (run_id);
+            CREATE INDEX IF NOT EXISTS results_host ON results (host, run_id);
+        ''')
+
+    def start_run(self, args: argparse.Namespace) -> int:
+        params = {key: value for key, value in sorted(vars(args).items()) if not _is_sensitive_key(key.replace('_', '-'))}
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                'INSERT INTO runs (started, dry_run, params) VALUES (?, ?, ?)',
+                (time.time(), int(bool(args.dry_run)), json.dumps(params, default=str)),
+            )
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def record(
+        self,
+        host: str,
+        success: bool,
+        error: str | None,
+        facts: dict[str, Any],
+        duration: float,
+        phases: dict[str, float],
+    ) -> None:
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.run_id, host, int(success), error, facts.get('identity'), facts.get('model'),
+                 facts.get('version'), facts.get('updated_to'), round(duration, 3),
+                 json.dumps({phase: round(seconds, 3) for phase, seconds in phases.items()})),
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= _HISTORY_COMMIT_EVERY:
+                self._db.commit()
+                self._uncommitted = 0
+
+    def finish_run(self) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE runs SET finished = ?, hosts = (SELECT COUNT(*) FROM results WHERE run_id = ?), '
+                'failed = (SELECT COUNT(*) FROM results WHERE run_id = ? AND NOT success) WHERE run_id = ?',
+                (time.time(), self.run_id, self.run_id, self.run_id),
+            )
+
+    def _last_run_ids(self, runs: int, include_dry_run: bool) -> list[int]:
+        query = 'SELECT run_id FROM runs' + ('' if include_dry_run else ' WHERE NOT dry_run')
+        return [row[0] for row in self._db.execute(query + ' ORDER BY run_id DESC LIMIT ?', (runs,))]
+
+    def runs(self, limit: int) -> list[tuple[int, float, float | None, bool, int, int]]:
+        with self._lock:
+            return self._db.execute(
+                'SELECT run_id, started, finished, dry_run, hosts, failed FROM runs ORDER BY run_id DESC LIMIT ?', (limit,)
+            ).fetchall()
+
+    def failing(self, runs: int, min_failures: int, include_dry_run: bool = False) -> list[tuple[str, int, int, str | None]]:
+        # (host, failed runs, runs seen, most recent error) for hosts failing at least min_failures
+        # times in the last `runs` runs
+        with self._lock:
+            run_ids = self._last_run_ids(runs, include_dry_run)
+            if not run_ids:
+                return []
+            marks = ','.join('?' * len(run_ids))
+            return self._db.execute(
+                f'SELECT host, SUM(NOT success) AS failures, COUNT(*), '
+                f'(SELECT error FROM results r2 WHERE r2.host = r.host AND r2.run_id IN ({marks}) AND NOT r2.success '
+                f' ORDER BY r2.run_id DESC LIMIT 1) '
+                f'FROM results r WHERE run_id IN ({marks}) GROUP BY host HAVING failures >= ? '
+                f'ORDER BY failures DESC, host',
+                (*run_ids, *run_ids, min_failures),
+            ).fetchall()
+
+    def versions(self) -> list[tuple[str, int]]:
+        # Each host's version as last seen (the version it was updated to, if it was). A host
+        # listed twice in one run has several rows there, so only its latest row counts.
+        with self._lock:
+            return self._db.execute(
+                'SELECT COALESCE(updated_to, version) AS current, COUNT(*) FROM results r '
+                'WHERE rowid = (SELECT MAX(rowid) FROM results r2 WHERE r2.host = r.host AND r2.version IS NOT NULL) '
+                'GROUP BY current ORDER BY COUNT(*) DESC, current'
+            ).fetchall()
+
+    def durations(self, phase: str, group_by: str, runs: int) -> list[tuple[str, int, float, float]]:
+        # (group, samples, median, p90) of a phase's seconds over the last `runs` runs;
+        # phase 'total' is the whole host duration
+        if group_by not in ('model', 'version', 'host'):
+            raise ValueError(f"cannot group by {group_by}")
+        with self._lock:
+            run_ids = self._last_run_ids(runs, include_dry_run=True)
+            marks = ','.join('?' * len(run_ids))
+            rows = self._db.execute(
+                f'SELECT {group_by}, duration, phases FROM results WHERE run_id IN ({marks})', run_ids
+            ).fetchall() if run_ids else []
+        samples: dict[str, list[float]] = {}
+        for group, duration, phases_json in rows:
+            seconds = duration if phase == 'total' else json.loads(phases_json).get(phase)
+            if seconds is not None:
+                samples.setdefault(group or '-', []).append(seconds)
+        result = []
+        for group, values in samples.items():
+            values.sort()
+            result.append((group, len(values), statistics.median(values), values[math.ceil(0.9 * len(values)) - 1]))
+        return sorted(result, key=lambda row: row[2], reverse=True)
+
+    def host_history(self, host: str, limit: int) -> list[tuple[int, float, bool, str | None, str | None, str | None, float]]:
+        with self._lock:
+            return self._db.execute(
+                'SELECT r.run_id, runs.started, r.success, r.error, r.version, r.updated_to, r.duration '
+                'FROM results r JOIN runs ON runs.run_id = r.run_id WHERE r.host = ? OR r.identity = ? '
+                'ORDER BY r.run_id DESC LIMIT ?', (host, host, limit)
+            ).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+_HOST_LOG_SHARDS = 16
+_HOST_LOG_COMMIT_EVERY = 200
+
+
+# Per-host log output, one directory per run with `shards` gzip files. Every host entry is its own
+# gzip member, so the index can point at it and it is read back without decompressing the shard.
+class HostLogStore:
+    def __init__(self, directory: str, shards: int = _HOST_LOG_SHARDS) -> None:
+        self.directory = directory
+        self.shards = shards
+        self.run_id: str | None = None
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._files: dict[int, Any] = {}
+        self._uncommitted = 0
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY, started REAL NOT NULL, bytes INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                run_id TEXT NOT NULL, host TEXT NOT NULL COLLATE NOCASE, identity TEXT COLLATE NOCASE,
+                success INTEGER NOT NULL, shard INTEGER NOT NULL, offset INTEGER NOT NULL,
+                length INTEGER NOT NULL, logged REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_host ON entries (host);
+            CREATE INDEX IF NOT EXISTS entries_identity ON entries (identity);
+        ''')
+
+    def _shard_path(self, run_id: str, shard: int) -> str:
+        return os.path.join(self.directory, run_id, f"shard-{shard:03d}.log.gz")
+
+    def start_run(self) -> str:
+        run_id = time.strftime('%Y-%m-%d-%H-%M-%S')
+        suffix = 1
+        while os.path.exists(os.path.join(self.directory, run_id)):
+            suffix += 1
+            run_id = f"{time.strftime('%Y-%m-%d-%H-%M-%S')}-{suffix}"
+        os.makedirs(os.path.join(self.directory, run_id))
+        with self._lock, self._db:
+            self._db.execute('INSERT INTO runs (run_id, started) VALUES (?, ?)', (run_id, time.time()))
+        self.run_id = run_id
+        return run_id
+
+    def write(self, host: str, identity: str | None, success: bool, text: str) -> None:
+        blob = gzip.compress(text.encode('utf-8'), compresslevel=6)
+        shard = zlib.crc32(host.encode('utf-8')) % self.shards
+        with self._lock:
+            f = self._files.get(shard)
+            if f is None:
+                f = self._files[shard] = open(self._shard_path(self.run_id, shard), 'ab')
+            offset = f.tell()
+            f.write(blob)
+            self._db.execute(
+                'INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.run_id, host, identity, int(success), shard, offset, len(blob), time.time()),
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= _HOST_LOG_COMMIT_EVERY:
+                for pending in self._files.values():
+                    pending.flush()
+                self._db.commit()
+                self._uncommitted = 0
+
+    def lookup(self, host: str, limit: int | None = None) -> list[tuple[str, float, str, str | None, bool, str]]:
+        # Newest first; `host` matches the address or the router identity
+        query = ('SELECT run_id, logged, host, identity, success, shard, offset, length FROM entries '
+                 'WHERE host = ? OR identity = ? ORDER BY logged DESC')
+        params: tuple[Any, ...] = (host, host)
+        if limit:
+            query += ' LIMIT ?'
+            params += (limit,)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        results = []
+        for run_id, logged, address, identity, success, shard, offset, length in rows:
+            try:
+                with open(self._shard_path(run_id, shard), 'rb') as f:
+                    f.seek(offset)
+                    text = gzip.decompress(f.read(length)).decode('utf-8')
+            except (OSError, EOFError) as e:
+                text = f"(log entry unreadable: {e})"
+            results.append((run_id, logged, address, identity, bool(success), text))
+        return results
+
+    def runs(self) -> list[tuple[str, float, int, int]]:
+        with self._lock:
+            # bytes is only written when a run closes; for a run that crashed, use its indexed entries
+            return self._db.execute(
+                'SELECT r.run_id, r.started, MAX(r.bytes, COALESCE(SUM(e.length), 0)), COUNT(e.host) FROM runs r '
+                'LEFT JOIN entries e ON e.run_id = r.run_id GROUP BY r.run_id ORDER BY r.started'
+            ).fetchall()
+
+    def _run_size(self, run_id: str) -> int:
+        # What removing the run frees on disk, including entries a killed run never committed
+        try:
+            return sum(entry.stat().st_size for entry in os.scandir(os.path.join(self.directory, run_id)))
+        except OSError:
+            return 0
+
+    def prune(self, max_age_days: float = 0, max_bytes: int = 0) -> list[str]:
+        # Removes whole runs, oldest first, that are older than max_age_days or needed to get the
+        # total under max_bytes. The run being written is never removed.
+        runs = [(run_id, started, self._run_size(run_id)) for run_id, started, _, _ in self.runs() if run_id != self.run_id]
+        total = sum(row[2] for row in runs)
+        removed = []
+        for run_id, started, size in runs:
+            too_old = max_age_days and started < time.time() - max_age_days * 86400
+            too_big = max_bytes and total > max_bytes
+            if not (too_old or too_big):
+                continue
+            shutil.rmtree(os.path.join(self.directory, run_id), ignore_errors=True)
+            with self._lock, self._db:
+                self._db.execute('DELETE FROM entries WHERE run_id = ?', (run_id,))
+                self._db.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+            total -= size
+            removed.append(run_id)
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+            with self._db:
+                if self.run_id:
+                    self._db.execute('UPDATE runs SET bytes = ? WHERE run_id = ?', (self._run_size(self.run_id), self.run_id))
+            self._db.close()
+
+
 def _positive_int(value: str) -> int:
     n = int(value)
     if n < 1:
@@ -508,16 +2578,1056 @@ def _positive_float(value: str) -> float:
     return n
 
 
+def _non_negative_float(value: str) -> float:
+    n = float(value)
+    if n < 0:
+        raise argparse.ArgumentTypeError(f"Value must be >= 0, got {n}")
+    return n
+
+
+def _fraction(value: str) -> float:
+    n = float(value)
+    if not (0 <= n <= 1):
+        raise argparse.ArgumentTypeError(f"Value must be between 0 and 1, got {n}")
+    return n
+
+
+def _prefix_length(value: str) -> int:
+    n = int(value)
+    if not (1 <= n <= 32):
+        raise argparse.ArgumentTypeError(f"Prefix length must be between 1 and 32, got {n}")
+    return n
+
+
+def _non_negative_int(value: str) -> int:
+    n = int(value)
+    if n < 0:
+        raise argparse.ArgumentTypeError(f"Value must be >= 0, got {n}")
+    return n
+
+
+_UNREACHABLE_ERRNOS = {errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN}
+
+
+def _is_unreachable_error(error: BaseException) -> bool:
+    # Refused or reset connections prove the segment is up; only timeouts and routing errors count
+    if isinstance(error, TimeoutError):
+        return True
+    return isinstance(error, OSError) and error.errno in _UNREACHABLE_ERRNOS
+
+
+class _SegmentState:
+    __slots__ = ('failures', 'open_since', 'probing')
+
+    def __init__(self) -> None:
+        self.failures = 0
+        self.open_since: float | None = None
+        self.probing = False
+
+
+# Circuit breaker keyed by network segment. After `threshold` consecutive connect failures
+# in a segment, its remaining hosts are skipped; with `probe_after` set, one host is let
+# through after that many seconds and closes the breaker again if it connects.
+class SegmentBreaker:
+    def __init__(self, threshold: int, prefix_v4: int = 24, prefix_v6: int = 64, probe_after: float = 0.0) -> None:
+        self.threshold = threshold
+        self.prefix_v4 = prefix_v4
+        self.prefix_v6 = prefix_v6
+        self.probe_after = probe_after
+        self._states: dict[str, _SegmentState] = {}
+        self._lock = threading.Lock()
+        self.tripped: set[str] = set()
+        self.sites: dict[str, str] = {}
+
+    def segment_of(self, host: str) -> str | None:
+        # Inventory site tags take precedence over the subnet
+        site = self.sites.get(host)
+        if site:
+            return f"site:{site}"
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            # Hostnames fall in the segment of the address they resolved to
+            resolved = dns_cache.cached(host) if dns_cache else None
+            if resolved is None:
+                return None
+            address = ipaddress.ip_address(resolved)
+        prefix = self.prefix_v4 if address.version == 4 else self.prefix_v6
+        return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+    def allow(self, segment: str) -> bool:
+        with self._lock:
+            state = self._states.get(segment)
+            if state is None or state.open_since is None:
+                return True
+            if self.probe_after and not state.probing and time.monotonic() - state.open_since >= self.probe_after:
+                state.probing = True
+                logger.info(f"Segment {segment}: probing one host to check if it is reachable again.")
+                return True
+            return False
+
+    def record(self, host: str, reachable: bool) -> None:
+        segment = self.segment_of(host)
+        if segment is None:
+            return
+        with self._lock:
+            state = self._states.setdefault(segment, _SegmentState())
+            if reachable:
+                if state.open_since is not None:
+                    logger.info(f"Segment {segment} is reachable again, resuming its hosts.")
+                state.failures = 0
+                state.open_since = None
+                state.probing = False
+                return
+            state.failures += 1
+            if state.probing:
+                state.probing = False
+                state.open_since = time.monotonic()
+            elif state.open_since is None and state.failures >= self.threshold:
+                state.open_since = time.monotonic()
+                self.tripped.add(segment)
+                logger.warning(
+                    f"Segment {segment} unreachable after {state.failures} consecutive connect failures, "
+                    f"skipping its remaining hosts."
+                )
+
+
+_VERSION_RE = re.compile(r'(\d+)(?:\.(\d+))?(?:\.(\d+))?')
+
+
+def _version_key(version: str | None) -> int | None:
+    # Sortable integer for RouterOS versions: 7.14.3 -> 7014003
+    match = _VERSION_RE.match(version or '')
+    if not match:
+        return None
+    major, minor, patch = (int(part or 0) for part in match.groups())
+    return major * 1_000_000 + minor * 1_000 + patch
+
+
+def _split_version(version: str) -> tuple[str, str | None]:
+    # "/system/resource/print" reports e.g. "7.14.3 (stable)"
+    match = re.match(r'^\s*(\S+)\s*(?:\(([\w-]+)\))?', version)
+    if not match:
+        return version, None
+    return match.group(1), match.group(2)
+
+
+class InventorySelectError(ValueError):
+    pass
+
+
+_SELECT_TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|(<=|>=|!=|=|<|>)|"([^"]*)"|\'([^\']*)\'|([^\s()<>=!"\']+))')
+_SELECT_FIELDS = {'address', 'port', 'site', 'model', 'version', 'channel', 'identity', 'tag', 'username'}
+
+
+def _tokenize_select(expr: str) -> list[tuple[str, str]]:
+    tokens: list[tuple[str, str]] = []
+    pos = 0
+    expr = expr.rstrip()
+    while pos < len(expr):
+        match = _SELECT_TOKEN_RE.match(expr, pos)
+        if not match or match.end() == pos:
+            raise InventorySelectError(f"Unexpected character at position {pos}: '{expr[pos:]}'")
+        pos = match.end()
+        lparen, rparen, op, dquoted, squoted, word = match.groups()
+        if lparen:
+            tokens.append(('(', lparen))
+        elif rparen:
+            tokens.append((')', rparen))
+        elif op:
+            tokens.append(('op', op))
+        elif dquoted is not None or squoted is not None:
+            tokens.append(('value', dquoted if dquoted is not None else squoted))
+        elif word.lower() in ('and', 'or', 'not'):
+            tokens.append((word.lower(), word))
+        else:
+            tokens.append(('value', word))
+    return tokens
+
+
+def _glob_to_like(column: str, pattern: str) -> tuple[str, str]:
+    # LIKE on a NOCASE column can use its index for prefix patterns; ESCAPE is only added
+    # when the pattern really contains LIKE metacharacters.
+    if '%' in pattern or '_' in pattern:
+        escaped = pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return f"{column} LIKE ? ESCAPE '\\'", escaped.replace('*', '%').replace('?', '_')
+    return f"{column} LIKE ?", pattern.replace('*', '%').replace('?', '_')
+
+
+class _SelectCompiler:
+    # expr := term (('and' | 'or') term)* ; term := ['not'] (cond | '(' expr ')') ; cond := field op value
+    def __init__(self, expr: str) -> None:
+        self.tokens = _tokenize_select(expr)
+        self.pos = 0
+        self.params: list[Any] = []
+
+    def _peek(self) -> str | None:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def _take(self, kind: str) -> str:
+        if self._peek() != kind:
+            found = self.tokens[self.pos][1] if self.pos < len(self.tokens) else 'end of expression'
+            raise InventorySelectError(f"Expected {kind}, found '{found}'")
+        self.pos += 1
+        return self.tokens[self.pos - 1][1]
+
+    def compile(self) -> tuple[str, list[Any]]:
+        if not self.tokens:
+            return '1', []
+        sql = self._expr()
+        if self.pos != len(self.tokens):
+            raise InventorySelectError(f"Unexpected '{self.tokens[self.pos][1]}'")
+        return sql, self.params
+
+    def _expr(self) -> str:
+        parts = [self._term()]
+        while self._peek() in ('and', 'or'):
+            parts.append(self._take(self._peek() or '').upper())
+            parts.append(self._term())
+        return '(' + ' '.join(parts) + ')'
+
+    def _term(self) -> str:
+        if self._peek() == 'not':
+            self.pos += 1
+            return f"NOT {self._term()}"
+        if self._peek() == '(':
+            self.pos += 1
+            sql = self._expr()
+            self._take(')')
+            return sql
+        return self._condition()
+
+    def _condition(self) -> str:
+        field = self._take('value').lower()
+        if field not in _SELECT_FIELDS:
+            raise InventorySelectError(f"Unknown field '{field}', expected one of: {', '.join(sorted(_SELECT_FIELDS))}")
+        op = self._take('op')
+        value = self._take('value')
+        is_glob = '*' in value or '?' in value
+
+        if field == 'tag':
+            if op not in ('=', '!='):
+                raise InventorySelectError("Tags only support '=' and '!='")
+            match, param = _glob_to_like('t.tag', value) if is_glob else ('t.tag = ?', value)
+            self.params.append(param)
+            negate = 'NOT ' if op == '!=' else ''
+            return f"{negate}EXISTS (SELECT 1 FROM host_tags t WHERE t.host_id = hosts.id AND {match})"
+
+        if field == 'version' and not is_glob and op not in ('=', '!='):
+            key = _version_key(value)
+            if key is None:
+                raise InventorySelectError(f"Invalid version '{value}'")
+            self.params.append(key)
+            return f"version_key {op} ?"
+        if field == 'version' and op in ('=', '!=') and not is_glob and value.count('.') < 2:
+            # version=7 or version=7.14 matches the whole major/minor series
+            low = _version_key(value)
+            if low is None:
+                raise InventorySelectError(f"Invalid version '{value}'")
+            step = 1_000_000 if '.' not in value else 1_000
+            self.params.extend([low, low + step])
+            sql = "(version_key >= ? AND version_key < ?)"
+            return f"NOT {sql}" if op == '!=' else sql
+
+        if is_glob:
+            if op not in ('=', '!='):
+                raise InventorySelectError(f"Wildcards only work with '=' and '!=' ({field}{op}{value})")
+            match, param = _glob_to_like(field, value)
+            self.params.append(param)
+            return f"NOT {match}" if op == '!=' else match
+        self.params.append(int(value) if field == 'port' and value.isdigit() else value)
+        return f"{field} {op} ?"
+
+
+# Host inventory in SQLite. Hosts carry credentials, site and tags, plus the model, version
+# and channel last seen by a run; selections compile to indexed SQL.
+class Inventory:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS hosts (
+                id INTEGER PRIMARY KEY,
+                address TEXT NOT NULL COLLATE NOCASE,
+                port INTEGER NOT NULL,
+                username TEXT,
+                password TEXT,
+                ssl INTEGER NOT NULL DEFAULT 0, -- host flags: 1 = SSL, 2 = REST
+                site TEXT COLLATE NOCASE,
+                identity TEXT COLLATE NOCASE,
+                model TEXT COLLATE NOCASE,
+                version TEXT,
+                version_key INTEGER,
+                channel TEXT COLLATE NOCASE,
+                last_seen REAL,
+                UNIQUE (address, port)
+            );
+            CREATE TABLE IF NOT EXISTS host_tags (
+                host_id INTEGER NOT NULL REFERENCES hosts (id) ON DELETE CASCADE,
+                tag TEXT NOT NULL COLLATE NOCASE,
+                PRIMARY KEY (host_id, tag)
+            );
+            CREATE INDEX IF NOT EXISTS hosts_site ON hosts (site);
+            CREATE INDEX IF NOT EXISTS hosts_model ON hosts (model);
+            CREATE INDEX IF NOT EXISTS hosts_version ON hosts (version_key);
+            CREATE INDEX IF NOT EXISTS hosts_channel ON hosts (channel);
+            CREATE INDEX IF NOT EXISTS host_tags_tag ON host_tags (tag, host_id);
+        ''')
+
+    def import_lines(self, lines: Any, default_api_port: int, site: str | None = None, tags: list[str] | None = None) -> int:
+        count = 0
+        with self._lock, self._db:
+            for line in lines:
+                stripped = line.strip()
+                if not stripped or stripped.startswith('#'):
+                    continue
+                host_info = parse_host_line(stripped, default_api_port)
+                if not host_info:
+                    continue
+                address, port, username, password, flags = host_info
+                self._db.execute(
+                    'INSERT INTO hosts (address, port, username, password, ssl, site) VALUES (?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (address, port) DO UPDATE SET username = excluded.username, '
+                    'password = excluded.password, ssl = excluded.ssl, site = COALESCE(excluded.site, hosts.site)',
+                    (address, port, username, password, int(flags), site),
+                )
+                if tags:
+                    host_id = self._db.execute(
+                        'SELECT id FROM hosts WHERE address = ? AND port = ?', (address, port)
+                    ).fetchone()[0]
+                    self._db.executemany(
+                        'INSERT OR IGNORE INTO host_tags VALUES (?, ?)', [(host_id, tag) for tag in tags]
+                    )
+                count += 1
+        return count
+
+    def select(self, expr: str | None = None) -> list[tuple[str, int, str | None, str | None, int, str | None]]:
+        where, params = _SelectCompiler(expr or '').compile()
+        with self._lock:
+            rows = self._db.execute(
+                f'SELECT address, port, username, password, ssl, site FROM hosts WHERE {where} ORDER BY id', params
+            ).fetchall()
+        return [(address, port, username, password, int(flags), site) for address, port, username, password, flags, site in rows]
+
+    def details(self, expr: str | None = None) -> list[tuple[Any, ...]]:
+        where, params = _SelectCompiler(expr or '').compile()
+        with self._lock:
+            return self._db.execute(
+                f'SELECT address, port, site, identity, model, version, channel FROM hosts WHERE {where} ORDER BY id',
+                params,
+            ).fetchall()
+
+    def tag(self, expr: str | None, add: list[str], remove: list[str]) -> int:
+        where, params = _SelectCompiler(expr or '').compile()
+        with self._lock, self._db:
+            ids = [row[0] for row in self._db.execute(f'SELECT id FROM hosts WHERE {where}', params)]
+            self._db.executemany('INSERT OR IGNORE INTO host_tags VALUES (?, ?)', [(i, t) for i in ids for t in add])
+            self._db.executemany('DELETE FROM host_tags WHERE host_id = ? AND tag = ?', [(i, t) for i in ids for t in remove])
+        return len(ids)
+
+    def set_site(self, expr: str | None, site: str) -> int:
+        where, params = _SelectCompiler(expr or '').compile()
+        with self._lock, self._db:
+            return self._db.execute(f'UPDATE hosts SET site = ? WHERE {where}', [site, *params]).rowcount
+
+    def update_facts(self, address: str, port: int, facts: dict[str, Any]) -> None:
+        version = facts.get('version')
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE hosts SET identity = COALESCE(?, identity), model = COALESCE(?, model), '
+                'version = COALESCE(?, version), version_key = COALESCE(?, version_key), '
+                'channel = COALESCE(?, channel), last_seen = ? WHERE address = ? AND port = ?',
+                (facts.get('identity'), facts.get('model'), version, _version_key(version),
+                 facts.get('channel'), time.time(), address, port),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_LOGIN_FAILURE_WINDOW = 3600.0
+_TIMING_SMOOTHING = 0.3
+_RTT_HISTORY = 100
+_RTT_MIN_SAMPLES = 3
+
+
+# Per-host state kept between runs (--state-db)
+class StateStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS credentials (
+                host TEXT PRIMARY KEY,
+                credential TEXT NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS login_failures (
+                host TEXT PRIMARY KEY,
+                failures INTEGER NOT NULL,
+                last_failure REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS phase_timings (
+                host TEXT NOT NULL,
+                phase TEXT NOT NULL,
+                duration REAL NOT NULL,
+                samples INTEGER NOT NULL,
+                PRIMARY KEY (host, phase)
+            );
+            CREATE TABLE IF NOT EXISTS hosts (
+                host TEXT PRIMARY KEY,
+                last_success INTEGER NOT NULL,
+                last_run REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rtt_samples (
+                host TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                samples TEXT NOT NULL,
+                PRIMARY KEY (host, kind)
+            );
+            CREATE TABLE IF NOT EXISTS cloud_backups (
+                host TEXT PRIMARY KEY,
+                backed_up_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS staged (
+                host TEXT PRIMARY KEY,
+                version TEXT,
+                firmware INTEGER NOT NULL,
+                staged_at REAL NOT NULL
+            );
+        ''')
+        self._credential_key = self._load_credential_key()
+
+    def _load_credential_key(self) -> bytes:
+        with self._db:
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'credential_key'").fetchone()
+            if row is not None:
+                return bytes(row[0])
+            key = secrets.token_bytes(32)
+            self._db.execute("INSERT INTO meta VALUES ('credential_key', ?)", (key,))
+            # Drop ids written by older versions as a plain hash of the password
+            self._db.execute('DELETE FROM credentials')
+        return key
+
+    def order_credentials(self, host: str, credentials: list[tuple[str, str | None]]) -> list[tuple[str, str | None]]:
+        # The set that worked last time goes first
+        with self._lock:
+            row = self._db.execute('SELECT credential FROM credentials WHERE host = ?', (host,)).fetchone()
+        if row is None:
+            return credentials
+        cached = [c for c in credentials if _credential_id(self._credential_key, *c) == row[0]]
+        return cached + [c for c in credentials if _credential_id(self._credential_key, *c) != row[0]]
+
+    def login_failures(self, host: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT failures FROM login_failures WHERE host = ? AND last_failure >= ?',
+                (host, time.time() - _LOGIN_FAILURE_WINDOW),
+            ).fetchone()
+        return row[0] if row else 0
+
+    def record_login(self, host: str, failures: int, used: tuple[str, str | None] | None) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            if used is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO credentials VALUES (?, ?, ?)', (host, _credential_id(self._credential_key, *used), now)
+                )
+                self._db.execute('DELETE FROM login_failures WHERE host = ?', (host,))
+            elif failures:
+                self._db.execute(
+                    'INSERT INTO login_failures VALUES (?, ?, ?) ON CONFLICT (host) DO UPDATE SET '
+                    'failures = CASE WHEN last_failure >= ? THEN failures ELSE 0 END + excluded.failures, '
+                    'last_failure = excluded.last_failure',
+                    (host, failures, now, now - _LOGIN_FAILURE_WINDOW),
+                )
+
+    def record_run(self, host: str, phases: dict[str, float], success: bool) -> None:
+        # Phase durations are kept as a moving average that favours recent runs
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT INTO phase_timings VALUES (?, ?, ?, 1) ON CONFLICT (host, phase) DO UPDATE SET '
+                'duration = duration + ? * (excluded.duration - duration), samples = samples + 1',
+                [(host, phase, duration, _TIMING_SMOOTHING) for phase, duration in phases.items()],
+            )
+            self._db.execute('INSERT OR REPLACE INTO hosts VALUES (?, ?, ?)', (host, int(success), time.time()))
+
+    def record_rtts(self, host: str, connect: list[float], command: list[float]) -> None:
+        # Keeps the most recent _RTT_HISTORY samples of each kind as a JSON list
+        with self._lock, self._db:
+            for kind, samples in (('connect', connect), ('command', command)):
+                if not samples:
+                    continue
+                row = self._db.execute(
+                    'SELECT samples FROM rtt_samples WHERE host = ? AND kind = ?', (host, kind)
+                ).fetchone()
+                kept = (json.loads(row[0]) if row else []) + [round(sample, 4) for sample in samples]
+                self._db.execute(
+                    'INSERT OR REPLACE INTO rtt_samples VALUES (?, ?, ?)', (host, kind, json.dumps(kept[-_RTT_HISTORY:]))
+                )
+
+    def rtt_p99(self, host: str) -> dict[str, float]:
+        # p99 per kind, only for kinds with at least _RTT_MIN_SAMPLES samples
+        with self._lock:
+            rows = self._db.execute('SELECT kind, samples FROM rtt_samples WHERE host = ?', (host,)).fetchall()
+        result = {}
+        for kind, samples_json in rows:
+            samples = sorted(json.loads(samples_json))
+            if len(samples) >= _RTT_MIN_SAMPLES:
+                result[kind] = samples[math.ceil(0.99 * len(samples)) - 1]
+        return result
+
+    def record_staged(self, host: str, version: str | None, firmware: bool) -> None:
+        # Hosts with nothing staged are cleared, so a later --reboot-staged leaves them alone
+        with self._lock, self._db:
+            if version or firmware:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO staged VALUES (?, ?, ?, ?)', (host, version, int(firmware), time.time())
+                )
+            else:
+                self._db.execute('DELETE FROM staged WHERE host = ?', (host,))
+
+    def record_cloud_backup(self, host: str, backed_up_at: float) -> None:
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO cloud_backups VALUES (?, ?)', (host, backed_up_at))
+
+    def cloud_backup_at(self, host: str) -> float | None:
+        with self._lock:
+            row = self._db.execute('SELECT backed_up_at FROM cloud_backups WHERE host = ?', (host,)).fetchone()
+        return row[0] if row else None
+
+    def staged(self) -> dict[str, tuple[str | None, bool]]:
+        with self._lock:
+            rows = self._db.execute('SELECT host, version, firmware FROM staged').fetchall()
+        return {host: (version, bool(firmware)) for host, version, firmware in rows}
+
+    def timings(self) -> tuple[dict[str, dict[str, float]], dict[str, bool]]:
+        with self._lock:
+            phase_rows = self._db.execute('SELECT host, phase, duration FROM phase_timings').fetchall()
+            host_rows = self._db.execute('SELECT host, last_success FROM hosts').fetchall()
+        timings: dict[str, dict[str, float]] = {}
+        for host, phase, duration in phase_rows:
+            timings.setdefault(host, {})[phase] = duration
+        return timings, {host: bool(last_success) for host, last_success in host_rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_ESTIMATE_MAX_THREADS = 1024
+
+# Used for hosts and phases that no earlier run has timed
+_DEFAULT_PHASE_SECONDS = {
+    'connect': 0.5,
+    'commands': 1.5,
+    'export_backup': 3.0,
+    'cloud_backup': 30.0,
+    'firmware_upgrade': 2.0,
+    'download': 60.0,
+    'reboot': 0.5,
+    'offload': 1.0,
+    'collect': 0.5,
+}
+
+
+def simulate_schedule(durations: list[float], threads: int) -> tuple[float, list[int]]:
+    # Replays the worker pool offline: hosts are taken from the queue in order by whichever worker
+    # is free first. Returns the wall time and the hosts (indexes) of the worker that finishes last.
+    workers = [(0.0, worker) for worker in range(max(1, min(threads, len(durations) or 1)))]
+    assigned: list[list[int]] = [[] for _ in workers]
+    for index, duration in enumerate(durations):
+        free_at, worker = heapq.heappop(workers)
+        assigned[worker].append(index)
+        heapq.heappush(workers, (free_at + duration, worker))
+    wall, last_worker = max(workers)
+    return wall, assigned[last_worker]
+
+
+def recommend_threads(durations: list[float], window: float, max_threads: int = _ESTIMATE_MAX_THREADS) -> int | None:
+    # Smallest thread count whose simulated wall time fits the window, None if no count does
+    if not durations:
+        return 1
+    high = min(max_threads, len(durations))
+    if simulate_schedule(durations, high)[0] > window:
+        return None
+    low = 1
+    while low < high:
+        middle = (low + high) // 2
+        if simulate_schedule(durations, middle)[0] <= window:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+_DASHBOARD_REFRESH = 1.0
+
+
+_RESULT_SPILL_THRESHOLD = 10000
+# Spilled entries copied per lock acquisition while iterating
+_RESULT_SPILL_CHUNK = 1000
+
+
+def _peak_memory_bytes() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# Run outcome kept flat in memory: counters, one float per host for the duration percentiles, and
+# the addresses of failed and skipped hosts only, moved to a temporary file past `spill_threshold`.
+class RunResults:
+    __slots__ = ('ok', 'failed', 'skipped', 'durations', 'spill_threshold', 'spilled', '_hosts', '_spill', '_lock')
+
+    def __init__(self, spill_threshold: int = _RESULT_SPILL_THRESHOLD) -> None:
+        self.ok = 0
+        self.failed = 0
+        self.skipped = 0
+        self.durations = array.array('f')
+        self.spill_threshold = spill_threshold
+        self.spilled = 0
+        self._hosts: list[str] = []
+        self._spill: Any = None
+        self._lock = threading.Lock()
+
+    @property
+    def processed(self) -> int:
+        return self.ok + self.failed
+
+    def record(self, host: str, success: bool, skipped: bool, duration: float) -> None:
+        with self._lock:
+            self.durations.append(duration)
+            if success:
+                self.ok += 1
+                return
+            self.failed += 1
+            if skipped:
+                self.skipped += 1
+            # "F" failed, "S" skipped; skipped hosts also count as failed
+            self._hosts.append(f"{'S' if skipped else 'F'}{host}")
+            if len(self._hosts) >= self.spill_threshold:
+                if self._spill is None:
+                    self._spill = tempfile.TemporaryFile('w+', encoding='utf-8')
+                self._spill.write('\n'.join(self._hosts) + '\n')
+                self.spilled += len(self._hosts)
+                self._hosts.clear()
+
+    def _iter_hosts(self, kind: str) -> Iterator[str]:
+        # The lock is only held to copy a chunk of entries, never while the caller consumes them
+        position = 0
+        while True:
+            with self._lock:
+                lines: list[str] = []
+                if self._spill is not None:
+                    self._spill.flush()
+                    self._spill.seek(position)
+                    for _ in range(_RESULT_SPILL_CHUNK):
+                        line = self._spill.readline()
+                        if not line:
+                            break
+                        lines.append(line)
+                    position = self._spill.tell()
+                    self._spill.seek(0, os.SEEK_END)
+                if not lines:
+                    hosts = list(self._hosts)
+                    break
+            for line in lines:
+                if line[0] == kind:
+                    yield line[1:].rstrip('\n')
+        for entry in hosts:
+            if entry[0] == kind:
+                yield entry[1:]
+
+    def failed_hosts(self) -> Iterator[str]:
+        return self._iter_hosts('F')
+
+    def skipped_hosts(self) -> Iterator[str]:
+        return self._iter_hosts('S')
+
+    def percentile(self, fraction: float) -> float | None:
+        if not self.durations:
+            return None
+        ordered = sorted(self.durations)
+        return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+    def close(self) -> None:
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+
+_FLEET_COLUMNS = (
+    'address', 'port', 'identity', 'model', 'version', 'channel', 'updated_to', 'status', 'failure', 'error', 'seconds',
+)
+_FLEET_FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow', '.csv': 'csv'}
+_FLEET_TOP = 10
+_FLEET_BINS = 10
+
+
+def _parse_fleet_field(value: str) -> tuple[str, str, str]:
+    # "cpu_load=/system/resource/print:cpu-load" -> column, command, key of its first row
+    name, sep, rest = value.partition('=')
+    command, sep2, key = rest.rpartition(':')
+    if not sep or not sep2 or not name or not command.startswith('/') or not key:
+        raise argparse.ArgumentTypeError(f"expected NAME=/command/path:key, got '{value}'")
+    if name in _FLEET_COLUMNS:
+        raise argparse.ArgumentTypeError(f"'{name}' is a built-in column")
+    return name, command, key
+
+
+def _fleet_values(values: list[Any]) -> list[Any]:
+    # One type per column: numbers stay numbers unless some value is not one
+    present = [v for v in values if v is not None]
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return values
+    if all(isinstance(v, bool) for v in present):
+        return values
+    return [None if v is None else str(v) for v in values]
+
+
+# One row per router, kept column by column and written at the end of the run as Parquet or
+# Arrow IPC (with pyarrow) or CSV. Custom fields hold the `key` of the first row a custom
+# command returned.
+class FleetExport:
+    def __init__(self, path: str, fields: list[tuple[str, str, str]] | None = None) -> None:
+        fmt = _FLEET_FORMATS.get(os.path.splitext(path)[1].lower(), 'parquet')
+        if fmt != 'csv' and pyarrow is None:
+            path, fmt = f"{os.path.splitext(path)[0]}.csv", 'csv'
+            logger.warning(f"pyarrow is not installed, --fleet-export falls back to CSV: {path}")
+        self.path = path
+        self.format = fmt
+        self.fields = list(fields or ())
+        self.columns: dict[str, list[Any]] = {name: [] for name in _FLEET_COLUMNS + tuple(f[0] for f in self.fields)}
+        self.by_command: dict[str, list[tuple[str, str]]] = {}
+        for name, command, key in self.fields:
+            self.by_command.setdefault(command, []).append((name, key))
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.columns['address'])
+
+    def record(self, address: str, port: int, success: bool, skipped: bool, facts: dict[str, Any], seconds: float) -> None:
+        row: dict[str, Any] = {name: facts.get(name) for name in ('identity', 'model', 'version', 'channel', 'updated_to', 'failure', 'error')}
+        row.update(address=address, port=port, seconds=round(seconds, 3))
+        row['status'] = 'ok' if success else 'skipped' if skipped else 'failed'
+        fields = facts.get('fields', {})
+        with self._lock:
+            for name, column in self.columns.items():
+                column.append(row[name] if name in row else fields.get(name))
+
+    def table(self) -> dict[str, list[Any]]:
+        with self._lock:
+            return {name: _fleet_values(values) for name, values in self.columns.items()}
+
+    def close(self) -> str:
+        columns = self.table()
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if self.format == 'csv':
+            with open(self.path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerows(zip(*columns.values()))
+        else:
+            table = pyarrow.table(columns)
+            if self.format == 'parquet':
+                pyarrow.parquet.write_table(table, self.path)
+            else:
+                pyarrow.feather.write_feather(table, self.path)
+        return self.path
+
+
+def _load_fleet(path: str) -> Any:
+    # A pyarrow Table for any format when pyarrow is installed, else CSV columns of strings
+    fmt = _FLEET_FORMATS.get(os.path.splitext(path)[1].lower(), 'parquet')
+    if pyarrow is not None:
+        if fmt == 'parquet':
+            return pyarrow.parquet.read_table(path)
+        if fmt == 'arrow':
+            return pyarrow.feather.read_table(path)
+        # Keep "7.16" or an all-digit identity as text
+        text_columns = {name: pyarrow.string() for name in _FLEET_COLUMNS if name not in ('port', 'seconds')}
+        return pyarrow.csv.read_csv(path, convert_options=pyarrow.csv.ConvertOptions(column_types=text_columns))
+    if fmt != 'csv':
+        raise ValueError(f"reading {path} needs pyarrow")
+    with open(path, encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        names = next(reader, [])
+        rows = list(reader)
+    return {name: [row[i] or None for row in rows] for i, name in enumerate(names)}
+
+
+def _fleet_column(data: Any, name: str) -> Any:
+    return data.column(name) if pyarrow is not None and isinstance(data, pyarrow.Table) else data[name]
+
+
+def _value_counts(column: Any) -> collections.Counter[Any]:
+    if pyarrow is not None and isinstance(column, (pyarrow.Array, pyarrow.ChunkedArray)):
+        return collections.Counter({row['values']: row['counts'] for row in pyarrow.compute.value_counts(column).to_pylist()})
+    return collections.Counter(column)
+
+
+def _numeric_histogram(column: Any, bins: int = _FLEET_BINS) -> list[tuple[float, float, int]] | None:
+    # Equal-width bins over [min, max]; None when the column is not numeric
+    if pyarrow is not None and isinstance(column, (pyarrow.Array, pyarrow.ChunkedArray)):
+        if not (pyarrow.types.is_integer(column.type) or pyarrow.types.is_floating(column.type)):
+            return None
+        bounds = pyarrow.compute.min_max(column).as_py()
+        low, high = bounds['min'], bounds['max']
+        if low is None:
+            return []
+        width = (high - low) / bins or 1.0
+        index = pyarrow.compute.floor(pyarrow.compute.divide(pyarrow.compute.subtract(pyarrow.compute.cast(column, pyarrow.float64()), low), width))
+        counts = _value_counts(pyarrow.compute.min_element_wise(index, float(bins - 1)))
+    else:
+        try:
+            values = array.array('d', (float(v) for v in column if v is not None and v != ''))
+        except (TypeError, ValueError):
+            return None
+        if not values:
+            return []
+        low, high = min(values), max(values)
+        width = (high - low) / bins or 1.0
+        counts = collections.Counter(min(int((v - low) // width), bins - 1) for v in values)
+    return [(low + i * width, low + (i + 1) * width, counts.get(i, 0)) for i in range(bins)]
+
+
+def fleet_summary(data: Any, fields: list[str] | None = None) -> dict[str, Any]:
+    # Version and model distributions, out-of-date count and field histograms. Works on value
+    # counts rather than rows, so 100k routers take milliseconds.
+    status = _value_counts(_fleet_column(data, 'status'))
+    if pyarrow is not None and isinstance(data, pyarrow.Table):
+        updated, version = data.column('updated_to'), data.column('version')
+        # A column with no values at all has the null type
+        current = version if pyarrow.types.is_null(updated.type) else pyarrow.compute.coalesce(updated, version.cast(updated.type))
+    else:
+        current = [updated or version for updated, version in zip(data['updated_to'], data['version'])]
+    versions = _value_counts(current)
+    versions.pop(None, None)
+    keyed = {version: _version_key(str(version)) for version in versions}
+    newest = max((v for v in keyed if keyed[v] is not None), key=lambda v: keyed[v], default=None)
+    out_of_date = sum(count for version, count in versions.items() if keyed[version] is not None and keyed[version] < keyed[newest])
+    models = _value_counts(_fleet_column(data, 'model'))
+    models.pop(None, None)
+    summary: dict[str, Any] = {
+        'routers': sum(status.values()),
+        'status': dict(status),
+        'newest': newest,
+        'out_of_date': out_of_date,
+        'versions': versions.most_common(_FLEET_TOP),
+        'models': models.most_common(_FLEET_TOP),
+        'fields': {},
+    }
+    for name in fields or ():
+        column = _fleet_column(data, name)
+        histogram = _numeric_histogram(column)
+        if histogram is None:
+            counts = _value_counts(column)
+            counts.pop(None, None)
+            summary['fields'][name] = counts.most_common(_FLEET_TOP)
+        else:
+            summary['fields'][name] = histogram
+    return summary
+
+
+def _format_fleet_summary(summary: dict[str, Any]) -> list[str]:
+    status = summary['status']
+    lines = [
+        f"Fleet: {summary['routers']} routers ({status.get('ok', 0)} ok, {status.get('failed', 0)} failed, {status.get('skipped', 0)} skipped)",
+        f"Versions (newest {summary['newest'] or '-'}, {summary['out_of_date']} out of date):",
+    ]
+    lines += [f"  {version:<24} {count:>8}" for version, count in summary['versions']]
+    lines.append("Models:")
+    lines += [f"  {model:<24} {count:>8}" for model, count in summary['models']]
+    for name, buckets in summary['fields'].items():
+        lines.append(f"{name}:")
+        for bucket in buckets:
+            if len(bucket) == 3:
+                lines.append(f"  {bucket[0]:>10.6g} - {bucket[1]:<10.6g} {bucket[2]:>8}")
+            else:
+                lines.append(f"  {str(bucket[0]):<24} {bucket[1]:>8}")
+    return lines
+
+
+# Hosts waiting for a host-level retry. Each one still counts as an unfinished task of the work
+# queue, so q.join() keeps waiting; the scheduler thread puts it back when its delay is over,
+# behind whatever fresh hosts are already queued.
+class DeferredHosts:
+    def __init__(self, work_queue: queue.Queue[Any], stop_event: threading.Event) -> None:
+        self.q = work_queue
+        self.stop_event = stop_event
+        self.attempts: dict[tuple[str, int], int] = {}
+        self.retried = 0
+        self._heap: list[tuple[float, int, Any]] = []
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def next_attempt(self, host_info: tuple[str, int, str | None, str | None, int], max_attempts: int) -> int | None:
+        # Counts a retry of the host; None once it has used all of them
+        key = (host_info[0], host_info[1])
+        with self._cond:
+            attempt = self.attempts.get(key, 0)
+            if attempt >= max_attempts:
+                return None
+            self.attempts[key] = attempt + 1
+            return attempt
+
+    def defer(self, host_info: tuple[str, int, str | None, str | None, int], delay: float) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, self.retried, host_info))
+            self.retried += 1
+            self._cond.notify()
+
+    def _run(self) -> None:
+        with self._cond:
+            while not self.stop_event.is_set():
+                wait = self._heap[0][0] - time.monotonic() if self._heap else 1.0
+                if wait > 0:
+                    self._cond.wait(min(wait, 1.0))
+                    continue
+                _, _, host_info = heapq.heappop(self._heap)
+                self.q.put(host_info)
+                self.q.task_done()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="Deferred", daemon=True)
+        self._thread.start()
+
+    def clear(self) -> None:
+        with self._cond:
+            for _ in self._heap:
+                try:
+                    self.q.task_done()
+                except ValueError:
+                    break
+            self._heap.clear()
+
+
+class Dashboard:
+    def __init__(self, updater: MassUpdater, total: int, mode: str, interval: float, pbar: tqdm[Any] | None = None) -> None:
+        self.updater = updater
+        self.total = total
+        self.mode = mode
+        self.interval = interval
+        self.pbar = pbar
+        self._started = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def snapshot(self) -> dict[str, Any]:
+        now = time.monotonic()
+        ok = failed = 0
+        phases: collections.Counter[str] = collections.Counter()
+        in_flight = []
+        for slot in list(self.updater.slots):
+            ok += slot.ok
+            failed += slot.failed
+            host = slot.host
+            if host is not None:
+                phases[slot.phase or 'starting'] += 1
+                in_flight.append((now - slot.started, host, slot.phase or 'starting'))
+        unresponsive = self.updater._unresponsive_count
+        retrying = len(self.updater.deferred)
+        done = ok + failed + unresponsive
+        elapsed = now - self._started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - done)
+        in_flight.sort(reverse=True)
+        peak = _peak_memory_bytes()
+        return {
+            'elapsed': round(elapsed, 1),
+            'total': self.total,
+            'done': done,
+            'ok': ok,
+            'failed': failed,
+            'unresponsive': unresponsive,
+            'retrying': retrying,
+            'phases': dict(phases),
+            'hosts_per_min': round(rate * 60, 1),
+            'eta': round(remaining / rate, 1) if rate > 0 else None,
+            'slowest': [{'host': host, 'phase': phase, 'seconds': round(age, 1)} for age, host, phase in in_flight[:3]],
+            'peak_memory_mb': round(peak / 1048576, 1) if peak is not None else None,
+        }
+
+    def render(self, final: bool = False) -> None:
+        snap = self.snapshot()
+        if self.mode == 'json':
+            snap['event'] = 'done' if final else 'heartbeat'
+            tqdm.write(json.dumps(snap, sort_keys=True))
+            return
+        if self.pbar is None:
+            return
+        parts = [f"ok={snap['ok']} fail={snap['failed']}"]
+        if snap['retrying']:
+            parts[0] += f" retry={snap['retrying']}"
+        if snap['phases']:
+            parts.append(" ".join(f"{phase}:{count}" for phase, count in sorted(snap['phases'].items())))
+        parts.append(f"{snap['hosts_per_min']}/min")
+        if snap['eta'] is not None and not final:
+            parts.append(f"ETA {_format_duration(snap['eta'])}")
+        if snap['slowest']:
+            slowest = snap['slowest'][0]
+            parts.append(f"slowest {slowest['host']} {slowest['phase']} {slowest['seconds']:.0f}s")
+        self.pbar.n = snap['done']
+        self.pbar.set_postfix_str(" | ".join(parts), refresh=False)
+        self.pbar.refresh()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.render()
+
+    def start(self) -> None:
+        if self.mode == 'none':
+            return
+        self._thread = threading.Thread(target=self._run, name="Dashboard", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self.render(final=True)
+
+
 class MassUpdater:
     def __init__(self, args: argparse.Namespace) -> None:
         self.args = args
-        self.q: queue.Queue[tuple[str, int, str | None, str | None, bool]] = queue.Queue()
+        self.q: queue.Queue[tuple[str, int, str | None, str | None, int]] = queue.Queue()
         self.threads: list[threading.Thread] = []
         self.stop_event: threading.Event = threading.Event()
-        self.aggregated_results: list[dict[str, Any]] = []
+        self.results = RunResults(args.result_spill_threshold)
         self._start_time: float = 0.0
-        self._processed_count: int = 0
-        self._success_count: int = 0
+        self._unresponsive_count: int = 0
+        self.slots: list[_WorkerSlot] = []
+        self.deferred = DeferredHosts(self.q, self.stop_event)
+        self.host_retry = RetryPolicy(args.host_retries, args.host_retry_delay, args.host_retry_max_delay)
+        self._queue_closed = False
+        self._recovered_count = 0
+        self.archive: ExportArchive | None = None
+        self.host_logs: HostLogStore | None = None
+        self.history: RunHistory | None = None
+        self.fleet: FleetExport | None = None
+        self.inventory: Inventory | None = None
+        self.state: StateStore | None = None
+        self.credential_sets: list[tuple[str, str | None]] = []
+        self.staged: dict[str, tuple[str | None, bool]] = {}
+        self.breaker: SegmentBreaker | None = None
+        if args.breaker_threshold:
+            self.breaker = SegmentBreaker(args.breaker_threshold, args.segment_prefix, probe_after=args.breaker_probe_after)
 
     def _load_custom_commands(self) -> list:
         custom_commands: list = []
@@ -527,7 +3637,9 @@ class MassUpdater:
                     loaded_commands = yaml.safe_load(f)
                     if loaded_commands:
                         for item in loaded_commands:
-                            if 'params' in item:
+                            if 'menu' in item:
+                                custom_commands.append(DesiredState.from_yaml(item))
+                            elif 'params' in item:
                                 custom_commands.append((item['command'], item['params']))
                             else:
                                 custom_commands.append(item['command'])
@@ -538,6 +3650,60 @@ class MassUpdater:
                 logger.error(f"Error parsing custom commands file: {e}")
         return custom_commands
 
+    def _load_credentials(self) -> list[tuple[str, str | None]]:
+        credential_sets: list[tuple[str, str | None]] = []
+        if self.args.credentials:
+            try:
+                with open(self.args.credentials, 'r', encoding='utf-8') as f:
+                    for item in yaml.safe_load(f) or []:
+                        credential_sets.append((str(item['username']), item.get('password')))
+                logger.info(f"Loaded {len(credential_sets)} credential sets from {self.args.credentials}")
+            except FileNotFoundError:
+                logger.error(f"Credentials file not found: {self.args.credentials}")
+            except Exception as e:
+                logger.error(f"Error parsing credentials file: {e}")
+        return credential_sets
+
+    def _login_chain(
+        self,
+        host_info: tuple[str, int, str | None, str | None, int],
+        default_username: str,
+        default_password: str,
+    ) -> CredentialChain:
+        IP, _, custom_username, custom_password, _ = host_info
+        if custom_username or custom_password:
+            # Credentials on the IP list line are the only ones tried for that host
+            candidates = [(custom_username or default_username, custom_password or default_password)]
+        else:
+            candidates = [(default_username, default_password)] + self.credential_sets
+        credentials: list[tuple[str, str | None]] = []
+        for candidate in candidates:
+            if candidate[0] and candidate not in credentials:
+                credentials.append(candidate)
+
+        if self.state:
+            credentials = self.state.order_credentials(IP, credentials)
+        max_failures = self.args.max_login_failures
+        if max_failures:
+            recent_failures = self.state.login_failures(IP) if self.state else 0
+            credentials = credentials[:max(0, max_failures - recent_failures)]
+        return CredentialChain(credentials)
+
+    def _host_timing(self, IP: str) -> HostTiming | None:
+        # RTTs are sampled whenever there is a state store; timeouts only adapt with --adaptive-timeouts
+        if not self.state:
+            return None
+        default_timeout = max(30, self.args.timeout)
+        if not self.args.adaptive_timeouts:
+            return HostTiming(None, None, default_timeout)
+        learned = {
+            kind: min(self.args.timeout_ceiling, max(self.args.timeout_floor, self.args.timeout_multiplier * p99))
+            for kind, p99 in self.state.rtt_p99(IP).items()
+        }
+        command_timeout = learned.get('command')
+        slow_timeout = max(default_timeout, command_timeout or 0.0)
+        return HostTiming(learned.get('connect'), command_timeout, slow_timeout)
+
     def _load_ip_list(self) -> list[str]:
         with open(self.args.ip_list, 'r', encoding='utf-8') as f:
             lines = [
@@ -546,11 +3712,24 @@ class MassUpdater:
             ]
         return lines
 
+    def _load_hosts(self) -> list[Any]:
+        if not self.inventory:
+            return self._load_ip_list()
+        rows = self.inventory.select(self.args.select)
+        hosts = []
+        for address, port, username, password, flags, site in rows:
+            if site and self.breaker:
+                self.breaker.sites[address] = site
+            hosts.append((address, port, username, password, flags))
+        logger.info(f"Selected {len(hosts)} hosts from inventory {self.args.inventory}")
+        return hosts
+
     def _run_commands_on_router(
         self,
         api: librouteros.Connection,
         custom_commands: list,
         entry_lines: list[str],
+        facts: dict[str, Any] | None = None,
     ) -> bool:
         default_commands_map: dict[str, Any] = {
             '/system/identity/print': _process_identity,
@@ -565,15 +3744,23 @@ class MassUpdater:
         ] + custom_commands
 
         command_execution_successful = True
+        menu_rows: dict[str, list[dict[str, Any]]] = {}
         for command_item in all_commands_to_process:
+            if isinstance(command_item, DesiredState):
+                if not _apply_desired_state(api, command_item, menu_rows, entry_lines, self.args.dry_run):
+                    command_execution_successful = False
+                continue
             command_path = command_item[0] if isinstance(command_item, tuple) else command_item
             response = _execute_router_command(api, command_item, entry_lines)
             if response is None:
                 command_execution_successful = False
                 continue
 
+            if self.fleet is not None and facts is not None and response and command_path in self.fleet.by_command:
+                for name, key in self.fleet.by_command[command_path]:
+                    facts.setdefault('fields', {})[name] = response[0].get(key)
             if command_path in default_commands_map:
-                default_commands_map[command_path](response, entry_lines)
+                default_commands_map[command_path](response, entry_lines, facts)
             else:
                 entry_lines.append(f"  Response for {command_path}:\n")
                 for res_item in response:
@@ -583,7 +3770,7 @@ class MassUpdater:
 
     def _process_host(
         self,
-        host_info: tuple[str, int, str | None, str | None, bool],
+        host_info: tuple[str, int, str | None, str | None, int],
         custom_commands: list,
         cloud_password: str | None,
         upgrade_firmware: bool,
@@ -594,53 +3781,150 @@ class MassUpdater:
         global_ssl: bool,
         default_username: str,
         default_password: str,
+        facts: dict[str, Any] | None = None,
+        phases: dict[str, float] | None = None,
     ) -> tuple[bool, list[str]]:
         entry_lines: list[str] = []
         IP, port, _, _, _ = host_info
         entry_lines.append(f"\nHost: {IP}\n")
         api: librouteros.Connection | None = None
 
+        login = self._login_chain(host_info, default_username, default_password)
+        timing = _host_timing.current = self._host_timing(IP)
+        connect_timeout = timing.connect_timeout if timing and timing.connect_timeout else timeout
+        if timing and (timing.connect_timeout or timing.command_timeout):
+            logger.debug(f"{IP}: adaptive timeouts connect={timing.connect_timeout} command={timing.command_timeout}")
+
         try:
-            api = _connect_to_router(host_info, default_username, default_password, timeout, global_ssl)
+            with _phase(phases, 'connect', port=port):
+                try:
+                    connect_started = time.perf_counter()
+                    api = _connect_to_router(
+                        host_info, default_username, default_password, connect_timeout, global_ssl, login,
+                        exact_timeout=connect_timeout != timeout,
+                    )
+                    if timing:
+                        timing.connect_rtts.append(time.perf_counter() - connect_started)
+                except Exception as e:
+                    if self.breaker:
+                        self.breaker.record(IP, reachable=not _is_unreachable_error(e))
+                    raise
+                finally:
+                    if self.state:
+                        self.state.record_login(IP, login.failures, login.used)
+                if self.breaker:
+                    self.breaker.record(IP, reachable=True)
+            if login.index > 0:
+                entry_lines.append(
+                    f"  Logged in as '{login.used[0]}' with credential set {login.index + 1} of {len(login.credentials)}\n"
+                )
 
-            commands_ok = self._run_commands_on_router(api, custom_commands, entry_lines)
+            if self.args.reboot_staged:
+                staged_version, staged_firmware = self.staged[IP]
+                with _phase(phases, 'reboot'):
+                    success = _reboot_staged(api, staged_version, staged_firmware, entry_lines, dry_run)
+                if success and not dry_run and self.state:
+                    self.state.record_staged(IP, None, False)
+                return success, entry_lines
+
+            if self.args.collect:
+                with _phase(phases, 'collect'):
+                    success = _collect_offload(api, entry_lines, dry_run, facts)
+                return success, entry_lines
+
+            with _phase(phases, 'commands'):
+                commands_ok = self._run_commands_on_router(api, custom_commands, entry_lines, facts)
             if not commands_ok:
                 return False, entry_lines
 
             success = True
+            if self.archive:
+                with _phase(phases, 'export_backup'):
+                    export_success = _perform_export_backup(api, self.archive, IP, entry_lines)
+                    if self.args.export_binary:
+                        _save_binary_backup(api, entry_lines)
+                if not export_success:
+                    entry_lines.append("  Warning: Export backup failed. Proceeding with updates regardless.\n")
+
             if cloud_password:
-                backup_success = _perform_cloud_backup(api, cloud_password, entry_lines, dry_run)
+                backed_up_at = self.state.cloud_backup_at(IP) if self.state else None
+                backup_facts: dict[str, Any] = {}
+                with _phase(phases, 'cloud_backup'):
+                    backup_success = _perform_cloud_backup(
+                        api, cloud_password, entry_lines, dry_run,
+                        self.args.cloud_backup_max_age * 3600, backed_up_at, backup_facts,
+                    )
+                if self.state and 'cloud_backup_at' in backup_facts:
+                    self.state.record_cloud_backup(IP, backup_facts['cloud_backup_at'])
                 if not backup_success:
                     entry_lines.append("  Warning: Cloud backup failed. Proceeding with updates regardless.\n")
 
+            if self.args.offload:
+                with _phase(phases, 'offload'):
+                    success = _start_offload(
+                        api, entry_lines, dry_run, upgrade_firmware, update_check_attempts, update_check_delay,
+                    )
+                return success, entry_lines
+
             firmware_upgraded = False
             if success and upgrade_firmware:
-                firmware_upgrade_status = _perform_firmware_upgrade(api, entry_lines, dry_run)
+                with _phase(phases, 'firmware_upgrade'):
+                    firmware_upgrade_status = _perform_firmware_upgrade(api, entry_lines, dry_run)
                 if firmware_upgrade_status is False:
                     success = False
                 elif firmware_upgrade_status is True:
                     firmware_upgraded = True
 
-            if success:
-                reboot_triggered = _check_and_process_updates(
-                    api, entry_lines, dry_run, update_check_attempts, update_check_delay
-                )
+            if success and self.args.download_only:
+                # Firmware upgrades and packages both wait for the --reboot-staged window
+                with _phase(phases, 'update_check'):
+                    checked = _check_for_updates(
+                        api, entry_lines, update_check_attempts, update_check_delay,
+                        follow=self.args.update_status == 'follow',
+                    )
+                if checked is None:
+                    return False, entry_lines
+                with _phase(phases, 'download'):
+                    success, staged_version = _download_updates(
+                        api, checked[0], entry_lines, dry_run, update_check_attempts, update_check_delay,
+                    )
+                if success and not dry_run and self.state:
+                    self.state.record_staged(IP, staged_version, firmware_upgraded)
+            elif success:
+                with _phase(phases, 'update_check'):
+                    reboot_triggered = _check_and_process_updates(
+                        api, entry_lines, dry_run, update_check_attempts, update_check_delay,
+                        follow=self.args.update_status == 'follow', facts=facts,
+                    )
                 if not reboot_triggered and firmware_upgraded:
-                    _reboot_router(api, entry_lines)
+                    with _phase(phases, 'reboot'):
+                        _reboot_router(api, entry_lines)
 
             return success, entry_lines
 
         except librouteros.exceptions.TrapError as e:
             msg = getattr(e, 'message', '') or str(e)
             entry_lines.append(f"  Error: {msg}\n")
+            if facts is not None:
+                facts['error'] = type(e).__name__
+                facts['failure'] = _classify_failure(e)
             return False, entry_lines
-        except TimeoutError:
-            entry_lines.append(f"  Error: Connection timed out ({IP}:{port})\n")
+        except TimeoutError as e:
+            entry_lines.append(f"  Error: Connection timed out ({_format_endpoint(IP, port)})\n")
+            if facts is not None:
+                facts['error'] = type(e).__name__
+                facts['failure'] = _classify_failure(e)
             return False, entry_lines
         except socket.error as e:
-            entry_lines.append(f"  Error: Connection failed ({IP}:{port}) - {e.strerror or e}\n")
+            if facts is not None:
+                facts['error'] = type(e).__name__
+                facts['failure'] = _classify_failure(e)
+            entry_lines.append(f"  Error: Connection failed ({_format_endpoint(IP, port)}) - {e.strerror or e}\n")
             return False, entry_lines
         except Exception as e:
+            if facts is not None:
+                facts['error'] = type(e).__name__
+                facts['failure'] = _classify_failure(e)
             if IP:
                  entry_lines.append(f"  Unexpected error processing host {IP}: {type(e).__name__}: {e}\n")
             else:
@@ -652,6 +3936,9 @@ class MassUpdater:
                     api.close()
                 except Exception:
                     pass
+            _host_timing.current = None
+            if timing and self.state:
+                self.state.record_rtts(IP, timing.connect_rtts, timing.command_rtts)
 
     def _worker(
         self,
@@ -663,46 +3950,90 @@ class MassUpdater:
         update_check_attempts: int,
         update_check_delay: float,
         upgrade_firmware: bool,
-        pbar: tqdm[Any],
         custom_commands: list,
         global_ssl: bool,
     ) -> None:
+        slot = _worker_slot.slot = _WorkerSlot()
+        self.slots.append(slot)
         while not self.stop_event.is_set():
             try:
                 host_info = self.q.get(timeout=1)
             except queue.Empty:
                 if self.stop_event.is_set():
                     logger.debug(f"Worker {threading.current_thread().name} exiting due to stop_event.")
-                return
-
-            IP, _, _, _, _ = host_info
+                    return
+                # Hosts may still arrive from discovery or the deferred retries
+                if self._queue_closed and not len(self.deferred):
+                    return
+                continue
 
-            success, entry_lines = self._process_host(
-                host_info, custom_commands, cloud_password, upgrade_firmware,
-                dry_run, update_check_attempts, update_check_delay,
-                timeout, global_ssl, default_username, default_password,
-            )
+            IP, port, _, _, _ = host_info
+            facts: dict[str, Any] = {}
+            phases: dict[str, float] = {}
+            host_started = time.perf_counter()
+            slot.started = time.monotonic()
+            slot.host = IP
+            segment = self.breaker.segment_of(IP) if self.breaker else None
+            skipped = segment is not None and not self.breaker.allow(segment)
+
+            if skipped:
+                success, entry_lines = False, [f"\nHost: {IP}\n  Skipped: segment unreachable ({segment})\n"]
+            else:
+                _command_errors.last = None
+                with tracer.span('host', host=IP) as host_span:
+                    success, entry_lines = self._process_host(
+                        host_info, custom_commands, cloud_password, upgrade_firmware,
+                        dry_run, update_check_attempts, update_check_delay,
+                        timeout, global_ssl, default_username, default_password, facts, phases,
+                    )
+                    host_span.set(success=success)
+                # A failed step whose command error was caught and logged is classified by that error
+                if not success and 'failure' not in facts and _command_errors.last is not None:
+                    facts['error'] = type(_command_errors.last).__name__
+                    facts['failure'] = _classify_failure(_command_errors.last)
+            duration = time.perf_counter() - host_started
+            if self.inventory and facts:
+                self.inventory.update_facts(IP, port, facts)
+            retry_delay = None if success or skipped else self._host_retry_delay(host_info, facts)
+            if retry_delay is not None:
+                slot.host = None
+                self._log_deferred(host_info, facts, entry_lines, retry_delay)
+                self.deferred.defer(host_info, retry_delay)
+                # Not task_done: the host is still pending until its last attempt
+                continue
+            if success and (IP, port) in self.deferred.attempts:
+                self._recovered_count += 1
+            if self.state and not skipped:
+                self.state.record_run(IP, phases, success)
+            if self.history:
+                self.history.record(IP, success, _error_class(success, skipped, facts, phases), facts, duration, phases)
+            if self.fleet is not None:
+                self.fleet.record(IP, port, success, skipped, facts, duration)
+            slot.host = None
+            if success:
+                slot.ok += 1
+            else:
+                slot.failed += 1
 
             if not entry_lines:
                 entry_lines = [f"\nHost: {IP}\n  No operations performed or error before logging started.\n"]
 
             final_entry_text = "".join(entry_lines).strip()
+            if self.host_logs:
+                # The full entry goes to the host log; the job log keeps one line per host
+                self.host_logs.write(IP, facts.get('identity'), success, final_entry_text)
+                last_line = final_entry_text.splitlines()[-1].strip()
+                final_entry_text = f"Host: {IP} - OK" if success else f"Host: {IP} - FAILED: {last_line}"
 
             with log_lock:
-                if final_entry_text:
+                if final_entry_text and not self.host_logs:
                     logger.info("─" * 50)
                 if success:
                     logger.info(final_entry_text)
                 else:
                     logger.error(final_entry_text)
 
-                self.aggregated_results.append({"IP": IP, "success": success})
-                self._processed_count += 1
-                if success:
-                    self._success_count += 1
-                fail_count = self._processed_count - self._success_count
-                pbar.set_postfix(ok=self._success_count, fail=fail_count)
-                pbar.update(1)
+            self.results.record(IP, success, skipped, duration)
 
             if not self.stop_event.is_set():
                 try:
@@ -710,10 +4041,48 @@ class MassUpdater:
                 except ValueError:
                     logger.debug(f"ValueError on q.task_done() in {threading.current_thread().name}.")
 
+    def _write_fleet_export(self) -> None:
+        try:
+            path = self.fleet.close()
+        except OSError as e:
+            logger.error(f"Could not write the fleet export: {e}")
+            return
+        logger.info(f"Fleet export with {len(self.fleet)} routers written to {path}")
+        summary = fleet_summary(self.fleet.table(), [name for name, _, _ in self.fleet.fields])
+        for line in _format_fleet_summary(summary):
+            logger.info(line)
+
+    def _host_retry_delay(self, host_info: tuple[str, int, str | None, str | None, int], facts: dict[str, Any]) -> float | None:
+        # Only transient failures are retried, each host at most --host-retries times
+        if facts.get('failure', 'logic') != 'transient' or not self.args.host_retries or self.stop_event.is_set():
+            return None
+        attempt = self.deferred.next_attempt(host_info, self.args.host_retries)
+        if attempt is None:
+            return None
+        return self.host_retry.delay(attempt)
+
+    def _log_deferred(
+        self,
+        host_info: tuple[str, int, str | None, str | None, int],
+        facts: dict[str, Any],
+        entry_lines: list[str],
+        delay: float,
+    ) -> None:
+        IP, port = host_info[0], host_info[1]
+        attempt = self.deferred.attempts[(IP, port)]
+        notice = f"Host: {IP} - transient failure ({facts.get('error')}), retry {attempt}/{self.args.host_retries} in {delay:.0f}s"
+        text = "".join(entry_lines).strip()
+        if self.host_logs:
+            self.host_logs.write(IP, facts.get('identity'), False, f"{text}\n  {notice}")
+            text = notice
+        else:
+            text = f"{text}\n  {notice}"
+        with log_lock:
+            logger.warning(text)
+
     def _start_workers(
         self,
         thread_count: int,
-        pbar: tqdm[Any],
         custom_commands: list,
     ) -> None:
         for i in range(thread_count):
@@ -723,21 +4092,81 @@ class MassUpdater:
                     self.args.username, self.args.password, self.args.cloud_password,
                     self.args.timeout, self.args.dry_run,
                     self.args.update_check_attempts, self.args.update_check_delay,
-                    self.args.upgrade_firmware, pbar, custom_commands, self.args.ssl
+                    self.args.upgrade_firmware, custom_commands, self.args.ssl
                 ),
                 name=f"Worker-{i + 1}"
             )
             self.threads.append(t)
             t.start()
 
-    def _populate_queue(self, lines: list[str]) -> None:
+    def _parse_targets(self, lines: list[Any]) -> list[tuple[Any, tuple[type, range] | None]]:
+        targets: list[tuple[Any, tuple[type, range] | None]] = []
         for line_content in lines:
+            # Inventory selections are already parsed
+            host_info = line_content if isinstance(line_content, tuple) else parse_host_line(line_content, self.args.port)
+            if not host_info:
+                continue
+            try:
+                addresses = _target_range(host_info[0])
+            except ValueError as e:
+                logger.warning(f"Skipping malformed address range '{host_info[0]}': {e}")
+                continue
+            targets.append((host_info, addresses))
+        return targets
+
+    def _resolve_hostnames(self, targets: list[tuple[Any, tuple[type, range] | None]]) -> None:
+        hosts = {host_info[0]: host_info[1] for host_info, addresses in targets if addresses is None}
+        hostnames = [host for host in hosts if DnsCache.needs_lookup(host)]
+        if not hostnames:
+            return
+        started = time.perf_counter()
+        failed = dns_cache.prefetch(((host, hosts[host]) for host in hostnames), self.args.dns_concurrency)
+        logger.info(
+            f"Resolved {len(hostnames) - failed} of {len(hostnames)} hostnames in {time.perf_counter() - started:.1f}s"
+        )
+
+    def _staged_targets(self, targets: list[tuple[Any, tuple[type, range] | None]]) -> list[tuple[Any, None]]:
+        # Only hosts recorded by a --download-only run; range entries are matched without probing
+        staged_targets: list[tuple[Any, None]] = []
+        for host_info, addresses in targets:
+            if addresses is None:
+                if host_info[0] in self.staged:
+                    staged_targets.append((host_info, None))
+                continue
+            address_type, numbers = addresses
+            for host in self.staged:
+                try:
+                    address = ipaddress.ip_address(host)
+                except ValueError:
+                    continue
+                if isinstance(address, address_type) and int(address) in numbers:
+                    staged_targets.append(((host, *host_info[1:]), None))
+        return staged_targets
+
+    def _populate_queue(self, targets: list[tuple[Any, tuple[type, range] | None]]) -> None:
+        ranges = []
+        for host_info, addresses in targets:
             if self.stop_event.is_set():
                 logger.warning("Interruption detected, stopping queue population.")
-                break
-            host_info = parse_host_line(line_content, self.args.port)
-            if host_info:
+                return
+            if addresses is None:
                 self.q.put(host_info)
+            else:
+                ranges.append((host_info, addresses))
+        if ranges:
+            self._discover_hosts(ranges)
+
+    def _discover_hosts(self, ranges: list[tuple[Any, tuple[type, range]]]) -> None:
+        # Only addresses whose API port answers are queued; the rest just advance the progress bar
+        candidates = (expanded for host_info, addresses in ranges for expanded in _expand_target(host_info, addresses))
+        probes = _probe_api_ports(candidates, self.args.discover_concurrency, self.args.discover_timeout, self.stop_event)
+        for host_info, responsive in probes:
+            if responsive:
+                self.q.put(host_info)
+            else:
+                self._unresponsive_count += 1
+        if self.stop_event.is_set():
+            logger.warning("Interruption detected, stopping discovery.")
 
     def _wait_for_completion(self) -> None:
         self.q.join()
@@ -749,6 +4178,7 @@ class MassUpdater:
     def _cleanup_after_interrupt(self) -> None:
         if self.stop_event.is_set():
             logger.warning("Clearing queue due to interruption...")
+            self.deferred.clear()
             while not self.q.empty():
                 try:
                     self.q.get_nowait()
@@ -762,10 +4192,10 @@ class MassUpdater:
                 t.join(timeout=1)
 
     def _print_summary(self) -> bool:
-        total_hosts_processed = len(self.aggregated_results)
-        successful_ops = sum(1 for res in self.aggregated_results if res["success"])
-        failed_ops = total_hosts_processed - successful_ops
-        failed_ips = [res["IP"] for res in self.aggregated_results if not res["success"]]
+        results = self.results
+        total_hosts_processed = results.processed
+        successful_ops = results.ok
+        failed_ops = results.failed
         elapsed = time.time() - self._start_time
 
         title = "JOB SUMMARY"
@@ -782,22 +4212,184 @@ class MassUpdater:
             f" Elapsed time          : {elapsed:.1f}s",
             f"========================================",
         ]
+        if results.skipped:
+            summary_lines.insert(-2, f" Skipped (segment down): {results.skipped}")
+        if self._unresponsive_count:
+            summary_lines.insert(-2, f" Not responding (range): {self._unresponsive_count}")
+        if self.deferred.retried:
+            summary_lines.insert(-1, f" Host retries          : {self.deferred.retried} ({self._recovered_count} recovered)")
+        if retry_budget is not None and retry_budget.denied:
+            summary_lines.insert(-1, f" Retries over budget   : {retry_budget.denied}")
+        if results.durations:
+            p50, p95 = results.percentile(0.5), results.percentile(0.95)
+            summary_lines.insert(-1, f" Host time p50 / p95   : {p50:.1f}s / {p95:.1f}s")
+        peak = _peak_memory_bytes()
+        if peak is not None:
+            summary_lines.insert(-1, f" Peak memory           : {peak / 1048576:.1f} MiB")
 
         logger.info("\n".join(summary_lines))
 
         if failed_ops > 0:
             logger.info(" Failed IPs:")
-            for specific_ip in failed_ips:
-                if specific_ip != "Unknown (worker exited early)":
-                    logger.error(f"  [FAIL] - {specific_ip}")
+            for specific_ip in results.failed_hosts():
+                logger.error(f"  [FAIL] - {specific_ip}")
+            for specific_ip in results.skipped_hosts():
+                logger.error(f"  [SKIP] - {specific_ip}")
             logger.info("========================================")
+        results.close()
         logger.info("-- Job finished --")
         logging.shutdown()
         return failed_ops > 0
 
+    def _planned_phases(self) -> list[str]:
+        phases = ['connect', 'commands']
+        if self.args.export_archive:
+            phases.append('export_backup')
+        if self.args.cloud_password:
+            phases.append('cloud_backup')
+        if self.args.reboot_staged:
+            return ['connect', 'reboot']
+        if self.args.collect:
+            return ['connect', 'collect']
+        if self.args.offload:
+            return phases + ['offload']
+        if self.args.upgrade_firmware:
+            phases.append('firmware_upgrade')
+            if not self.args.download_only:
+                phases.append('reboot')
+        phases.append('update_check')
+        if self.args.download_only:
+            phases.append('download')
+        return phases
+
+    def _estimate_hosts(self, lines: list[Any], timings: dict[str, dict[str, float]]) -> list[str]:
+        hosts: list[str] = []
+        for host_info, addresses in self._parse_targets(lines):
+            if addresses is None:
+                hosts.append(host_info[0])
+                continue
+            # Only addresses of a range that answered in an earlier run count
+            address_type, numbers = addresses
+            for host in timings:
+                try:
+                    address = ipaddress.ip_address(host)
+                except ValueError:
+                    continue
+                if isinstance(address, address_type) and int(address) in numbers:
+                    hosts.append(host)
+        return hosts
+
+    def estimate(self) -> bool:
+        if not self.args.state_db:
+            logger.error("--estimate needs --state-db with timings recorded by earlier runs")
+            return True
+        if self.args.inventory:
+            self.inventory = Inventory(self.args.inventory)
+        try:
+            lines = self._load_hosts()
+        except FileNotFoundError:
+            logger.error(f"IP list file not found: {self.args.ip_list}")
+            return True
+        except InventorySelectError as e:
+            logger.error(f"Invalid --select expression: {e}")
+            return True
+        finally:
+            if self.inventory:
+                self.inventory.close()
+        state = StateStore(self.args.state_db)
+        timings, last_success = state.timings()
+        staged = state.staged()
+        state.close()
+
+        if self.args.reboot_staged:
+            self.staged = staged
+            hosts = [host_info[0] for host_info, _ in self._staged_targets(self._parse_targets(lines))]
+        else:
+            hosts = self._estimate_hosts(lines, timings)
+        phases = self._planned_phases()
+        medians = {}
+        for phase in phases:
+            values = [host_timings[phase] for host_timings in timings.values() if phase in host_timings]
+            if values:
+                medians[phase] = statistics.median(values)
+        update_check_cap = self.args.update_check_attempts * self.args.update_check_delay + 2.0
+        default_update_check = min(3, self.args.update_check_attempts) * self.args.update_check_delay + 2.0
+
+        # Pessimistic case: each host uses its share of the retry budget for one command retried to the limit
+        retries = self.args.retries
+        retry_cost = sum(
+            min(self.args.retry_max_delay, self.args.retry_base_delay * 2 ** attempt) / 2 + max(30, self.args.timeout)
+            for attempt in range(retries - 1)
+        )
+        retry_share = self.args.retry_budget or 1.0
+
+        expected: list[float] = []
+        pessimistic: list[float] = []
+        for host in hosts:
+            host_timings = timings.get(host, {})
+            duration = 0.0
+            for phase in phases:
+                default = default_update_check if phase == 'update_check' else _DEFAULT_PHASE_SECONDS[phase]
+                seconds = host_timings.get(phase, medians.get(phase, default))
+                duration += min(seconds, update_check_cap) if phase == 'update_check' else seconds
+            expected.append(duration)
+            pessimistic.append(duration + retry_cost * (retry_share if last_success.get(host, True) else 1.0))
+
+        threads = self.args.threads
+        wall, critical = simulate_schedule(expected, threads)
+        worst_wall, _ = simulate_schedule(pessimistic, threads)
+        known = sum(1 for host in hosts if host in timings)
+
+        summary_lines = [
+            f"\n\n========================================",
+            f"             JOB ESTIMATE                ",
+            f"========================================",
+            f" Hosts                 : {len(hosts)} ({known} with timings)",
+            f" Threads               : {threads}",
+            f" Expected wall time    : {_format_duration(wall)}",
+            f" Pessimistic wall time : {_format_duration(worst_wall)}",
+            f"========================================",
+        ]
+        if critical:
+            slowest = sorted(critical, key=lambda i: expected[i], reverse=True)[:3]
+            summary_lines.insert(-1, f" Critical path         : {len(critical)} hosts on one worker, slowest:")
+            for index in slowest:
+                summary_lines.insert(-1, f"   {hosts[index]:<20} {_format_duration(expected[index])}")
+        if self.args.estimate_window:
+            window = self.args.estimate_window * 60
+            recommended = recommend_threads(expected, window)
+            if recommended is None:
+                longest = max(expected)
+                reason = (f"longest host alone takes {_format_duration(longest)}" if longest > window
+                          else f"not even with {_ESTIMATE_MAX_THREADS} threads")
+                summary_lines.insert(-1, f" Recommended threads   : none fits {_format_duration(window)} ({reason})")
+            else:
+                summary_lines.insert(-1, f" Recommended threads   : {recommended} for a {_format_duration(window)} window")
+        logger.info("\n".join(summary_lines))
+        return False
+
     def run(self) -> bool:
         custom_commands = self._load_custom_commands()
+        if self.args.export_archive:
+            self.archive = ExportArchive(self.args.export_archive)
+        if self.args.host_logs:
+            self.host_logs = HostLogStore(self.args.host_logs, self.args.host_log_shards)
+            removed = self.host_logs.prune(self.args.host_logs_max_age, self.args.host_logs_max_size * 1024 * 1024)
+            if removed:
+                logger.info(f"Pruned {len(removed)} old host log run(s) from {self.args.host_logs}")
+            self.host_logs.start_run()
+        if self.args.inventory:
+            self.inventory = Inventory(self.args.inventory)
+        if self.args.state_db:
+            self.state = StateStore(self.args.state_db)
+        if self.args.history_db:
+            self.history = RunHistory(self.args.history_db)
+            self.history.start_run(self.args)
+        if self.args.fleet_export:
+            self.fleet = FleetExport(self.args.fleet_export, self.args.fleet_field)
+        self.credential_sets = self._load_credentials()
         pbar: tqdm[Any] | None = None
+        dashboard: Dashboard | None = None
         file_not_found = False
         self._start_time = time.time()
 
@@ -805,33 +4397,83 @@ class MassUpdater:
             logger.info("-- Starting job --")
 
             try:
-                lines = self._load_ip_list()
+                lines = self._load_hosts()
             except FileNotFoundError:
                 logger.error(f"IP list file not found: {self.args.ip_list}")
                 file_not_found = True
                 return True
+            except InventorySelectError as e:
+                logger.error(f"Invalid --select expression: {e}")
+                file_not_found = True
+                return True
 
-            total_hosts = len(lines)
-            desc = "[DRY RUN] Processing hosts" if self.args.dry_run else "Processing hosts"
-            pbar = tqdm(total=total_hosts, desc=desc, unit="host")
-            pbar.set_postfix(ok=0, fail=0)
-
-            self._start_workers(self.args.threads, pbar, custom_commands)
-            self._populate_queue(lines)
+            targets = self._parse_targets(lines)
+            if self.args.reboot_staged:
+                self.staged = self.state.staged()
+                targets = self._staged_targets(targets)
+                logger.info(f"Rebooting {len(targets)} staged host(s)")
+            total_hosts = sum(1 if addresses is None else len(addresses[1]) for _, addresses in targets)
+            if dns_cache:
+                self._resolve_hostnames(targets)
+            mode = self.args.progress
+            if mode == 'auto':
+                mode = 'bar' if sys.stderr.isatty() else 'json'
+            if mode == 'bar':
+                desc = "[DRY RUN] Processing hosts" if self.args.dry_run else "Processing hosts"
+                pbar = tqdm(total=total_hosts, desc=desc, unit="host")
+                pbar.set_postfix(ok=0, fail=0)
+            interval = _DASHBOARD_REFRESH if mode == 'bar' else self.args.heartbeat_interval
+            dashboard = Dashboard(self, total_hosts, mode, interval, pbar)
+            dashboard.start()
+
+            self.deferred.start()
+            self._start_workers(self.args.threads, custom_commands)
+            self._populate_queue(targets)
+            self._queue_closed = True
             self._wait_for_completion()
 
         except KeyboardInterrupt:
             self._handle_interrupt()
         finally:
-            if pbar:
-                pbar.close()
+            self._queue_closed = True
             self._cleanup_after_interrupt()
             self._join_threads()
+            if dashboard:
+                dashboard.stop()
+            if pbar:
+                pbar.close()
+            tracer.close()
+            if profiler:
+                profiler.close()
+            rest_sessions.close()
+            if self.archive:
+                self.archive.close()
+            if self.host_logs:
+                self.host_logs.close()
+            if self.history:
+                self.history.finish_run()
+                self.history.close()
+            if self.fleet is not None:
+                self._write_fleet_export()
+            if self.inventory:
+                self.inventory.close()
+            if self.state:
+                self.state.close()
             if not file_not_found:
                 return self._print_summary()
         return True
 
 
+def _format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, secs = divmod(int(round(seconds)), 60)
+    if minutes < 60:
+        return f"{minutes}m{secs:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{secs:02d}s"
+
+
 def _apply_config_file(parser: argparse.ArgumentParser) -> None:
     known, _ = parser.parse_known_args()
     if not known.config:
@@ -861,33 +4503,307 @@ def _parse_args() -> argparse.Namespace:
     parser.add_argument("--timeout", type=_positive_int, default=5, help="Connection timeout in seconds (min: 1, effectively clamped to 30)")
     parser.add_argument("--ip-list", default='list.txt', help="Path to the IP list file.")
     parser.add_argument("--port", type=_port_type, default=8728, help="Default API port (1-65535).")
+    parser.add_argument("--fleet-export", help="Write one row per router (inventory facts, status, custom fields) to this Parquet, Arrow IPC (.arrow) or CSV file; CSV when pyarrow is missing.")
+    parser.add_argument("--fleet-field", type=_parse_fleet_field, action="append", default=[], metavar="NAME=/COMMAND:KEY", help="Add a --fleet-export column with KEY from the first row COMMAND returned (repeatable), e.g. cpu=/system/resource/print:cpu-load.")
+    parser.add_argument("--history-db", metavar="FILE", help="Record every run's per-host results in this SQLite file (see the 'report' subcommand).")
+    parser.add_argument("--host-logs", metavar="DIR", help="Write each host's log entry to compressed, indexed per-run shards in DIR (see the 'logs' subcommand); the job log keeps one line per host.")
+    parser.add_argument("--host-log-shards", type=_positive_int, default=_HOST_LOG_SHARDS, help="Shard files per run for --host-logs.")
+    parser.add_argument("--host-logs-max-age", type=_non_negative_float, default=0, help="Remove host log runs older than this many days at startup. 0 keeps all.")
+    parser.add_argument("--host-logs-max-size", type=_non_negative_float, default=0, help="Remove the oldest host log runs at startup until the total is under this many MB. 0 means no limit.")
+    parser.add_argument("--dns-ttl", type=_non_negative_float, default=0.0, help="Pre-resolve hostnames and cache the answers for this many seconds, shared by workers and retries (default 0: off).")
+    parser.add_argument("--dns-concurrency", type=_positive_int, default=64, help="Parallel hostname lookups when pre-resolving the IP list.")
+    parser.add_argument("--adaptive-timeouts", action="store_true", help="Derive each host's connect and command timeouts from the p99 of its round-trip times kept in --state-db.")
+    parser.add_argument("--timeout-multiplier", type=_positive_float, default=4.0, help="With --adaptive-timeouts, timeout = multiplier x observed p99.")
+    parser.add_argument("--timeout-floor", type=_positive_float, default=2.0, help="Lowest adaptive timeout in seconds.")
+    parser.add_argument("--timeout-ceiling", type=_positive_float, default=120.0, help="Highest adaptive timeout in seconds.")
+    rollout = parser.add_mutually_exclusive_group()
+    rollout.add_argument("--download-only", action="store_true", help="Download available updates (and stage firmware upgrades) without rebooting; record the staged hosts in --state-db.")
+    rollout.add_argument("--reboot-staged", action="store_true", help="Only reboot the hosts staged by an earlier --download-only run.")
+    rollout.add_argument("--offload", action="store_true", help="Install a script on each router that checks, upgrades firmware (with --upgrade-firmware) and installs updates on its own, start it and disconnect.")
+    rollout.add_argument("--collect", action="store_true", help="Read the outcome of the jobs started with --offload.")
     parser.add_argument("--update-check-attempts", type=_positive_int, default=15, help="Number of attempts to check update status (min: 1).")
     parser.add_argument("--update-check-delay", type=_positive_float, default=2.0, help="Delay in seconds between update status checks (must be positive).")
+    parser.add_argument("--update-status", choices=['poll', 'follow'], default='poll', help="Wait for the update check by polling, or by following status changes (falls back to polling when unsupported).")
     parser.add_argument("--no-colors", action="store_true", help="Disable colored output")
     parser.add_argument("--dry-run", action="store_true", help="Enable dry run mode")
     parser.add_argument("--start-line", type=_positive_int, default=1, help="Start from this line number (min: 1)")
     parser.add_argument("--debug", action="store_true", help="Enable debug logging level.")
     parser.add_argument("--cloud-password", help="Password for cloud backup")
+    parser.add_argument("--cloud-backup-max-age", type=_non_negative_float, default=0.0, metavar="HOURS", help="Keep a cloud backup younger than this many hours instead of replacing it (0 always backs up). Backup times are also kept in --state-db.")
     parser.add_argument("--upgrade-firmware", action="store_true", help="Perform firmware upgrade")
     parser.add_argument("--ssl", action="store_true", help="Enable SSL for all connections")
     parser.add_argument("--custom-commands", help="Path to a YAML file with custom commands.")
+    parser.add_argument("--discover-concurrency", type=_positive_int, default=256, help="Parallel API port probes when expanding CIDR/range entries (min: 1).")
+    parser.add_argument("--discover-timeout", type=_positive_float, default=1.0, help="Seconds to wait for the API port of a CIDR/range address to answer.")
+    parser.add_argument("--inventory", help="Take hosts from this inventory database instead of --ip-list, and record the model/version seen.")
+    parser.add_argument("--select", help="With --inventory, only process hosts matching this expression, e.g. \"model=hAP* and version<7\".")
+    parser.add_argument("--credentials", help="Path to a YAML list of fallback credential sets (username/password), tried in order after -u/-p.")
+    parser.add_argument("--max-login-failures", type=_non_negative_int, default=5, help="Stop trying credential sets on a host after this many failed logins in the last hour (0 disables).")
+    parser.add_argument("--state-db", help="SQLite file that keeps per-host state between runs, such as the credential set that worked.")
+    parser.add_argument("--estimate", action="store_true", help="Predict the job's wall time offline from timings kept in --state-db, without connecting.")
+    parser.add_argument("--estimate-window", type=_positive_float, help="With --estimate, recommend the smallest thread count that fits this many minutes.")
+    parser.add_argument("--retries", type=_positive_int, default=3, help="Attempts per command on socket/timeout errors (min: 1).")
+    parser.add_argument("--retry-base-delay", type=_non_negative_float, default=5.0, help="Base delay in seconds for exponential backoff with full jitter.")
+    parser.add_argument("--retry-max-delay", type=_non_negative_float, default=60.0, help="Upper bound in seconds for a single backoff delay.")
+    parser.add_argument("--host-retries", type=_non_negative_int, default=0, help="Times a host that failed for a transient reason (timeout, connection error) is queued again, later in the run (default 0: off).")
+    parser.add_argument("--host-retry-delay", type=_non_negative_float, default=30.0, help="Base delay in seconds before a host is retried, doubled per attempt with full jitter.")
+    parser.add_argument("--host-retry-max-delay", type=_non_negative_float, default=300.0, help="Upper bound for a host retry delay.")
+    parser.add_argument("--result-spill-threshold", type=_positive_int, default=_RESULT_SPILL_THRESHOLD, help="Failed/skipped host addresses kept in memory before they are moved to a temporary file.")
+    parser.add_argument("--cloud-retries", type=_positive_int, default=3, help="Attempts per cloud command on transient cloud errors (min: 1).")
+    parser.add_argument("--cloud-retry-base-delay", type=_non_negative_float, default=5.0, help="Base backoff delay in seconds for transient cloud errors.")
+    parser.add_argument("--retry-budget", type=_fraction, default=0.0, help="Stop retrying fleet-wide when retries exceed this fraction of calls in the last minute (default 0: no budget).")
+    parser.add_argument("--export-archive", help="Export each router's configuration into this local deduplicated archive directory.")
+    parser.add_argument("--export-binary", action="store_true", help="With --export-archive, also save a binary backup on each router.")
+    parser.add_argument("--breaker-threshold", type=_non_negative_int, default=0, help="Skip the rest of a network segment after this many consecutive connect failures in it (0 disables).")
+    parser.add_argument("--segment-prefix", type=_prefix_length, default=24, help="IPv4 prefix length that defines a network segment for the circuit breaker.")
+    parser.add_argument("--breaker-probe-after", type=_non_negative_float, default=0.0, help="Seconds after tripping before one host of the segment is probed again (0 never re-probes).")
+    parser.add_argument("--progress", choices=['auto', 'bar', 'json', 'none'], default='auto', help="Live progress: a bar with per-phase counts, one-line JSON heartbeats, or nothing ('auto' picks json when stderr is not a terminal).")
+    parser.add_argument("--heartbeat-interval", type=_positive_float, default=30.0, help="Seconds between JSON heartbeats with --progress json.")
+    parser.add_argument("--record", help="Record sanitized API transcripts with timings, one file per host, into this directory.")
+    parser.add_argument("--trace", help="Write a Chrome trace event file (JSON) with per-host spans to this path.")
+    parser.add_argument("--profile", help="Sample all threads during the run and write folded stacks (for flame graphs) to this path and a short report to PATH.txt.")
+    parser.add_argument("--profile-interval", type=_positive_float, default=10.0, help="Milliseconds between --profile samples.")
     parser.add_argument("--config", help="Path to a YAML configuration file. CLI arguments override config file values.")
     parser.add_argument("--version", action="version", version="5.2.0")
 
     _apply_config_file(parser)
     args = parser.parse_args()
 
-    if not args.username:
+    if not args.username and not args.credentials and not args.estimate:
         parser.error("the following arguments are required: -u/--username")
+    if (args.download_only or args.reboot_staged) and not args.state_db:
+        parser.error("--download-only and --reboot-staged require --state-db")
+    if args.adaptive_timeouts and not args.state_db:
+        parser.error("--adaptive-timeouts requires --state-db")
+    if args.select and not args.inventory:
+        parser.error("--select requires --inventory")
+    if args.select:
+        try:
+            _SelectCompiler(args.select).compile()
+        except InventorySelectError as e:
+            parser.error(f"Invalid --select expression: {e}")
+    try:
+        # Values from the config file skip the argparse type
+        args.fleet_field = [f if isinstance(f, tuple) else _parse_fleet_field(f) for f in args.fleet_field]
+    except argparse.ArgumentTypeError as e:
+        parser.error(f"--fleet-field: {e}")
+    if args.fleet_field and not args.fleet_export:
+        parser.error("--fleet-field requires --fleet-export")
 
     return args
 
 
+def _parse_timestamp(value: str) -> float:
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(value, fmt))
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"Expected 'YYYY-MM-DD[ HH:MM[:SS]]', got '{value}'")
+
+
+def _archive_command(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="mkmassupdate.py archive", description="Browse the configuration export archive")
+    parser.add_argument("--archive", required=True, help="Archive directory used with --export-archive.")
+    sub = parser.add_subparsers(dest="action", required=True)
+    list_parser = sub.add_parser("list", help="List snapshots, optionally for one host.")
+    list_parser.add_argument("host", nargs='?')
+    show_parser = sub.add_parser("show", help="Print a host's export.")
+    show_parser.add_argument("host")
+    show_parser.add_argument("--at", type=_parse_timestamp, help="Latest snapshot at or before this date (YYYY-MM-DD[ HH:MM[:SS]]).")
+    sub.add_parser("stats", help="Show deduplication and compression statistics.")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(os.path.join(args.archive, 'index.sqlite')):
+        parser.error(f"No archive found in {args.archive}")
+    archive = ExportArchive(args.archive)
+    try:
+        if args.action == 'list':
+            for host, taken_at, digest in archive.history(args.host):
+                print(f"{host:<40} {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(taken_at))}  {digest[:12]}")
+        elif args.action == 'show':
+            text = archive.get(args.host, args.at)
+            if text is None:
+                print(f"No snapshot for {args.host}", file=sys.stderr)
+                return 1
+            sys.stdout.write(text)
+        else:
+            for key, value in archive.stats().items():
+                print(f"{key:<14}: {value}")
+    finally:
+        archive.close()
+    return 0
+
+
+def _inventory_command(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="mkmassupdate.py inventory", description="Manage the host inventory database")
+    parser.add_argument("--db", required=True, help="Inventory database file (created if missing).")
+    sub = parser.add_subparsers(dest="action", required=True)
+    import_parser = sub.add_parser("import", help="Import or update hosts from an IP list file.")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--port", type=_port_type, default=8728, help="Default API port for lines without one.")
+    import_parser.add_argument("--site", help="Site assigned to the imported hosts.")
+    import_parser.add_argument("--tag", action="append", default=[], help="Tag added to the imported hosts (repeatable).")
+    select_parser = sub.add_parser("select", help="Print matching hosts in IP list format.")
+    select_parser.add_argument("expr", nargs='?')
+    select_parser.add_argument("--details", action="store_true", help="Show site, model, version and channel instead.")
+    tag_parser = sub.add_parser("tag", help="Add or remove tags on matching hosts.")
+    tag_parser.add_argument("expr")
+    tag_parser.add_argument("--add", action="append", default=[])
+    tag_parser.add_argument("--remove", action="append", default=[])
+    site_parser = sub.add_parser("set-site", help="Assign a site to matching hosts.")
+    site_parser.add_argument("expr")
+    site_parser.add_argument("site")
+    args = parser.parse_args(argv)
+
+    inventory = Inventory(args.db)
+    try:
+        if args.action == 'import':
+            with open(args.file, encoding='utf-8') as f:
+                count = inventory.import_lines(f, args.port, args.site, args.tag)
+            print(f"Imported {count} hosts into {args.db}")
+        elif args.action == 'select':
+            if args.details:
+                for row in inventory.details(args.expr):
+                    print("  ".join('-' if value is None else str(value) for value in row))
+            else:
+                for address, port, username, password, flags, _ in inventory.select(args.expr):
+                    line = _format_endpoint(address, port)
+                    if username or password:
+                        line += f"|{username or ''}|{password or ''}"
+                    print(line + _host_flags_suffix(flags))
+        elif args.action == 'tag':
+            print(f"Updated tags on {inventory.tag(args.expr, args.add, args.remove)} hosts")
+        else:
+            print(f"Assigned site to {inventory.set_site(args.expr, args.site)} hosts")
+    except InventorySelectError as e:
+        parser.error(f"Invalid expression: {e}")
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    finally:
+        inventory.close()
+    return 0
+
+
+def _logs_command(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="mkmassupdate.py logs", description="Look up per-host logs written with --host-logs")
+    parser.add_argument("--dir", required=True, help="Directory used with --host-logs.")
+    sub = parser.add_subparsers(dest="action", required=True)
+    lookup_parser = sub.add_parser("lookup", help="Print a host's log entries, newest first.")
+    lookup_parser.add_argument("host", help="Address or router identity.")
+    lookup_parser.add_argument("--limit", type=_positive_int, help="Only the N most recent entries.")
+    sub.add_parser("runs", help="List the runs kept, with their size and host count.")
+    prune_parser = sub.add_parser("prune", help="Remove old runs.")
+    prune_parser.add_argument("--max-age", type=_non_negative_float, default=0, help="Remove runs older than this many days.")
+    prune_parser.add_argument("--max-size", type=_non_negative_float, default=0, help="Remove the oldest runs until the total is under this many MB.")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(os.path.join(args.dir, 'index.sqlite')):
+        parser.error(f"No host logs found in {args.dir}")
+    store = HostLogStore(args.dir)
+    try:
+        if args.action == 'lookup':
+            entries = store.lookup(args.host, args.limit)
+            if not entries:
+                print(f"No log entries for {args.host}", file=sys.stderr)
+                return 1
+            for run_id, logged, host, identity, success, text in entries:
+                when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(logged))
+                print(f"=== {when}  run {run_id}  {host}{f' ({identity})' if identity else ''}  {'OK' if success else 'FAILED'}")
+                print(text)
+        elif args.action == 'runs':
+            for run_id, started, size, hosts in store.runs():
+                print(f"{run_id:<24} {hosts:>7} hosts {size / 1024:>10.1f} KiB")
+        else:
+            removed = store.prune(args.max_age, int(args.max_size * 1024 * 1024))
+            print(f"Removed {len(removed)} run(s)")
+    finally:
+        store.close()
+    return 0
+
+
+def _report_command(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="mkmassupdate.py report", description="Query the run history written with --history-db")
+    parser.add_argument("--db", required=True, help="History database used with --history-db.")
+    sub = parser.add_subparsers(dest="action", required=True)
+    runs_parser = sub.add_parser("runs", help="List recent runs.")
+    runs_parser.add_argument("--limit", type=_positive_int, default=20)
+    failing_parser = sub.add_parser("failing", help="Hosts failing in at least --min of the last --runs runs.")
+    failing_parser.add_argument("--runs", type=_positive_int, default=5)
+    failing_parser.add_argument("--min", type=_positive_int, default=3)
+    failing_parser.add_argument("--include-dry-run", action="store_true", help="Count dry runs too.")
+    sub.add_parser("versions", help="RouterOS version distribution, from each host's latest result.")
+    durations_parser = sub.add_parser("durations", help="Median and p90 phase durations.")
+    durations_parser.add_argument("--phase", default="update_check", help="Phase name, or 'total' for the whole host. Default: update_check.")
+    durations_parser.add_argument("--by", choices=("model", "version", "host"), default="model")
+    durations_parser.add_argument("--runs", type=_positive_int, default=10)
+    host_parser = sub.add_parser("host", help="One host's results, newest first.")
+    host_parser.add_argument("host", help="Address or router identity.")
+    host_parser.add_argument("--limit", type=_positive_int, default=20)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"History database not found: {args.db}")
+    history = RunHistory(args.db)
+    try:
+        if args.action == 'runs':
+            for run_id, started, finished, dry_run, hosts, failed in history.runs(args.limit):
+                when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))
+                took = _format_duration(finished - started) if finished else 'unfinished'
+                print(f"#{run_id:<6} {when}  {hosts:>7} hosts {failed:>6} failed  {took:>10}{'  (dry run)' if dry_run else ''}")
+        elif args.action == 'failing':
+            for host, failures, seen, error in history.failing(args.runs, args.min, args.include_dry_run):
+                print(f"{host:<40} failed {failures}/{seen}  {error or ''}")
+        elif args.action == 'versions':
+            for version, count in history.versions():
+                print(f"{version or 'unknown':<24} {count:>7}")
+        elif args.action == 'durations':
+            print(f"{args.by:<32} {'hosts':>7} {'median':>10} {'p90':>10}")
+            for group, count, median, p90 in history.durations(args.phase, args.by, args.runs):
+                print(f"{group:<32} {count:>7} {_format_duration(median):>10} {_format_duration(p90):>10}")
+        else:
+            for run_id, started, success, error, version, updated_to, duration in history.host_history(args.host, args.limit):
+                when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))
+                change = f"{version} -> {updated_to}" if updated_to else (version or '-')
+                print(f"#{run_id:<6} {when}  {'OK' if success else 'FAILED':<6} {change:<24} {_format_duration(duration):>8}  {error or ''}")
+    finally:
+        history.close()
+    return 0
+
+
+def _fleet_command(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="mkmassupdate.py fleet", description="Summarize a dataset written with --fleet-export")
+    parser.add_argument("file", help="Parquet, Arrow IPC (.arrow/.feather) or CSV file.")
+    parser.add_argument("--field", action="append", default=[], help="Also show the distribution of this custom field (repeatable).")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.file):
+        parser.error(f"Fleet export not found: {args.file}")
+    try:
+        data = _load_fleet(args.file)
+        summary = fleet_summary(data, args.field)
+    except (ValueError, KeyError) as e:
+        parser.error(str(e))
+    print("\n".join(_format_fleet_summary(summary)))
+    return 0
+
+
+_SUBCOMMANDS = {
+    'archive': _archive_command,
+    'fleet': _fleet_command,
+    'inventory': _inventory_command,
+    'logs': _logs_command,
+    'report': _report_command,
+}
+
+
 def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] in _SUBCOMMANDS:
+        sys.exit(_SUBCOMMANDS[sys.argv[1]](sys.argv[2:]))
     try:
         args = _parse_args()
 
-        if not args.password:
+        if args.username and not args.password and not args.estimate:
             args.password = getpass.getpass(f"Enter password for user '{args.username}': ")
 
         if args.ssl and args.port == 8728:
@@ -895,8 +4811,16 @@ def main() -> None:
 
         _setup_logger(not args.no_colors, args.debug)
 
+        _setup_tracer(args.trace)
+        _setup_profiler(args.profile, args.profile_interval)
+        _setup_retry(args)
+        _setup_recorder(args.record)
+        _setup_dns_cache(args.dns_ttl)
+
         updater = MassUpdater(args)
-        has_failures = updater.run()
+        has_failures = updater.estimate() if args.estimate else updater.run()
+        if profiler:
+            profiler.close()
         sys.exit(1 if has_failures else 0)
     except KeyboardInterrupt:
         os._exit(1)
@@ -0,0 +1,19 @@
+import pytest
+import os
+import tempfile
+
+
+@pytest.fixture
+def ip_list_file():
+    paths = []
+
+    def _write(lines):
+        tmp = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8')
+        tmp.write("\n".join(lines) + "\n")
+        tmp.close()
+        paths.append(tmp.name)
+        return tmp.name
+
+    yield _write
+    for path in paths:
+        os.unlink(path)
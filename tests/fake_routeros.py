@@ -0,0 +1,774 @@
+# Fake RouterOS API server for integration tests and benchmarks.
+#
+# Speaks the binary API wire protocol (plain or anonymous-cipher TLS like API-SSL)
+# and simulates the parts of RouterOS that mkmassupdate.py talks to. Every local
+# address the server is reached on is a separate simulated router, so a server
+# bound to 0.0.0.0 can stand in for thousands of routers at 127.x.y.z on Linux.
+#
+# ReplayRouterOSServer plays back transcripts written by mkmassupdate.py --record,
+# at real or accelerated speed, to reproduce a production run offline.
+#
+# Standalone:  python -m tests.fake_routeros --port 8728 --latency 0.05 --checking-polls 3
+#              python -m tests.fake_routeros --replay recordings/ --speed 10 --write-ip-list replay.txt
+
+from __future__ import annotations
+
+import argparse
+import base64
+import glob
+import http.server
+import json
+import os
+import random
+import socket
+import socketserver
+import ssl
+import sys
+import threading
+import time
+from typing import Any
+
+from librouteros.protocol import decode_length, determine_length, encode_sentence
+
+Reply = tuple[str, dict[str, Any]]
+
+
+class RouterProfile:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        drop_rate: float = 0.0,
+        checking_polls: int = 1,
+        check_duration: float = 0.0,
+        supports_follow: bool = True,
+        cloud_delay: float = 0.0,
+        cloud_list_delay: float = 0.0,
+        check_error: str | None = None,
+        reboot_time: float = 0.5,
+        installed_version: str = '7.14.3',
+        latest_version: str = '7.15.2',
+        current_firmware: str = '7.14.3',
+        upgrade_firmware: str = '7.15.2',
+        board_name: str = 'RB750Gr3',
+        channel: str = 'stable',
+        username: str = 'admin',
+        password: str = 'test',
+        close_after_failed_login: bool = False,
+        seed: int | None = None,
+    ) -> None:
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.checking_polls = checking_polls
+        self.check_duration = check_duration
+        self.supports_follow = supports_follow
+        self.cloud_delay = cloud_delay
+        self.cloud_list_delay = cloud_list_delay
+        self.check_error = check_error
+        self.reboot_time = reboot_time
+        self.installed_version = installed_version
+        self.latest_version = latest_version
+        self.current_firmware = current_firmware
+        self.upgrade_firmware = upgrade_firmware
+        self.board_name = board_name
+        self.channel = channel
+        self.username = username
+        self.password = password
+        self.close_after_failed_login = close_after_failed_login
+        self.seed = seed
+
+
+class SimulatedRouter:
+    def __init__(self, address: str, profile: RouterProfile) -> None:
+        self.address = address
+        self.profile = profile
+        self.lock = threading.Lock()
+        self.identity = f"router-{address}"
+        # Generic menus for desired-state commands; passwords are write-only as on RouterOS
+        self.tables: dict[str, list[dict[str, str]]] = {
+            '/user': [{'.id': '*0', 'name': 'admin', 'group': 'full', 'disabled': 'false', 'password': ''}],
+            '/ip/dns/static': [],
+        }
+        self.installed_version = profile.installed_version
+        self.latest_version = profile.latest_version
+        self.current_firmware = profile.current_firmware
+        self.upgrade_firmware = profile.upgrade_firmware
+        self.pending_firmware: str | None = None
+        self.update_status = 'System is already up to date'
+        self.checks_remaining = 0
+        self.check_done_at = 0.0
+        self.rebooting_until = 0.0
+        self.reboots = 0
+        self.commands: list[str] = []
+        self.cloud_backups: list[dict[str, Any]] = []
+        self.cloud_listed_at = 0.0
+        self.scripts: dict[str, dict[str, Any]] = {}
+        self.files: dict[str, str] = {}
+        self.config_lines = [
+            '/interface bridge',
+            'add name=bridge',
+            '/ip address',
+            f'add address={address}/24 interface=bridge',
+            '/system identity',
+            f'set name={self.identity}',
+        ]
+        self._next_id = 1
+        self._random = random.Random(profile.seed if profile.seed is not None else address)
+
+    def is_rebooting(self) -> bool:
+        return time.monotonic() < self.rebooting_until
+
+    def should_drop(self) -> bool:
+        return self.profile.drop_rate > 0 and self._random.random() < self.profile.drop_rate
+
+    def _new_id(self) -> str:
+        item_id = f"*{self._next_id:X}"
+        self._next_id += 1
+        return item_id
+
+    def _reboot(self) -> None:
+        self.rebooting_until = time.monotonic() + self.profile.reboot_time
+        self.reboots += 1
+        if self.latest_version and self.update_status.startswith(('New version', 'Downloaded')):
+            self.installed_version = self.latest_version
+            self.update_status = 'System is already up to date'
+        if self.pending_firmware:
+            self.current_firmware = self.pending_firmware
+            self.pending_firmware = None
+
+    def _run_offload(self) -> None:
+        script = self.scripts['mkmassupdate_offload']
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        if self.profile.check_error:
+            script['comment'] = f"mkmassupdate {stamp} failed {self.profile.check_error}"
+        elif self.latest_version and self.latest_version != self.installed_version:
+            script['comment'] = f"mkmassupdate {stamp} installing {self.installed_version} {self.latest_version}"
+            self.update_status = 'New version is available'
+            self._reboot()
+        else:
+            script['comment'] = f"mkmassupdate {stamp} up-to-date {self.installed_version}"
+
+    def _update_row(self, final: bool = False) -> dict[str, Any]:
+        if self.checks_remaining > 0 or time.monotonic() < self.check_done_at:
+            self.checks_remaining = max(0, self.checks_remaining - 1)
+            status = 'checking for updates...'
+        else:
+            status = self.update_status
+        if final:
+            status = self.update_status
+        return {
+            'channel': self.profile.channel,
+            'installed-version': self.installed_version,
+            'latest-version': self.latest_version,
+            'status': status,
+        }
+
+    def follow_update(self) -> list[tuple[float, dict[str, Any]]]:
+        # Rows a follow print of /system/package/update streams, with their delays
+        with self.lock:
+            self.commands.append('/system/package/update/print')
+            checking = self.checks_remaining > 0 or time.monotonic() < self.check_done_at
+            rows = [(0.0, self._update_row())]
+            if checking:
+                wait = max(self.check_done_at - time.monotonic(), self.profile.latency * self.checks_remaining)
+                self.checks_remaining = 0
+                rows.append((max(wait, 0.0), self._update_row(final=True)))
+            return rows
+
+    def handle(self, cmd: str, attrs: dict[str, str], queries: dict[str, str]) -> tuple[list[Reply], bool]:
+        # Returns the reply sentences and whether the connection should be closed afterwards.
+        with self.lock:
+            self.commands.append(cmd)
+            if cmd == '/system/identity/print':
+                return [('!re', {'name': self.identity}), ('!done', {})], False
+            if cmd == '/system/routerboard/print':
+                return [('!re', {
+                    'routerboard': 'true',
+                    'board-name': self.profile.board_name,
+                    'model': self.profile.board_name,
+                    'current-firmware': self.current_firmware,
+                    'upgrade-firmware': self.upgrade_firmware,
+                }), ('!done', {})], False
+            if cmd == '/system/resource/print':
+                return [('!re', {
+                    'version': f"{self.installed_version} ({self.profile.channel})",
+                    'build-time': '2026-01-01 00:00:00',
+                    'board-name': self.profile.board_name,
+                    'uptime': '1d2h3m4s',
+                }), ('!done', {})], False
+            if cmd == '/system/package/update/check-for-updates':
+                self.checks_remaining = self.profile.checking_polls
+                self.check_done_at = time.monotonic() + self.profile.check_duration
+                if self.profile.check_error:
+                    self.update_status = self.profile.check_error
+                elif self.latest_version and self.latest_version != self.installed_version:
+                    self.update_status = 'New version is available'
+                return [('!done', {})], False
+            if cmd == '/system/package/update/print':
+                return [('!re', self._update_row()), ('!done', {})], False
+            if cmd == '/system/package/update/install':
+                if not self.update_status.startswith('New version'):
+                    return [('!trap', {'message': 'no new version available'}), ('!done', {})], False
+                self._reboot()
+                return [('!done', {})], True
+            if cmd == '/system/package/update/download':
+                if not self.update_status.startswith('New version'):
+                    return [('!trap', {'message': 'no new version available'}), ('!done', {})], False
+                self.update_status = 'Downloaded, please reboot router to upgrade it'
+                return [('!done', {})], False
+            if cmd == '/system/routerboard/upgrade':
+                self.pending_firmware = self.upgrade_firmware
+                return [('!done', {})], False
+            if cmd == '/system/backup/cloud/print':
+                listed = self.cloud_backups if time.monotonic() >= self.cloud_listed_at else []
+                return [('!re', dict(b)) for b in listed] + [('!done', {})], False
+            if cmd == '/system/backup/cloud/remove-file':
+                ids = set(str(attrs.get('number', '')).split(','))
+                self.cloud_backups = [b for b in self.cloud_backups if b['.id'] not in ids]
+                return [('!done', {})], False
+            if cmd == '/system/backup/cloud/upload-file':
+                if self.profile.cloud_delay:
+                    time.sleep(self.profile.cloud_delay)
+                self.cloud_backups = [{
+                    '.id': self._new_id(),
+                    'name': f"cloud-{int(time.time())}",
+                    'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'secret-download-key': f"key-{self.address}-{self._next_id}",
+                }]
+                self.cloud_listed_at = time.monotonic() + self.profile.cloud_list_delay
+                return [('!done', {})], False
+            if cmd == '/system/script/print':
+                rows = [s for s in self.scripts.values() if all(str(s.get(k)) == v for k, v in queries.items())]
+                return [('!re', dict(r)) for r in rows] + [('!done', {})], False
+            if cmd == '/system/script/add':
+                item_id = self._new_id()
+                self.scripts[attrs['name']] = dict(attrs, **{'.id': item_id})
+                return [('!done', {'ret': item_id})], False
+            if cmd == '/system/script/remove':
+                number = attrs.get('numbers', '')
+                self.scripts = {n: sc for n, sc in self.scripts.items() if number not in (n, sc['.id'])}
+                return [('!done', {})], False
+            if cmd == '/system/script/set':
+                number = attrs.pop('numbers', None) or attrs.pop('.id', '')
+                for name, script in self.scripts.items():
+                    if number in (name, script['.id']):
+                        script.update(attrs)
+                return [('!done', {})], False
+            if cmd == '/execute':
+                # Only the offload job is simulated: it runs to completion in the background
+                if 'mkmassupdate_offload' in attrs.get('script', ''):
+                    self._run_offload()
+                return [('!done', {'ret': '*J1'})], False
+            if cmd == '/system/script/run':
+                script = self.scripts.get(attrs.get('number', ''))
+                if script is None:
+                    return [('!trap', {'message': 'no such item'}), ('!done', {})], False
+                if 'reboot' in script.get('source', ''):
+                    self._reboot()
+                    return [], True
+                return [('!done', {})], False
+            if cmd == '/export':
+                header = f"# {time.strftime('%Y-%m-%d %H:%M:%S')} by RouterOS {self.installed_version}"
+                text = '\n'.join([header, *self.config_lines]) + '\n'
+                if 'file' not in attrs:
+                    return [('!trap', {'message': 'not supported without file'}), ('!done', {})], False
+                self.files[f"{attrs['file']}.rsc"] = text
+                return [('!done', {})], False
+            if cmd == '/system/backup/save':
+                self.files[f"{attrs.get('name', 'backup')}.backup"] = 'binary'
+                return [('!done', {})], False
+            if cmd == '/file/print':
+                rows = [
+                    {'.id': f"*{i:X}", 'name': name, 'size': len(contents), 'contents': contents[:4095]}
+                    for i, (name, contents) in enumerate(self.files.items())
+                    if all(name == v for k, v in queries.items() if k == 'name')
+                ]
+                return [('!re', r) for r in rows] + [('!done', {})], False
+            if cmd == '/file/read':
+                contents = self.files.get(attrs.get('file', ''))
+                if contents is None:
+                    return [('!trap', {'message': 'no such item'}), ('!done', {})], False
+                data = contents.encode('utf-8')
+                offset, size = int(attrs.get('offset', 0)), int(attrs.get('chunk-size', 4096))
+                return [('!re', {'data': data[offset:offset + size].decode('utf-8', errors='replace')}), ('!done', {})], False
+            if cmd == '/file/remove':
+                self.files.pop(attrs.get('numbers', ''), None)
+                return [('!done', {})], False
+            menu, _, action = cmd.rpartition('/')
+            if menu in self.tables:
+                return self._handle_table(self.tables[menu], action, attrs, queries), False
+            if cmd == '/system/clock/print':
+                return [('!re', {'time': time.strftime('%H:%M:%S'), 'date': time.strftime('%Y-%m-%d')}), ('!done', {})], False
+            return [('!trap', {'message': 'no such command prefix', 'category': '0'}), ('!done', {})], False
+
+    def _handle_table(self, rows: list[dict[str, str]], action: str, attrs: dict[str, str], queries: dict[str, str]) -> list[Reply]:
+        if action == 'print':
+            matching = [r for r in rows if all(r.get(k) == v for k, v in queries.items())]
+            return [('!re', {k: v for k, v in r.items() if k != 'password'}) for r in matching] + [('!done', {})]
+        if action == 'add':
+            if 'name' in attrs and any(r.get('name') == attrs['name'] for r in rows):
+                return [('!trap', {'message': 'failure: item with such name already exists'}), ('!done', {})]
+            item_id = self._new_id()
+            rows.append(dict(attrs, **{'.id': item_id}))
+            return [('!done', {'ret': item_id})]
+        if action in ('set', 'remove'):
+            item_id = attrs.pop('.id', None) or attrs.pop('numbers', '')
+            row = next((r for r in rows if r['.id'] == item_id), None)
+            if row is None:
+                return [('!trap', {'message': 'no such item'}), ('!done', {})]
+            if action == 'set':
+                row.update(attrs)
+            else:
+                rows.remove(row)
+            return [('!done', {})]
+        return [('!trap', {'message': 'no such command'}), ('!done', {})]
+
+
+def _apply_proplist(reply: Reply, proplist: str | None) -> Reply:
+    word, row = reply
+    if not proplist or word != '!re':
+        return reply
+    keys = proplist.split(',')
+    return word, {k: v for k, v in row.items() if k in keys}
+
+
+def loopback_address(index: int) -> str:
+    # 127.1.0.1, 127.1.0.2, ... - distinct addresses that all reach a server bound to 0.0.0.0 on Linux
+    index += 1
+    return f"127.{1 + index // 65024}.{(index // 254) % 256}.{1 + index % 254}"
+
+
+def _parse_sentence(words: list[str]) -> tuple[dict[str, str], dict[str, str], str | None]:
+    attrs: dict[str, str] = {}
+    queries: dict[str, str] = {}
+    tag: str | None = None
+    for w in words:
+        if w.startswith('.tag='):
+            tag = w[5:]
+        elif w.startswith('='):
+            key, _, value = w[1:].partition('=')
+            attrs[key] = value
+        elif w.startswith('?') and '=' in w:
+            key, _, value = w.lstrip('?=').partition('=')
+            queries[key] = value
+    return attrs, queries, tag
+
+
+def _encode_replies(replies: list[Reply], tag: str | None) -> list[list[str]]:
+    sentences = []
+    for word, attrs in replies:
+        attr_words = [f"={k}={v}" for k, v in attrs.items()]
+        if tag is not None:
+            attr_words.append(f".tag={tag}")
+        sentences.append([word, *attr_words])
+    return sentences
+
+
+# A session answers one client connection. respond() returns the reply sentences,
+# each with its delay in seconds after the command was received, and whether the
+# connection should be closed afterwards. None means the command is never answered.
+class _SimulatedSession:
+    def __init__(self, router: SimulatedRouter) -> None:
+        self.router = router
+        self.logged_in = False
+        self.following: set[str] = set()
+
+    def respond(self, sentence: list[str]) -> tuple[list[tuple[float, list[str]]], bool] | None:
+        router, profile = self.router, self.router.profile
+        cmd = sentence[0]
+        attrs, queries, tag = _parse_sentence(sentence[1:])
+        if router.should_drop():
+            return None
+
+        if cmd == '/quit':
+            replies: list[Reply] = [('!fatal', {'message': 'session terminated on request'})]
+            close_after = True
+        elif cmd == '/login':
+            if attrs.get('name') == profile.username and attrs.get('password') == profile.password:
+                self.logged_in = True
+                replies, close_after = [('!done', {})], False
+            else:
+                replies = [('!trap', {'message': 'invalid user name or password (6)'}), ('!done', {})]
+                close_after = profile.close_after_failed_login
+        elif not self.logged_in:
+            replies, close_after = [('!trap', {'message': 'not logged in'}), ('!done', {})], False
+        elif cmd == '/system/package/update/print' and 'follow' in attrs:
+            if not profile.supports_follow:
+                replies, close_after = [('!trap', {'message': 'unknown parameter follow'}), ('!done', {})], False
+            else:
+                self.following.add(tag or '')
+                return [
+                    (profile.latency + delay, words)
+                    for delay, row in router.follow_update()
+                    for words in _encode_replies([('!re', row)], tag)
+                ], False
+        elif cmd == '/cancel':
+            followed = attrs.get('tag', '')
+            sentences = []
+            if followed in self.following:
+                self.following.discard(followed)
+                sentences = _encode_replies([('!trap', {'category': '2', 'message': 'interrupted'}), ('!done', {})], followed)
+            sentences += _encode_replies([('!done', {})], tag)
+            return [(profile.latency, words) for words in sentences], False
+        else:
+            replies, close_after = router.handle(cmd, attrs, queries)
+            proplist = attrs.get('.proplist')
+            replies = [_apply_proplist(r, proplist) for r in replies]
+        return [(profile.latency, words) for words in _encode_replies(replies, tag)], close_after
+
+
+# Errors the client saw while waiting for a reply. A timeout is replayed by never
+# answering, anything else by closing the connection.
+_TIMEOUT_ERRORS = ('TimeoutError', 'timeout')
+
+
+class _ReplaySession:
+    def __init__(self, events: list[dict[str, Any]], speed: float) -> None:
+        self.speed = speed
+        self.cursor = 0
+        self.exchanges: list[dict[str, Any]] = []
+        for event in events:
+            if event['dir'] == 'out':
+                self.exchanges.append({'cmd': event['words'][0], 't': event['t'], 'replies': [], 'error': None})
+            elif self.exchanges and event['dir'] == 'in':
+                self.exchanges[-1]['replies'].append((event['t'], event['words']))
+            elif self.exchanges and event['dir'] == 'error':
+                self.exchanges[-1]['error'] = event['error']
+
+    def respond(self, sentence: list[str]) -> tuple[list[tuple[float, list[str]]], bool] | None:
+        cmd = sentence[0]
+        _, _, tag = _parse_sentence(sentence[1:])
+        for index in range(self.cursor, len(self.exchanges)):
+            if self.exchanges[index]['cmd'] == cmd:
+                break
+        else:
+            replies = [('!trap', {'message': f'no recorded reply for {cmd}'}), ('!done', {})]
+            return [(0.0, words) for words in _encode_replies(replies, tag)], False
+
+        exchange = self.exchanges[index]
+        self.cursor = index + 1
+        if not exchange['replies'] and exchange['error'] in _TIMEOUT_ERRORS:
+            return None
+        replies = []
+        for t, words in exchange['replies']:
+            words = [w for w in words if not w.startswith('.tag=')]
+            if tag is not None:
+                words.append(f".tag={tag}")
+            replies.append((max(0.0, t - exchange['t']) / self.speed, words))
+        return replies, exchange['error'] is not None
+
+
+def load_transcripts(directory: str) -> list[tuple[dict[str, Any], list[list[dict[str, Any]]]]]:
+    # Returns (header of the first connection, events of every connection) per recorded host
+    hosts = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.jsonl'))):
+        header: dict[str, Any] | None = None
+        connections: list[list[dict[str, Any]]] = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if 'connect' in record:
+                    header = header or record
+                    connections.append([])
+                elif connections:
+                    connections[-1].append(record)
+        if header is not None:
+            hosts.append((header, connections))
+    return hosts
+
+
+class _RouterOSHandler(socketserver.BaseRequestHandler):
+    server: FakeRouterOSServer
+
+    def _read_exact(self, length: int) -> bytes:
+        data = bytearray()
+        while len(data) < length:
+            chunk = self.request.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError("client closed connection")
+            data += chunk
+        return bytes(data)
+
+    def _read_sentence(self) -> list[str]:
+        words: list[str] = []
+        while True:
+            first = self._read_exact(1)
+            if first == b'\x00':
+                return words
+            prefix = first + self._read_exact(determine_length(first))
+            words.append(self._read_exact(decode_length(prefix)).decode('utf-8', errors='replace'))
+
+    def handle(self) -> None:
+        address = self.request.getsockname()[0]
+        session = self.server.open_session(address)
+        if session is None:
+            return
+        self.server.count_connection()
+        if self.server.use_ssl:
+            try:
+                self.request = self.server.ssl_context.wrap_socket(self.request, server_side=True)
+            except (ssl.SSLError, OSError):
+                return
+
+        try:
+            while True:
+                sentence = self._read_sentence()
+                if not sentence:
+                    continue
+                received = time.monotonic()
+                answer = session.respond(sentence)
+                if answer is None:
+                    continue
+                replies, close_after = answer
+                for delay, words in replies:
+                    wait = received + delay - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                    self.request.sendall(encode_sentence(*words, encoding='utf-8'))
+                if close_after:
+                    return
+        except (ConnectionError, OSError):
+            return
+
+
+class FakeRouterOSServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        profile: RouterProfile | None = None,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        use_ssl: bool = False,
+    ) -> None:
+        self.profile = profile or RouterProfile()
+        self.use_ssl = use_ssl
+        self.routers: dict[str, SimulatedRouter] = {}
+        self.connections = 0
+        self._routers_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        if use_ssl:
+            # Same anonymous-cipher TLS that RouterOS API-SSL offers when no certificate is set
+            self.ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.ssl_context.maximum_version = ssl.TLSVersion.TLSv1_2
+            self.ssl_context.set_ciphers('AECDH-AES256-SHA:AECDH-AES128-SHA:@SECLEVEL=0')
+        self.address_family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        super().__init__((host, port), _RouterOSHandler)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def open_session(self, address: str) -> _SimulatedSession | _ReplaySession | None:
+        router = self.router_for(address)
+        if router.is_rebooting():
+            return None
+        return _SimulatedSession(router)
+
+    def router_for(self, address: str) -> SimulatedRouter:
+        with self._routers_lock:
+            router = self.routers.get(address)
+            if router is None:
+                router = self.routers[address] = SimulatedRouter(address, self.profile)
+            return router
+
+    def count_connection(self) -> None:
+        with self._routers_lock:
+            self.connections += 1
+
+    def start(self) -> FakeRouterOSServer:
+        self._thread = threading.Thread(target=self.serve_forever, name="FakeRouterOS", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> FakeRouterOSServer:
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+class ReplayRouterOSServer(FakeRouterOSServer):
+    def __init__(
+        self,
+        directory: str,
+        speed: float = 1.0,
+        host: str = '0.0.0.0',
+        port: int = 0,
+        use_ssl: bool = False,
+        address_for: Any = loopback_address,
+    ) -> None:
+        self.speed = speed
+        self.recorded: dict[str, tuple[dict[str, Any], list[list[dict[str, Any]]]]] = {}
+        self._next_connection: dict[str, int] = {}
+        for index, recorded_host in enumerate(load_transcripts(directory)):
+            self.recorded[address_for(index)] = recorded_host
+        super().__init__(host=host, port=port, use_ssl=use_ssl)
+
+    def open_session(self, address: str) -> _ReplaySession | None:
+        recorded_host = self.recorded.get(address)
+        if recorded_host is None:
+            return None
+        connections = recorded_host[1]
+        with self._routers_lock:
+            # The Nth connection to a host replays its Nth recorded connection; extra ones repeat the last
+            index = self._next_connection.get(address, 0)
+            self._next_connection[address] = index + 1
+        events = connections[min(index, len(connections) - 1)]
+        if not any(e['dir'] == 'out' for e in events):
+            return None
+        return _ReplaySession(events, self.speed)
+
+    def write_ip_list(self, path: str) -> None:
+        suffix = '|SSL' if self.use_ssl else ''
+        with open(path, 'w', encoding='utf-8') as f:
+            for address, (header, _) in self.recorded.items():
+                f.write(f"# recorded from {header['host']}:{header['port']}\n")
+                f.write(f"{address}:{self.port}{suffix}\n")
+
+
+class _RestHandler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive like the RouterOS www service
+    protocol_version = 'HTTP/1.1'
+    server: FakeRestServer
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.count_connection()
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _reply(self, status: int, body: Any, close: bool = False) -> None:
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if close:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:  # noqa N802
+        router = self.server.router_for(self.connection.getsockname()[0])
+        if router.is_rebooting():
+            self.close_connection = True
+            return
+        profile = router.profile
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        expected = base64.b64encode(f"{profile.username}:{profile.password}".encode()).decode()
+        if self.headers.get('Authorization') != f"Basic {expected}":
+            self._reply(401, {'error': 401, 'message': 'Unauthorized'})
+            return
+        if not self.path.startswith('/rest/'):
+            self._reply(404, {'error': 404, 'message': 'Not Found'})
+            return
+        if profile.latency:
+            time.sleep(profile.latency)
+
+        cmd = self.path[len('/rest'):]
+        proplist = body.pop('.proplist', None)
+        queries = dict(q.partition('=')[::2] for q in body.pop('.query', []) if '=' in q)
+        attrs = {k: str(v) for k, v in body.items()}
+        replies, close_after = router.handle(cmd, attrs, queries)
+        if isinstance(proplist, list):
+            proplist = ','.join(proplist)
+        replies = [_apply_proplist(r, proplist) for r in replies]
+        traps = [attrs for word, attrs in replies if word == '!trap']
+        if traps:
+            self._reply(400, {'error': 400, 'message': 'Bad Request', 'detail': traps[0].get('message', '')})
+            return
+        rows = [attrs for word, attrs in replies if word == '!re']
+        done = next((attrs for word, attrs in replies if word == '!done' and attrs), None)
+        self._reply(200, rows if rows or done is None else done, close=close_after)
+
+
+# REST counterpart of FakeRouterOSServer (plain HTTP), answered by the same simulated routers
+class FakeRestServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, profile: RouterProfile | None = None, host: str = '127.0.0.1', port: int = 0) -> None:
+        self.profile = profile or RouterProfile()
+        self.routers: dict[str, SimulatedRouter] = {}
+        self.connections = 0
+        self._routers_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        super().__init__((host, port), _RestHandler)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def router_for(self, address: str) -> SimulatedRouter:
+        with self._routers_lock:
+            router = self.routers.get(address)
+            if router is None:
+                router = self.routers[address] = SimulatedRouter(address, self.profile)
+            return router
+
+    def count_connection(self) -> None:
+        with self._routers_lock:
+            self.connections += 1
+
+    def __enter__(self) -> FakeRestServer:
+        self._thread = threading.Thread(target=self.serve_forever, name="FakeRouterOSRest", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fake RouterOS API server")
+    parser.add_argument("--host", help="Bind address (default: 127.0.0.1, or 0.0.0.0 with --replay).")
+    parser.add_argument("--port", type=int, default=8728)
+    parser.add_argument("--ssl", action="store_true")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each reply.")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of commands that never get a reply.")
+    parser.add_argument("--checking-polls", type=int, default=1, help="Update prints that report 'checking' after a check.")
+    parser.add_argument("--cloud-delay", type=float, default=0.0, help="Seconds a cloud backup upload takes.")
+    parser.add_argument("--reboot-time", type=float, default=0.5, help="Seconds a router stays unreachable after a reboot.")
+    parser.add_argument("--username", default='admin')
+    parser.add_argument("--password", default='test')
+    parser.add_argument("--replay", metavar="DIR", help="Replay transcripts recorded with mkmassupdate.py --record.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed factor (2 = twice as fast).")
+    parser.add_argument("--write-ip-list", metavar="FILE", help="With --replay, write an IP list for the replayed hosts.")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = _parse_args(argv)
+    server: FakeRouterOSServer
+    if args.replay:
+        server = ReplayRouterOSServer(args.replay, args.speed, host=args.host or '0.0.0.0', port=args.port, use_ssl=args.ssl)
+        print(f"Replaying {len(server.recorded)} recorded hosts at {args.speed}x", file=sys.stderr)
+        if args.write_ip_list:
+            server.write_ip_list(args.write_ip_list)
+    else:
+        profile = RouterProfile(
+            latency=args.latency, drop_rate=args.drop_rate, checking_polls=args.checking_polls,
+            cloud_delay=args.cloud_delay, reboot_time=args.reboot_time,
+            username=args.username, password=args.password,
+        )
+        server = FakeRouterOSServer(profile, host=args.host or '127.0.0.1', port=args.port, use_ssl=args.ssl)
+    print(f"Fake RouterOS API{'-SSL' if args.ssl else ''} listening on {args.host}:{server.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import pytest
+import sys
+import os
+import tempfile
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import librouteros
+from unittest.mock import MagicMock, patch
+from mkmassupdate import ExportArchive, MassUpdater, _apply_line_delta, _line_delta, _normalize_export, _read_router_file
+from tests.fake_routeros import FakeRouterOSServer
+from tests.test_integration import _make_args
+
+
+@pytest.fixture
+def archive():
+    with tempfile.TemporaryDirectory() as directory:
+        archive = ExportArchive(directory)
+        yield archive
+        archive.close()
+
+
+def _config(n_lines, changed=None):
+    lines = [f"add name=item{i} comment=line{i}\n" for i in range(n_lines)]
+    if changed is not None:
+        lines[changed] = "add name=changed\n"
+    return "# 2026-10-01 10:00:00 by RouterOS 7.15\n" + "".join(lines)
+
+
+def test_normalize_strips_date_header():
+    text = "# 2026-10-01 10:00:00 by RouterOS 7.15\r\n/ip address\r\n"
+    assert _normalize_export(text) == "/ip address\n"
+
+
+def test_line_delta_round_trip():
+    base = ["a\n", "b\n", "c\n", "d\n"]
+    new = ["a\n", "x\n", "c\n", "d\n", "e\n"]
+    assert _apply_line_delta(base, _line_delta(base, new)) == new
+
+
+def test_unchanged_export_is_deduplicated(archive):
+    first = archive.store('10.0.0.1', _config(50), taken_at=1000)
+    second = archive.store('10.0.0.1', _config(50).replace('10:00:00', '11:00:00'), taken_at=2000)
+    assert first[1] == 'full'
+    assert second == (first[0], 'unchanged')
+    assert archive.stats()['objects'] == 1
+    assert archive.stats()['snapshots'] == 2
+
+
+def test_changed_export_stored_as_small_delta(archive):
+    archive.store('10.0.0.1', _config(500), taken_at=1000)
+    digest, kind = archive.store('10.0.0.1', _config(500, changed=250), taken_at=2000)
+    assert kind == 'delta'
+    stats = archive.stats()
+    assert stats['stored_bytes'] < stats['unique_bytes'] / 10
+    assert archive.load(digest) == _normalize_export(_config(500, changed=250))
+
+
+def test_lookup_by_date(archive):
+    archive.store('10.0.0.1', _config(5), taken_at=1000)
+    archive.store('10.0.0.1', _config(5, changed=1), taken_at=2000)
+    assert archive.get('10.0.0.1', at=1500) == _normalize_export(_config(5))
+    assert archive.get('10.0.0.1') == _normalize_export(_config(5, changed=1))
+    assert archive.get('10.0.0.1', at=500) is None
+    assert archive.get('10.0.0.2') is None
+
+
+def test_delta_chain_restarts_with_full_copy():
+    with tempfile.TemporaryDirectory() as directory:
+        archive = ExportArchive(directory, max_chain=2)
+        kinds = [archive.store('h', _config(10, changed=i), taken_at=i)[1] for i in range(4)]
+        assert kinds == ['full', 'delta', 'delta', 'full']
+        archive.close()
+
+
+def _read_with_file_print(size, contents):
+    api = MagicMock()
+    api.path.return_value.select.return_value.where.return_value = [{'size': size, 'contents': contents}]
+    entry_lines = []
+    with patch('mkmassupdate.execute_with_retry', side_effect=librouteros.exceptions.TrapError('no such command')):
+        return _read_router_file(api, 'export.rsc', entry_lines), entry_lines
+
+
+def test_file_print_fallback_complete():
+    assert _read_with_file_print(5, 'hello') == ('hello', [])
+
+
+def test_file_print_fallback_truncated():
+    text, entry_lines = _read_with_file_print(9000, 'x' * 4095)
+    assert text is None
+    assert '9000 bytes but only 4095' in entry_lines[0]
+
+
+def test_export_archive_run(ip_list_file):
+    with tempfile.TemporaryDirectory() as directory, FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        updater = MassUpdater(_make_args(ip_list, dry_run=True, export_archive=directory))
+        assert updater.run() is False
+
+        archive = ExportArchive(directory)
+        text = archive.get('127.0.0.1')
+        archive.close()
+        assert 'set name=router-127.0.0.1' in text
+        assert server.routers['127.0.0.1'].files == {}
@@ -0,0 +1,81 @@
+import pytest
+import sys
+import errno
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from mkmassupdate import SegmentBreaker, MassUpdater, _is_unreachable_error
+from tests.test_main import _make_args
+
+
+def test_segment_of_ipv4():
+    assert SegmentBreaker(3).segment_of('10.1.2.3') == '10.1.2.0/24'
+
+
+def test_segment_of_custom_prefix():
+    assert SegmentBreaker(3, prefix_v4=16).segment_of('10.1.2.3') == '10.1.0.0/16'
+
+
+def test_segment_of_hostname_is_none():
+    assert SegmentBreaker(3).segment_of('router.example.com') is None
+
+
+def test_trips_after_consecutive_failures():
+    breaker = SegmentBreaker(2)
+    breaker.record('10.0.0.1', reachable=False)
+    assert breaker.allow('10.0.0.0/24')
+    breaker.record('10.0.0.2', reachable=False)
+    assert not breaker.allow('10.0.0.0/24')
+    assert breaker.allow('10.0.1.0/24')
+    assert breaker.tripped == {'10.0.0.0/24'}
+
+
+def test_success_resets_failure_count():
+    breaker = SegmentBreaker(2)
+    breaker.record('10.0.0.1', reachable=False)
+    breaker.record('10.0.0.2', reachable=True)
+    breaker.record('10.0.0.3', reachable=False)
+    assert breaker.allow('10.0.0.0/24')
+
+
+def test_probe_after_cooldown(mocker):
+    clock = mocker.patch('mkmassupdate.time.monotonic', return_value=100.0)
+    breaker = SegmentBreaker(1, probe_after=30)
+    breaker.record('10.0.0.1', reachable=False)
+    assert not breaker.allow('10.0.0.0/24')
+
+    clock.return_value = 131.0
+    assert breaker.allow('10.0.0.0/24')
+    assert not breaker.allow('10.0.0.0/24')
+
+    breaker.record('10.0.0.5', reachable=True)
+    assert breaker.allow('10.0.0.0/24')
+
+
+def test_failed_probe_reopens(mocker):
+    clock = mocker.patch('mkmassupdate.time.monotonic', return_value=100.0)
+    breaker = SegmentBreaker(1, probe_after=30)
+    breaker.record('10.0.0.1', reachable=False)
+    clock.return_value = 131.0
+    assert breaker.allow('10.0.0.0/24')
+    breaker.record('10.0.0.2', reachable=False)
+    assert not breaker.allow('10.0.0.0/24')
+
+
+def test_unreachable_errors():
+    assert _is_unreachable_error(TimeoutError())
+    assert _is_unreachable_error(OSError(errno.EHOSTUNREACH, 'No route to host'))
+    assert not _is_unreachable_error(ConnectionRefusedError(errno.ECONNREFUSED, 'refused'))
+
+
+def test_worker_skips_hosts_in_tripped_segment(mocker):
+    mocker.patch('mkmassupdate._connect_to_router', side_effect=TimeoutError)
+    updater = MassUpdater(_make_args(threads=1, breaker_threshold=2))
+    mocker.patch.object(updater, '_load_ip_list', return_value=[f"10.9.9.{i}" for i in range(1, 6)])
+    mocker.patch.object(updater, '_print_summary', return_value=True)
+    updater.run()
+
+    assert sorted(updater.results.failed_hosts()) == ['10.9.9.1', '10.9.9.2']
+    assert sorted(updater.results.skipped_hosts()) == [f"10.9.9.{i}" for i in range(3, 6)]
@@ -6,7 +6,7 @@ import logging
 logging.disable(logging.CRITICAL)
 
 import argparse
-from mkmassupdate import _positive_int, _port_type, _positive_float
+from mkmassupdate import _positive_int, _port_type, _positive_float, _non_negative_float, _fraction
 
 
 class TestPositiveInt:
@@ -76,3 +76,22 @@ class TestPositiveFloat:
     def test_rejects_negative(self):
         with pytest.raises(argparse.ArgumentTypeError):
             _positive_float('-1.5')
+
+
+class TestNonNegativeFloat:
+    def test_accepts_zero(self):
+        assert _non_negative_float('0') == 0.0
+
+    def test_rejects_negative(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            _non_negative_float('-0.5')
+
+
+class TestFraction:
+    def test_accepts_bounds(self):
+        assert _fraction('0') == 0.0
+        assert _fraction('1') == 1.0
+
+    def test_rejects_above_one(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            _fraction('1.5')
@@ -0,0 +1,115 @@
+import pytest
+import sys
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import time
+import librouteros
+from unittest.mock import MagicMock, patch
+from mkmassupdate import MassUpdater, StateStore, _perform_cloud_backup, _router_timestamp
+from tests.fake_routeros import FakeRouterOSServer, RouterProfile
+from tests.test_integration import _make_args
+
+
+def _backup_with(replies, **kwargs):
+    entry_lines, facts, commands = [], {}, []
+
+    def execute(api, command, entry_lines):
+        commands.append(command)
+        name = command if isinstance(command, str) else command[0]
+        return replies[name].pop(0) if isinstance(replies.get(name), list) else replies.get(name, [])
+
+    with patch('mkmassupdate._execute_router_command', side_effect=execute), patch('time.sleep'):
+        result = _perform_cloud_backup(MagicMock(), 'secret', entry_lines, facts=facts, **kwargs)
+    return result, entry_lines, facts, commands
+
+
+def test_router_timestamp_formats():
+    assert _router_timestamp('2024-01-02 10:00:00') == _router_timestamp('jan/02/2024 10:00:00')
+    assert _router_timestamp('2024-01-02 10:00:05') - _router_timestamp('2024-01-02 10:00:00') == 5
+    assert _router_timestamp('yesterday') is None
+
+
+def test_old_backups_removed_in_one_call():
+    old = [{'.id': '*1', 'date': '2024-01-01 00:00:00'}, {'.id': '*2', 'date': '2024-01-02 00:00:00'}]
+    new = [{'.id': '*3', 'secret-download-key': 'abc'}]
+    result, entry_lines, facts, commands = _backup_with({'/system/backup/cloud/print': [old, new]})
+    assert result is True
+    assert ('/system/backup/cloud/remove-file', {'number': '*1,*2'}) in commands
+    assert [c for c in commands if c[0] == '/system/backup/cloud/remove-file'] == [commands[1]]
+    assert 'Secret Download Key: abc' in entry_lines[-1]
+    assert 'cloud_backup_at' in facts
+
+
+def test_new_backup_found_when_id_is_reused():
+    old = [{'.id': '*1', 'date': '2024-01-01 00:00:00', 'secret-download-key': 'old'}]
+    pending = [{'.id': '*1', 'date': '2024-01-03 00:00:00'}]
+    new = [{'.id': '*1', 'date': '2024-01-03 00:00:00', 'secret-download-key': 'new'}]
+    result, entry_lines, _, commands = _backup_with({'/system/backup/cloud/print': [old, pending, new]})
+    assert result is True
+    assert 'Secret Download Key: new' in entry_lines[-1]
+    assert commands.count('/system/backup/cloud/print') == 3
+
+
+def test_fresh_device_backup_skipped():
+    backups = [{'.id': '*1', 'date': '2024-01-02 09:00:00'}]
+    clock = [{'date': '2024-01-02', 'time': '10:00:00'}]
+    replies = {'/system/backup/cloud/print': [backups], '/system/clock/print': [clock]}
+    result, entry_lines, facts, commands = _backup_with(replies, max_age=2 * 3600)
+    assert result is True
+    assert 'Skipped' in entry_lines[-1] and '1h' in entry_lines[-1]
+    assert not [c for c in commands if c[0] == '/system/backup/cloud/upload-file']
+    assert time.time() - facts['cloud_backup_at'] == pytest.approx(3600, abs=60)
+
+
+def test_stale_device_backup_replaced():
+    backups = [{'.id': '*1', 'date': '2024-01-01 09:00:00'}]
+    clock = [{'date': '2024-01-02', 'time': '10:00:00'}]
+    new = [{'.id': '*2', 'secret-download-key': 'abc'}]
+    replies = {'/system/backup/cloud/print': [backups, new], '/system/clock/print': [clock]}
+    result, _, _, commands = _backup_with(replies, max_age=2 * 3600)
+    assert result is True
+    assert ('/system/backup/cloud/remove-file', {'number': '*1'}) in commands
+
+
+def test_local_record_skips_router_round_trips():
+    result, entry_lines, _, commands = _backup_with({}, max_age=3600, backed_up_at=time.time() - 60)
+    assert result is True
+    assert commands == []
+    assert 'Skipped' in entry_lines[0]
+
+
+def test_polls_until_new_backup_is_listed():
+    with FakeRouterOSServer(RouterProfile(cloud_list_delay=0.5)) as server:
+        api = librouteros.connect(host='127.0.0.1', port=server.port, username='admin', password='test')
+        try:
+            entry_lines = []
+            started = time.monotonic()
+            assert _perform_cloud_backup(api, 'secret', entry_lines) is True
+            elapsed = time.monotonic() - started
+        finally:
+            api.close()
+        router = server.routers['127.0.0.1']
+    assert 'Secret Download Key: key-' in entry_lines[-1]
+    assert 'uploaded new backup in' in entry_lines[-2]
+    assert 0.5 <= elapsed < 3
+    assert router.commands.count('/system/backup/cloud/print') >= 3
+
+
+def test_state_db_skips_second_run(ip_list_file, tmp_path):
+    state_db = str(tmp_path / 'state.sqlite')
+    with FakeRouterOSServer(RouterProfile(latest_version='7.14.3')) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        args = dict(dry_run=True, cloud_password='secret', cloud_backup_max_age=1.0, state_db=state_db)
+        # Dry runs never upload, so nothing is recorded
+        assert MassUpdater(_make_args(ip_list, **args)).run() is False
+        assert StateStore(state_db).cloud_backup_at('127.0.0.1') is None
+        args['dry_run'] = False
+        MassUpdater(_make_args(ip_list, **args)).run()
+        router = server.routers['127.0.0.1']
+        assert router.commands.count('/system/backup/cloud/upload-file') == 1
+        assert StateStore(state_db).cloud_backup_at('127.0.0.1') is not None
+        MassUpdater(_make_args(ip_list, **args)).run()
+        assert router.commands.count('/system/backup/cloud/upload-file') == 1
@@ -0,0 +1,127 @@
+import pytest
+import sys
+import os
+import tempfile
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import yaml
+import mkmassupdate
+from mkmassupdate import MassUpdater, StateStore, _credential_id
+from tests.fake_routeros import FakeRouterOSServer, RouterProfile
+from tests.test_integration import _make_args
+
+
+@pytest.fixture
+def workdir():
+    with tempfile.TemporaryDirectory() as directory:
+        yield directory
+
+
+@pytest.fixture
+def credentials_file(workdir):
+    def _write(sets):
+        path = os.path.join(workdir, 'credentials.yaml')
+        with open(path, 'w', encoding='utf-8') as f:
+            yaml.safe_dump([{'username': u, 'password': p} for u, p in sets], f)
+        return path
+    return _write
+
+
+@pytest.fixture
+def login_spy(mocker):
+    return mocker.spy(mkmassupdate, 'plain_login')
+
+
+def test_state_store_orders_cached_credential_first(workdir):
+    state = StateStore(os.path.join(workdir, 'state.sqlite'))
+    sets = [('admin', 'a'), ('admin', 'b'), ('ops', 'c')]
+    state.record_login('10.0.0.1', 1, ('ops', 'c'))
+    assert state.order_credentials('10.0.0.1', sets) == [('ops', 'c'), ('admin', 'a'), ('admin', 'b')]
+    assert state.order_credentials('10.0.0.2', sets) == sets
+    state.close()
+
+
+def test_state_store_counts_failures_until_success(workdir):
+    state = StateStore(os.path.join(workdir, 'state.sqlite'))
+    state.record_login('10.0.0.1', 2, None)
+    state.record_login('10.0.0.1', 1, None)
+    assert state.login_failures('10.0.0.1') == 3
+    state.record_login('10.0.0.1', 0, ('admin', 'a'))
+    assert state.login_failures('10.0.0.1') == 0
+    state.close()
+
+
+def test_credential_id_does_not_contain_password():
+    key = b'k' * 32
+    assert 'secret' not in _credential_id(key, 'admin', 'secret')
+    assert _credential_id(key, 'admin', 'a') != _credential_id(key, 'admin', 'b')
+    assert _credential_id(key, 'admin', 'a') != _credential_id(b'x' * 32, 'admin', 'a')
+
+
+def test_credential_key_is_per_state_file(workdir):
+    first = StateStore(os.path.join(workdir, 'first.sqlite'))
+    second = StateStore(os.path.join(workdir, 'second.sqlite'))
+    first.record_login('10.0.0.1', 0, ('admin', 'a'))
+    second.record_login('10.0.0.1', 0, ('admin', 'a'))
+    ids = [store._db.execute('SELECT credential FROM credentials').fetchone()[0] for store in (first, second)]
+    assert ids[0] != ids[1]
+    first.close()
+    second.close()
+    # The key survives reopening, so the cached set is still found
+    reopened = StateStore(os.path.join(workdir, 'first.sqlite'))
+    assert reopened.order_credentials('10.0.0.1', [('ops', 'c'), ('admin', 'a')])[0] == ('admin', 'a')
+    reopened.close()
+
+
+def test_fallback_chain_uses_one_connection(ip_list_file, credentials_file, login_spy):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        args = _make_args(ip_list, dry_run=True, password='legacy1',
+                          credentials=credentials_file([('admin', 'legacy2'), ('admin', 'test')]))
+        assert MassUpdater(args).run() is False
+        assert server.connections == 1
+    assert login_spy.call_count == 3
+
+
+def test_reconnects_when_router_closes_after_failed_login(ip_list_file, credentials_file):
+    with FakeRouterOSServer(RouterProfile(close_after_failed_login=True)) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        args = _make_args(ip_list, dry_run=True, password='legacy1', credentials=credentials_file([('admin', 'test')]))
+        assert MassUpdater(args).run() is False
+        assert server.connections == 2
+
+
+def test_line_credentials_are_not_chained(ip_list_file, credentials_file, login_spy):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}|admin|wrong"])
+        args = _make_args(ip_list, dry_run=True, credentials=credentials_file([('admin', 'test')]))
+        assert MassUpdater(args).run() is True
+    assert login_spy.call_count == 1
+
+
+def test_state_db_remembers_working_set(ip_list_file, credentials_file, workdir, login_spy):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        args = _make_args(ip_list, dry_run=True, password='legacy1', state_db=os.path.join(workdir, 'state.sqlite'),
+                          credentials=credentials_file([('admin', 'legacy2'), ('admin', 'test')]))
+        assert MassUpdater(args).run() is False
+        assert login_spy.call_count == 3
+        assert MassUpdater(args).run() is False
+        assert login_spy.call_count == 4
+
+
+def test_max_login_failures_spans_runs(ip_list_file, credentials_file, workdir, login_spy):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        args = _make_args(ip_list, dry_run=True, password='bad1', max_login_failures=2,
+                          state_db=os.path.join(workdir, 'state.sqlite'),
+                          credentials=credentials_file([('admin', 'bad2'), ('admin', 'bad3')]))
+        assert MassUpdater(args).run() is True
+        assert login_spy.call_count == 2
+        updater = MassUpdater(args)
+        assert updater.run() is True
+        assert login_spy.call_count == 2
+        assert server.connections == 1
@@ -0,0 +1,78 @@
+import pytest
+import sys
+import json
+import types
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import mkmassupdate
+from mkmassupdate import Dashboard, MassUpdater, _WorkerSlot, _phase, _worker_slot
+from tests.fake_routeros import FakeRouterOSServer
+from tests.test_integration import _make_args
+
+
+def _slot(host=None, phase=None, age=0.0, ok=0, failed=0, now=1000.0):
+    slot = _WorkerSlot()
+    slot.host, slot.phase, slot.started, slot.ok, slot.failed = host, phase, now - age, ok, failed
+    return slot
+
+
+@pytest.fixture
+def updater():
+    return types.SimpleNamespace(slots=[], _unresponsive_count=0, deferred=[])
+
+
+def test_phase_sets_and_restores_worker_slot():
+    slot = _worker_slot.slot = _WorkerSlot()
+    try:
+        with _phase(None, 'update_check'):
+            with _phase(None, 'install'):
+                assert slot.phase == 'install'
+            assert slot.phase == 'update_check'
+        assert slot.phase is None
+    finally:
+        del _worker_slot.slot
+
+
+def test_snapshot_counts_phases_and_slowest(updater, mocker):
+    mocker.patch('mkmassupdate.time.monotonic', return_value=1000.0)
+    updater.slots = [
+        _slot('10.0.0.1', 'connect', age=2, ok=3),
+        _slot('10.0.0.2', 'update_check', age=40, failed=1),
+        _slot('10.0.0.3', 'update_check', age=10, ok=2),
+        _slot(ok=4),
+    ]
+    updater._unresponsive_count = 2
+    dashboard = Dashboard(updater, total=40, mode='json', interval=1.0)
+    dashboard._started = 940.0
+
+    snap = dashboard.snapshot()
+    assert snap['phases'] == {'connect': 1, 'update_check': 2}
+    assert (snap['ok'], snap['failed'], snap['done']) == (9, 1, 12)
+    assert snap['hosts_per_min'] == 12.0
+    assert snap['eta'] == 140.0
+    assert [s['host'] for s in snap['slowest']] == ['10.0.0.2', '10.0.0.3', '10.0.0.1']
+
+
+def test_bar_render_updates_position_and_postfix(updater, mocker):
+    updater.slots = [_slot('10.0.0.1', 'reboot', ok=5, now=mkmassupdate.time.monotonic())]
+    pbar = mocker.Mock()
+    Dashboard(updater, total=10, mode='bar', interval=1.0, pbar=pbar).render()
+    assert pbar.n == 5
+    postfix = pbar.set_postfix_str.call_args[0][0]
+    assert postfix.startswith('ok=5 fail=0 | reboot:1')
+    assert 'slowest 10.0.0.1 reboot' in postfix
+
+
+def test_json_heartbeats(ip_list_file, capsys):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"] * 2)
+        args = _make_args(ip_list, dry_run=True, progress='json', heartbeat_interval=0.05)
+        assert MassUpdater(args).run() is False
+
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    assert events[-1]['event'] == 'done'
+    assert events[-1]['ok'] == 2
+    assert all(e['event'] == 'heartbeat' for e in events[:-1])
@@ -0,0 +1,100 @@
+import pytest
+import sys
+import os
+import tempfile
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import yaml
+from mkmassupdate import DesiredState, MassUpdater, _apply_desired_state, _state_value
+from tests.fake_routeros import FakeRouterOSServer, RouterProfile
+from tests.test_integration import _make_args
+
+
+WRITES = ('/add', '/set', '/remove')
+
+
+@pytest.fixture
+def commands_file():
+    paths = []
+
+    def _write(entries):
+        fd, path = tempfile.mkstemp(suffix='.yaml')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(entries, f)
+        paths.append(path)
+        return path
+
+    yield _write
+    for path in paths:
+        os.unlink(path)
+
+
+def _user(name='ops', group='read', **extra):
+    return {'menu': '/user', 'match': ['name'], 'item': {'name': name, 'group': group, 'password': 'pw', **extra}}
+
+
+def test_state_value_normalises_booleans():
+    assert _state_value(True) == _state_value('yes') == _state_value('true') == 'true'
+    assert _state_value(False) == _state_value('no') == 'false'
+    assert _state_value(8080) == _state_value('8080')
+
+
+def test_desired_state_validation():
+    with pytest.raises(ValueError):
+        DesiredState('/user', ['name'], {'group': 'read'})
+    with pytest.raises(ValueError):
+        DesiredState('user', ['name'], {'name': 'ops'})
+    with pytest.raises(ValueError):
+        DesiredState('/user', ['name'], {'name': 'ops'}, ensure='maybe')
+    assert DesiredState.from_yaml(_user()).write_only == {'password'}
+
+
+def test_menu_read_once_and_cache_updated(mocker):
+    api = mocker.Mock(side_effect=[
+        iter([{'.id': '*1', 'name': 'admin', 'group': 'full'}]),
+        iter([{'ret': '*2'}]),
+        iter([]),
+        iter([]),
+    ])
+    menu_rows = {}
+    entry_lines = []
+    ops = DesiredState.from_yaml(_user())
+    assert _apply_desired_state(api, ops, menu_rows, entry_lines)
+    assert _apply_desired_state(api, DesiredState.from_yaml(_user(group='write')), menu_rows, entry_lines)
+    assert _apply_desired_state(api, ops, menu_rows, entry_lines)
+
+    assert [c.args[0] for c in api.call_args_list] == ['/user/print', '/user/add', '/user/set', '/user/set']
+    assert api.call_args_list[2].kwargs == {'.id': '*2', 'group': 'write'}
+    assert [line.split(': ')[1].strip() for line in entry_lines] == ['add', 'set group', 'set group']
+
+
+def test_converges_then_read_only(ip_list_file, commands_file):
+    commands = commands_file([
+        _user(disabled=False),
+        {'menu': '/user', 'match': 'name', 'item': {'name': 'admin', 'group': 'full'}},
+        {'menu': '/ip/dns/static', 'match': ['name'], 'item': {'name': 'old.lan'}, 'ensure': 'absent'},
+    ])
+    with FakeRouterOSServer(RouterProfile(latest_version='7.14.3')) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        router = server.router_for('127.0.0.1')
+        router.tables['/ip/dns/static'].append({'.id': '*F0', 'name': 'old.lan', 'address': '10.0.0.1'})
+
+        def writes_after_run(**overrides):
+            router.commands.clear()
+            assert MassUpdater(_make_args(ip_list, custom_commands=commands, **overrides)).run() is False
+            return [c for c in router.commands if c.endswith(WRITES)]
+
+        assert writes_after_run(dry_run=True) == []
+        assert writes_after_run() == ['/user/add', '/ip/dns/static/remove']
+        assert router.tables['/ip/dns/static'] == []
+        assert router.tables['/user'][1]['password'] == 'pw'
+
+        assert writes_after_run() == []
+        assert router.commands.count('/user/print') == 1
+
+        router.tables['/user'][1]['group'] = 'full'
+        assert writes_after_run() == ['/user/set']
+        assert router.tables['/user'][1]['group'] == 'read'
@@ -0,0 +1,100 @@
+import pytest
+import sys
+import errno
+import socket
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from mkmassupdate import MassUpdater, _expand_target, _probe_api_ports, _target_range
+from tests.fake_routeros import FakeRouterOSServer
+from tests.test_integration import _make_args
+
+
+def _addresses(target):
+    host_info = (target, 8728, None, None, False)
+    return [h[0] for h in _expand_target(host_info, _target_range(target))]
+
+
+def test_single_hosts_are_not_ranges():
+    assert _target_range('10.0.0.1') is None
+    assert _target_range('router-01.example.net') is None
+
+
+def test_cidr_skips_network_and_broadcast():
+    assert _addresses('10.0.0.0/30') == ['10.0.0.1', '10.0.0.2']
+    assert _addresses('10.0.0.7/31') == ['10.0.0.6', '10.0.0.7']
+    assert _addresses('10.0.0.5/32') == ['10.0.0.5']
+
+
+def test_address_ranges():
+    assert _addresses('10.1.1.254-10.1.2.1') == ['10.1.1.254', '10.1.1.255', '10.1.2.0', '10.1.2.1']
+    assert _addresses('10.1.1.10-12') == ['10.1.1.10', '10.1.1.11', '10.1.1.12']
+    with pytest.raises(ValueError):
+        _target_range('10.1.1.10-5')
+    with pytest.raises(ValueError):
+        _target_range('10.1.1.10-fe80::1')
+
+
+def test_large_ranges_are_lazy():
+    address_type, numbers = _target_range('10.0.0.0/8')
+    assert len(numbers) == 2 ** 24 - 2
+    first = next(_expand_target(('10.0.0.0/8', 8728, 'admin', 'pw', False), (address_type, numbers)))
+    assert first == ('10.0.0.1', 8728, 'admin', 'pw', False)
+
+
+def test_probe_reports_every_candidate():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+    port = listener.getsockname()[1]
+    try:
+        candidates = [(f"127.0.0.{i}", port, None, None, False) for i in range(1, 6)]
+        results = dict((h[0], ok) for h, ok in _probe_api_ports(candidates, concurrency=2, timeout=1.0))
+    finally:
+        listener.close()
+    assert results == {'127.0.0.1': True, '127.0.0.2': False, '127.0.0.3': False, '127.0.0.4': False, '127.0.0.5': False}
+
+
+def test_probe_times_out_silent_addresses(mocker):
+    mocker.patch('mkmassupdate.selectors.DefaultSelector.select', return_value=[])
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    try:
+        candidates = [('127.0.0.1', listener.getsockname()[1], None, None, False)]
+        assert [ok for _, ok in _probe_api_ports(candidates, concurrency=1, timeout=0.05)] == [False]
+    finally:
+        listener.close()
+
+
+def test_probe_survives_socket_errors(mocker):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+    port = listener.getsockname()[1]
+    real_socket = socket.socket
+    # The first probe finds the process out of file descriptors
+    failures = [OSError(errno.EMFILE, 'Too many open files')]
+
+    def make_socket(*args, **kwargs):
+        if failures:
+            raise failures.pop()
+        return real_socket(*args, **kwargs)
+
+    mocker.patch('mkmassupdate.socket.socket', side_effect=make_socket)
+    try:
+        candidates = [('127.0.0.1', port, None, None, False), ('127.0.0.1', port, None, None, False)]
+        assert [ok for _, ok in _probe_api_ports(candidates, concurrency=2, timeout=1.0)] == [False, True]
+    finally:
+        listener.close()
+
+def test_run_discovers_responsive_hosts(ip_list_file):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1-4:{server.port}"])
+        updater = MassUpdater(_make_args(ip_list, dry_run=True))
+        assert updater.run() is False
+        assert (updater.results.processed, updater.results.ok) == (1, 1)
+        assert list(server.routers) == ['127.0.0.1']
+        assert updater._unresponsive_count == 3
@@ -0,0 +1,112 @@
+import pytest
+import sys
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import socket
+import mkmassupdate
+from mkmassupdate import DnsCache, MassUpdater, SegmentBreaker, _parse_args, _setup_dns_cache, parse_host_line
+from tests.fake_routeros import FakeRouterOSServer
+from tests.test_integration import _make_args
+
+
+@pytest.fixture
+def cache():
+    yield _setup_dns_cache(300.0)
+    _setup_dns_cache(0)
+
+
+def _fake_getaddrinfo(answers, calls):
+    def getaddrinfo(host, port, *args, **kwargs):
+        calls.append(host)
+        if host not in answers:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (answers[host], port))]
+    return getaddrinfo
+
+
+def test_parse_bracketed_ipv6():
+    assert parse_host_line('[2001:db8::1]:8729|user|pass|SSL', 8728) == ('2001:db8::1', 8729, 'user', 'pass', True)
+    assert parse_host_line('[2001:db8::1]', 8728) == ('2001:db8::1', 8728, None, None, False)
+    assert parse_host_line('[2001:db8::1]|SSL', 8728) == ('2001:db8::1', 8729, None, None, True)
+    assert parse_host_line('[2001:db8::/120]:8728', 8728)[0] == '2001:db8::/120'
+
+
+@pytest.mark.parametrize('line', ['[2001:db8::1', '[2001:db8::1]8728', '2001:db8::1', '[]:8728'])
+def test_parse_malformed_ipv6(line):
+    assert parse_host_line(line, 8728) is None
+
+
+def test_format_endpoint():
+    assert mkmassupdate._format_endpoint('2001:db8::1', 8728) == '[2001:db8::1]:8728'
+    assert mkmassupdate._format_endpoint('10.0.0.1', 8728) == '10.0.0.1:8728'
+
+
+def test_resolve_caches_answers_and_failures(mocker):
+    calls = []
+    mocker.patch('socket.getaddrinfo', _fake_getaddrinfo({'router.example': '10.0.0.5'}, calls))
+    cache = DnsCache(ttl=300.0)
+    assert cache.resolve('router.example', 8728) == '10.0.0.5'
+    assert cache.resolve('router.example', 8728) == '10.0.0.5'
+    assert cache.resolve('10.0.0.9', 8728) == '10.0.0.9'
+    for _ in range(2):
+        with pytest.raises(socket.gaierror):
+            cache.resolve('missing.example', 8728)
+    assert calls == ['router.example', 'missing.example']
+
+
+def test_resolve_expires_entries(mocker):
+    calls = []
+    mocker.patch('socket.getaddrinfo', _fake_getaddrinfo({'router.example': '10.0.0.5'}, calls))
+    cache = DnsCache(ttl=300.0)
+    cache.resolve('router.example', 8728)
+    now = mkmassupdate.time.monotonic()
+    mocker.patch('mkmassupdate.time.monotonic', return_value=now + 301)
+    cache.resolve('router.example', 8728)
+    assert calls == ['router.example', 'router.example']
+
+
+def test_prefetch_resolves_concurrently(mocker):
+    calls = []
+    answers = {f"r{i}.example": f"10.0.0.{i}" for i in range(20)}
+    mocker.patch('socket.getaddrinfo', _fake_getaddrinfo(answers, calls))
+    cache = DnsCache(ttl=300.0)
+    hosts = [(host, 8728) for host in answers] + [('missing.example', 8728), ('10.1.1.1', 8728)]
+    assert cache.prefetch(hosts, concurrency=4) == 1
+    assert sorted(calls) == sorted(list(answers) + ['missing.example'])
+    assert cache.cached('r3.example') == '10.0.0.3'
+    assert cache.prefetch(hosts[:20], concurrency=4) == 0
+    assert len(calls) == 21
+
+
+def test_breaker_segments_resolved_hostnames(cache, mocker):
+    mocker.patch('socket.getaddrinfo', _fake_getaddrinfo({'router.example': '10.0.7.5'}, []))
+    breaker = SegmentBreaker(threshold=5, prefix_v4=24, prefix_v6=64, probe_after=0)
+    assert breaker.segment_of('router.example') is None
+    cache.resolve('router.example', 8728)
+    assert breaker.segment_of('router.example') == '10.0.7.0/24'
+
+
+def test_run_pre_resolves_hostnames(ip_list_file, cache, mocker):
+    with FakeRouterOSServer() as server:
+        spy = mocker.spy(cache, 'prefetch')
+        ip_list = ip_list_file([f"localhost:{server.port}"] * 2)
+        assert MassUpdater(_make_args(ip_list, dry_run=True)).run() is False
+        spy.assert_called_once()
+        assert cache.cached('localhost') in ('127.0.0.1', '::1')
+
+
+def test_ipv6_end_to_end(ip_list_file):
+    with FakeRouterOSServer(host='::1') as server:
+        ip_list = ip_list_file([f"[::1]:{server.port}|admin|test"])
+        updater = MassUpdater(_make_args(ip_list, dry_run=True))
+        assert updater.run() is False
+        assert server.routers['::1'].commands
+
+
+def test_pre_resolution_is_opt_in(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['prog', '-u', 'admin', '-p', 'pass'])
+    assert _parse_args().dns_ttl == 0.0
+    assert _setup_dns_cache(_parse_args().dns_ttl) is None
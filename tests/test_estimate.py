@@ -0,0 +1,82 @@
+import pytest
+import sys
+import os
+import tempfile
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from mkmassupdate import MassUpdater, StateStore, _format_duration, recommend_threads, simulate_schedule
+from tests.fake_routeros import FakeRouterOSServer
+from tests.test_integration import _make_args
+
+
+@pytest.fixture
+def state_path():
+    with tempfile.TemporaryDirectory() as directory:
+        yield os.path.join(directory, 'state.sqlite')
+
+
+def test_simulate_schedule_fifo():
+    wall, critical = simulate_schedule([10, 1, 1, 1, 1], threads=2)
+    assert wall == 10
+    assert critical == [0]
+    assert simulate_schedule([3, 3, 3, 3], threads=1) == (12, [0, 1, 2, 3])
+    assert simulate_schedule([], threads=4) == (0.0, [])
+
+
+def test_recommend_threads():
+    durations = [60.0] * 100
+    assert recommend_threads(durations, window=600) == 10
+    assert recommend_threads(durations, window=59) is None
+    assert recommend_threads([], window=1) == 1
+
+
+def test_format_duration():
+    assert _format_duration(12.34) == '12.3s'
+    assert _format_duration(750) == '12m30s'
+    assert _format_duration(3723) == '1h02m03s'
+
+
+def test_record_run_keeps_moving_average(state_path):
+    state = StateStore(state_path)
+    state.record_run('10.0.0.1', {'connect': 1.0, 'update_check': 10.0}, True)
+    state.record_run('10.0.0.1', {'connect': 2.0}, False)
+    timings, last_success = state.timings()
+    state.close()
+    assert timings['10.0.0.1']['connect'] == pytest.approx(1.3)
+    assert timings['10.0.0.1']['update_check'] == 10.0
+    assert last_success == {'10.0.0.1': False}
+
+
+def test_estimate_uses_stored_timings(ip_list_file, state_path, mocker):
+    state = StateStore(state_path)
+    for i in range(1, 5):
+        state.record_run(f'10.0.0.{i}', {'connect': 1.0, 'commands': 2.0, 'update_check': 7.0 * i}, True)
+    state.close()
+    ip_list = ip_list_file(["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4", "10.0.0.5", "10.9.0.0/24"])
+    info = mocker.patch('mkmassupdate.logger.info')
+
+    args = _make_args(ip_list, threads=2, state_db=state_path, estimate_window=1.0, update_check_delay=1.0)
+    updater = MassUpdater(args)
+    assert updater.estimate() is False
+    report = info.call_args[0][0]
+    assert 'Hosts                 : 5 (4 with timings)' in report
+    # update_check is capped at 15 x 1.0 + 2, host 5 uses the fleet medians: 10, 17, 20, 20, 20
+    assert 'Expected wall time    : 50.0s' in report
+    assert 'Recommended threads   : 2 for a 1m00s window' in report
+
+
+def test_real_run_feeds_estimate(ip_list_file, state_path, mocker):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        assert MassUpdater(_make_args(ip_list, dry_run=True, state_db=state_path)).run() is False
+    state = StateStore(state_path)
+    timings, _ = state.timings()
+    state.close()
+    assert {'connect', 'commands', 'update_check'} <= set(timings['127.0.0.1'])
+
+    info = mocker.patch('mkmassupdate.logger.info')
+    assert MassUpdater(_make_args(ip_list, state_db=state_path)).estimate() is False
+    assert '1 (1 with timings)' in info.call_args[0][0]
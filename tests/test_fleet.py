@@ -0,0 +1,117 @@
+import pytest
+import sys
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import mkmassupdate
+from mkmassupdate import (
+    FleetExport, MassUpdater, _fleet_command, _load_fleet, _numeric_histogram, _parse_fleet_field, fleet_summary,
+)
+from tests.fake_routeros import FakeRouterOSServer, RouterProfile
+from tests.test_integration import _make_args
+
+
+@pytest.fixture
+def directory():
+    with tempfile.TemporaryDirectory() as path:
+        yield path
+
+
+def test_parse_fleet_field():
+    assert _parse_fleet_field('cpu=/system/resource/print:cpu-load') == ('cpu', '/system/resource/print', 'cpu-load')
+    for bad in ('cpu', 'cpu=/system/resource/print', 'cpu=system/resource:x', 'version=/system/resource/print:version'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            _parse_fleet_field(bad)
+
+
+def test_export_falls_back_to_csv_without_pyarrow(directory, monkeypatch):
+    monkeypatch.setattr(mkmassupdate, 'pyarrow', None)
+    export = FleetExport(os.path.join(directory, 'fleet.parquet'))
+    assert export.format == 'csv'
+    assert export.path == os.path.join(directory, 'fleet.csv')
+
+
+def test_run_writes_fleet_csv(ip_list_file, directory):
+    path = os.path.join(directory, 'out', 'fleet.csv')
+    with FakeRouterOSServer(RouterProfile(reboot_time=0.1)) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}", f"127.0.0.2:{server.port}"])
+        fields = [_parse_fleet_field('uptime=/system/resource/print:uptime')]
+        updater = MassUpdater(_make_args(ip_list, fleet_export=path, fleet_field=fields))
+        assert updater.run() is True
+
+    data = _load_fleet(path)
+    if not isinstance(data, dict):
+        data = data.to_pydict()
+    rows = {address: i for i, address in enumerate(data['address'])}
+    ok, failed = rows['127.0.0.1'], rows['127.0.0.2']
+    assert data['status'][ok] == 'ok' and data['status'][failed] == 'failed'
+    assert data['model'][ok] == 'RB750Gr3'
+    assert data['version'][ok] == '7.14.3' and data['updated_to'][ok] == '7.15.2'
+    assert data['uptime'][ok] == '1d2h3m4s' and data['uptime'][failed] is None
+    # The server only listens on 127.0.0.1
+    assert data['failure'][failed] == 'transient'
+
+
+def _fleet_columns(count):
+    rng = random.Random(1)
+    versions = ['7.15.2', '7.14.3', '7.12', '6.49.10']
+    models = ['RB750Gr3', 'hAP ac2', 'CCR2004']
+    columns = {name: [] for name in mkmassupdate._FLEET_COLUMNS + ('cpu', 'board')}
+    for i in range(count):
+        status = 'ok' if i % 10 != 3 else 'failed'
+        row = {
+            'address': f"10.{i >> 16}.{(i >> 8) & 255}.{i & 255}", 'port': 8728,
+            'model': models[i % 3], 'version': versions[i % 4], 'status': status,
+            'updated_to': '7.15.2' if i % 4 == 3 and status == 'ok' else None,
+            'seconds': rng.random() * 10, 'cpu': i % 100, 'board': models[i % 3],
+        }
+        for name, column in columns.items():
+            column.append(row.get(name))
+    return columns
+
+
+def test_fleet_summary():
+    summary = fleet_summary(_fleet_columns(40), ['cpu', 'board'])
+    assert summary['routers'] == 40
+    assert summary['status'] == {'ok': 36, 'failed': 4}
+    assert summary['newest'] == '7.15.2'
+    # 6.49.10 rows that were updated count as 7.15.2; the failed ones among them do not
+    assert dict(summary['versions']) == {'7.15.2': 18, '7.14.3': 10, '7.12': 10, '6.49.10': 2}
+    assert summary['out_of_date'] == 22
+    assert dict(summary['models'])['RB750Gr3'] == 14
+    assert sum(count for _, _, count in summary['fields']['cpu']) == 40
+    assert dict(summary['fields']['board'])['CCR2004'] == 13
+
+
+def test_numeric_histogram_bins():
+    histogram = _numeric_histogram([0, 5, 10, None], bins=2)
+    assert histogram == [(0, 5.0, 1), (5.0, 10.0, 2)]
+    assert _numeric_histogram(['a', 'b']) is None
+    assert _numeric_histogram([None]) == []
+
+
+def test_fleet_summary_100k_rows_is_fast():
+    columns = _fleet_columns(100_000)
+    started = time.perf_counter()
+    summary = fleet_summary(columns, ['cpu', 'board'])
+    assert time.perf_counter() - started < 1.0
+    assert summary['routers'] == 100_000
+
+
+def test_fleet_command(directory, capsys, monkeypatch):
+    monkeypatch.setattr(mkmassupdate, 'pyarrow', None)
+    export = FleetExport(os.path.join(directory, 'fleet.csv'))
+    export.record('10.0.0.1', 8728, True, False, {'version': '7.14.3', 'model': 'RB750Gr3', 'updated_to': '7.15.2'}, 1.0)
+    export.record('10.0.0.2', 8728, False, False, {'version': '7.14.3', 'model': 'RB750Gr3', 'failure': 'auth'}, 2.0)
+    export.close()
+    assert _fleet_command([export.path]) == 0
+    out = capsys.readouterr().out
+    assert 'Fleet: 2 routers (1 ok, 1 failed, 0 skipped)' in out
+    assert 'newest 7.15.2, 1 out of date' in out
@@ -0,0 +1,110 @@
+import pytest
+import sys
+import os
+import tempfile
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import json
+import sqlite3
+from mkmassupdate import MassUpdater, RunHistory, _error_class, _report_command
+from tests.fake_routeros import FakeRouterOSServer, RouterProfile
+from tests.test_integration import _make_args
+
+
+@pytest.fixture
+def history_path():
+    with tempfile.TemporaryDirectory() as directory:
+        yield os.path.join(directory, 'history.sqlite')
+
+
+def _run(history, outcomes, dry_run=False):
+    # outcomes: host -> (success, facts, phases)
+    history.start_run(_make_args('list.txt', dry_run=dry_run))
+    for host, (success, facts, phases) in outcomes.items():
+        history.record(host, success, _error_class(success, False, facts, phases), facts, sum(phases.values()), phases)
+    history.finish_run()
+
+
+def test_error_class():
+    assert _error_class(True, False, {}, {'connect': 1.0}) is None
+    assert _error_class(False, True, {}, {}) == 'segment_down'
+    assert _error_class(False, False, {'error': 'TimeoutError'}, {'connect': 1.0}) == 'TimeoutError'
+    assert _error_class(False, False, {}, {'connect': 1.0, 'update_check': 2.0}) == 'update_check_failed'
+
+
+def test_params_exclude_secrets(history_path):
+    history = RunHistory(history_path)
+    history.start_run(_make_args('list.txt', cloud_password='cloudsecret'))
+    history.close()
+    params = sqlite3.connect(history_path).execute('SELECT params FROM runs').fetchone()[0]
+    assert 'cloudsecret' not in params and '"test"' not in params
+    assert json.loads(params)['threads'] == 4
+
+
+def test_failing_hosts(history_path):
+    history = RunHistory(history_path)
+    ok = (True, {}, {'connect': 0.1})
+    timeout = (False, {'error': 'TimeoutError'}, {'connect': 5.0})
+    for run in range(5):
+        _run(history, {
+            '10.0.0.1': timeout if run != 2 else ok,
+            '10.0.0.2': timeout if run == 4 else ok,
+            '10.0.0.3': ok,
+        })
+    _run(history, {'10.0.0.3': timeout}, dry_run=True)
+    assert history.failing(runs=5, min_failures=3) == [('10.0.0.1', 4, 5, 'TimeoutError')]
+    assert history.failing(runs=5, min_failures=1, include_dry_run=True)[-1] == ('10.0.0.3', 1, 5, 'TimeoutError')
+    history.close()
+
+
+def test_versions_and_durations(history_path):
+    history = RunHistory(history_path)
+    _run(history, {
+        '10.0.0.1': (True, {'model': 'hAP ax2', 'version': '7.14.3'}, {'update_check': 10.0}),
+        '10.0.0.2': (True, {'model': 'hAP ax2', 'version': '7.14.3'}, {'update_check': 20.0}),
+        '10.0.0.3': (True, {'model': 'CCR2004', 'version': '7.15.2'}, {'update_check': 3.0}),
+    })
+    _run(history, {
+        '10.0.0.1': (True, {'model': 'hAP ax2', 'version': '7.14.3', 'updated_to': '7.15.2'}, {'update_check': 30.0}),
+        '10.0.0.2': (False, {'error': 'TimeoutError'}, {'connect': 5.0}),
+    })
+    assert history.versions() == [('7.15.2', 2), ('7.14.3', 1)]
+    by_model = history.durations('update_check', 'model', runs=10)
+    assert by_model[0] == ('hAP ax2', 3, 20.0, 30.0)
+    assert by_model[1] == ('CCR2004', 1, 3.0, 3.0)
+    assert [row[0] for row in history.durations('update_check', 'model', runs=1)] == ['hAP ax2']
+    with pytest.raises(ValueError):
+        history.durations('update_check', 'password', runs=1)
+    history.close()
+
+
+def test_versions_count_duplicate_host_once(history_path):
+    history = RunHistory(history_path)
+    history.start_run(_make_args('list.txt'))
+    history.record('10.0.0.1', True, None, {'version': '7.14.3'}, 1.0, {})
+    history.record('10.0.0.2', True, None, {'version': '7.14.3'}, 1.0, {})
+    # Listed twice in the IP list: the second pass saw the updated router
+    history.record('10.0.0.1', True, None, {'version': '7.15.2'}, 1.0, {})
+    history.finish_run()
+    assert history.versions() == [('7.14.3', 1), ('7.15.2', 1)]
+    history.close()
+
+def test_run_records_history_and_report(ip_list_file, history_path, capsys):
+    with FakeRouterOSServer(RouterProfile(reboot_time=0.1)) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}", f"127.0.0.2:1|admin|x"])
+        assert MassUpdater(_make_args(ip_list, history_db=history_path, timeout=1)).run() is True
+
+    history = RunHistory(history_path)
+    [(run_id, _, finished, dry_run, hosts, failed)] = history.runs(5)
+    assert (hosts, failed, dry_run) == (2, 1, 0) and finished
+    [(_, _, success, error, version, updated_to, _)] = history.host_history('127.0.0.1', 5)
+    assert success and (version, updated_to) == ('7.14.3', '7.15.2')
+    history.close()
+
+    assert _report_command(['--db', history_path, 'failing', '--min', '1']) == 0
+    assert 'ConnectionRefusedError' in capsys.readouterr().out
+    assert _report_command(['--db', history_path, 'versions']) == 0
+    assert '7.15.2' in capsys.readouterr().out
@@ -0,0 +1,113 @@
+import pytest
+import sys
+import os
+import tempfile
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import gzip
+import mkmassupdate
+from mkmassupdate import HostLogStore, MassUpdater, _logs_command
+from tests.fake_routeros import FakeRouterOSServer
+from tests.test_integration import _make_args
+
+
+@pytest.fixture
+def log_dir():
+    with tempfile.TemporaryDirectory() as directory:
+        yield directory
+
+
+def test_entries_are_sharded_and_read_back(log_dir):
+    store = HostLogStore(log_dir, shards=4)
+    run_id = store.start_run()
+    for i in range(20):
+        store.write(f"10.0.0.{i}", f"router-{i}", i % 3 != 0, f"Host: 10.0.0.{i}\n  line {i}")
+    store.close()
+
+    shard_files = os.listdir(os.path.join(log_dir, run_id))
+    assert 1 < len(shard_files) <= 4
+    # Each shard is a valid gzip stream made of concatenated members
+    text = ''.join(gzip.decompress(open(os.path.join(log_dir, run_id, name), 'rb').read()).decode()
+                   for name in shard_files)
+    assert text.count('Host: ') == 20
+
+    store = HostLogStore(log_dir)
+    [entry] = store.lookup('10.0.0.7')
+    assert entry[0] == run_id
+    assert entry[2:] == ('10.0.0.7', 'router-7', True, "Host: 10.0.0.7\n  line 7")
+    assert store.lookup('ROUTER-9')[0][4] is False
+    assert store.lookup('10.9.9.9') == []
+    [(listed_run, _, size, hosts)] = store.runs()
+    assert (listed_run, hosts) == (run_id, 20)
+    assert size == sum(os.path.getsize(os.path.join(log_dir, run_id, name)) for name in shard_files)
+    store.close()
+
+
+def test_lookup_newest_first_across_runs(log_dir, mocker):
+    now = mkmassupdate.time.time()
+    for day, text in enumerate(['first', 'second', 'third']):
+        mocker.patch('mkmassupdate.time.time', return_value=now + day)
+        mocker.patch('mkmassupdate.time.strftime', return_value=f"run-{day}")
+        store = HostLogStore(log_dir)
+        store.start_run()
+        store.write('10.0.0.1', None, True, text)
+        store.close()
+    mocker.stopall()
+    store = HostLogStore(log_dir)
+    assert [entry[5] for entry in store.lookup('10.0.0.1')] == ['third', 'second', 'first']
+    assert [entry[5] for entry in store.lookup('10.0.0.1', limit=1)] == ['third']
+    store.close()
+
+
+def test_prune_by_age_and_size(log_dir, mocker):
+    now = mkmassupdate.time.time()
+    for day in range(4):
+        mocker.patch('mkmassupdate.time.time', return_value=now - (3 - day) * 86400)
+        mocker.patch('mkmassupdate.time.strftime', return_value=f"run-{day}")
+        store = HostLogStore(log_dir)
+        store.start_run()
+        store.write('10.0.0.1', None, True, os.urandom(2000).hex())
+        store.close()
+    mocker.stopall()
+
+    store = HostLogStore(log_dir)
+    assert store.prune(max_age_days=2.5) == ['run-0']
+    assert not os.path.exists(os.path.join(log_dir, 'run-0'))
+    sizes = [row[2] for row in store.runs()]
+    assert store.prune(max_bytes=sum(sizes) - 1) == ['run-1']
+    assert [row[0] for row in store.runs()] == ['run-2', 'run-3']
+    assert len(store.lookup('10.0.0.1')) == 2
+    store.close()
+
+
+def test_prune_counts_runs_that_never_closed(log_dir):
+    store = HostLogStore(log_dir)
+    run_id = store.start_run()
+    store.write('10.0.0.1', None, True, os.urandom(2000).hex())
+    # Killed before close(): the files are on disk but runs.bytes was never written
+    for f in store._files.values():
+        f.close()
+    store._db.commit()
+    store._db.close()
+
+    store = HostLogStore(log_dir)
+    [(_, _, size, hosts)] = store.runs()
+    assert size > 0 and hosts == 1
+    assert store.prune(max_bytes=1) == [run_id]
+    assert not os.path.exists(os.path.join(log_dir, run_id))
+    store.close()
+
+
+def test_run_writes_host_logs(ip_list_file, log_dir, capsys):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        assert MassUpdater(_make_args(ip_list, dry_run=True, host_logs=log_dir)).run() is False
+
+    assert _logs_command(['--dir', log_dir, 'lookup', '127.0.0.1']) == 0
+    out = capsys.readouterr().out
+    assert '127.0.0.1' in out and 'OK' in out
+    assert 'Checking for updates' in out
+    assert _logs_command(['--dir', log_dir, 'lookup', 'unknown-host']) == 1
@@ -0,0 +1,137 @@
+import pytest
+import sys
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import queue
+import threading
+import librouteros
+import mkmassupdate
+from mkmassupdate import DeferredHosts, MassUpdater, _classify_failure, _parse_args
+from tests.fake_routeros import FakeRouterOSServer
+from tests.test_integration import _make_args
+
+HOST = ('10.0.0.1', 8728, None, None, False)
+
+
+@pytest.mark.parametrize('error, kind', [
+    (TimeoutError(), 'transient'),
+    (ConnectionRefusedError(), 'transient'),
+    (librouteros.exceptions.ConnectionClosed('closed'), 'transient'),
+    (librouteros.exceptions.TrapError('invalid user name or password (6)'), 'auth'),
+    (librouteros.exceptions.TrapError('no credential sets left to try'), 'auth'),
+    (librouteros.exceptions.TrapError('could not connect to cloud server'), 'transient'),
+    (librouteros.exceptions.TrapError('no such command'), 'trap'),
+    (KeyError('status'), 'logic'),
+])
+def test_classify_failure(error, kind):
+    assert _classify_failure(error) == kind
+
+
+def test_next_attempt_limit():
+    deferred = DeferredHosts(queue.Queue(), threading.Event())
+    assert [deferred.next_attempt(HOST, 2) for _ in range(3)] == [0, 1, None]
+
+
+def test_deferred_host_keeps_queue_unfinished():
+    q: queue.Queue = queue.Queue()
+    stop = threading.Event()
+    deferred = DeferredHosts(q, stop)
+    q.put(HOST)
+    assert q.get_nowait() == HOST
+    deferred.defer(HOST, 0.05)
+    assert q.unfinished_tasks == 1
+    deferred.start()
+    assert q.get(timeout=2) == HOST
+    assert len(deferred) == 0
+    q.task_done()
+    assert q.unfinished_tasks == 0
+    stop.set()
+
+
+def test_clear_releases_pending_tasks():
+    q: queue.Queue = queue.Queue()
+    deferred = DeferredHosts(q, threading.Event())
+    q.put(HOST)
+    q.get_nowait()
+    deferred.defer(HOST, 60)
+    deferred.clear()
+    assert q.unfinished_tasks == 0 and len(deferred) == 0
+
+
+def test_transient_failure_is_retried_in_the_same_run(ip_list_file, mocker):
+    real_connect = mkmassupdate._connect_to_router
+    calls = []
+
+    def flaky_connect(*args, **kwargs):
+        calls.append(args[0][0])
+        if len(calls) == 1:
+            raise TimeoutError()
+        return real_connect(*args, **kwargs)
+
+    mocker.patch('mkmassupdate._connect_to_router', side_effect=flaky_connect)
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        updater = MassUpdater(_make_args(ip_list, dry_run=True, host_retries=2, host_retry_delay=0.01))
+        assert updater.run() is False
+    assert len(calls) == 2
+    assert (updater.results.processed, updater.results.ok) == (1, 1)
+    assert updater.deferred.retried == 1
+    assert updater._recovered_count == 1
+
+
+def test_transient_command_failure_is_retried(ip_list_file, mocker):
+    real_execute = mkmassupdate.execute_with_retry
+    calls = []
+
+    def flaky_execute(api, command, *args, **kwargs):
+        if command == '/system/resource/print':
+            calls.append(command)
+            if len(calls) == 1:
+                raise TimeoutError()
+        return real_execute(api, command, *args, **kwargs)
+
+    mocker.patch('mkmassupdate.execute_with_retry', side_effect=flaky_execute)
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        updater = MassUpdater(_make_args(ip_list, dry_run=True, host_retries=2, host_retry_delay=0.01))
+        assert updater.run() is False
+    assert len(calls) == 2
+    assert updater.deferred.retried == 1
+    assert (updater.results.processed, updater.results.ok) == (1, 1)
+
+
+def test_rejected_command_is_not_retried(ip_list_file, tmp_path):
+    commands = tmp_path / 'commands.yaml'
+    commands.write_text("- command: /no/such/command\n", encoding='utf-8')
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        args = _make_args(ip_list, dry_run=True, host_retries=2, host_retry_delay=0.01, custom_commands=str(commands))
+        updater = MassUpdater(args)
+        assert updater.run() is True
+    assert updater.deferred.retried == 0
+
+
+def test_retries_stop_at_limit(ip_list_file, mocker):
+    spy = mocker.spy(mkmassupdate, '_connect_to_router')
+    ip_list = ip_list_file(["127.0.0.2:1"])
+    updater = MassUpdater(_make_args(ip_list, dry_run=True, host_retries=2, host_retry_delay=0.01))
+    assert updater.run() is True
+    assert spy.call_count == 3
+    assert (updater.results.processed, updater.results.failed) == (1, 1)
+
+
+def test_auth_failure_is_not_retried(ip_list_file):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}|admin|wrong"])
+        updater = MassUpdater(_make_args(ip_list, dry_run=True, host_retries=2, host_retry_delay=0.01))
+        assert updater.run() is True
+        assert server.connections == 1
+    assert updater.deferred.retried == 0
+
+
+def test_host_retries_are_opt_in(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['prog', '-u', 'admin', '-p', 'pass'])
+    assert _parse_args().host_retries == 0
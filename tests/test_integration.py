@@ -0,0 +1,172 @@
+import pytest
+import sys
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import argparse
+import socket
+import librouteros
+from librouteros.api import Api
+from librouteros.connections import SocketTransport
+from librouteros.protocol import ApiProtocol, encode_sentence
+from mkmassupdate import MassUpdater, _follow_update_status
+from tests.fake_routeros import FakeRouterOSServer, RouterProfile
+
+
+def _make_args(ip_list: str, **overrides: bool | str | int | float | None) -> argparse.Namespace:
+    defaults: dict[str, bool | str | int | float | None] = {
+        'username': 'admin',
+        'password': 'test',
+        'threads': 4,
+        'timeout': 5,
+        'ip_list': ip_list,
+        'port': 8728,
+        'update_check_attempts': 15,
+        'update_check_delay': 0.01,
+        'update_status': 'poll',
+        'no_colors': True,
+        'dry_run': False,
+        'start_line': 1,
+        'debug': False,
+        'cloud_password': None,
+        'cloud_backup_max_age': 0.0,
+        'upgrade_firmware': False,
+        'ssl': False,
+        'custom_commands': None,
+        'breaker_threshold': 0,
+        'segment_prefix': 24,
+        'breaker_probe_after': 0.0,
+        'export_archive': None,
+        'export_binary': False,
+        'inventory': None,
+        'select': None,
+        'discover_concurrency': 256,
+        'discover_timeout': 1.0,
+        'credentials': None,
+        'max_login_failures': 5,
+        'state_db': None,
+        'retries': 3,
+        'retry_base_delay': 5.0,
+        'retry_max_delay': 60.0,
+        'retry_budget': 0.0,
+        'progress': 'auto',
+        'heartbeat_interval': 30.0,
+        'adaptive_timeouts': False,
+        'timeout_multiplier': 4.0,
+        'timeout_floor': 2.0,
+        'timeout_ceiling': 120.0,
+        'download_only': False,
+        'reboot_staged': False,
+        'offload': False,
+        'collect': False,
+        'dns_ttl': 0.0,
+        'dns_concurrency': 64,
+        'host_logs': None,
+        'history_db': None,
+        'host_retries': 0,
+        'host_retry_delay': 30.0,
+        'host_retry_max_delay': 300.0,
+        'result_spill_threshold': 10000,
+        'fleet_export': None,
+        'fleet_field': [],
+        'host_log_shards': 16,
+        'host_logs_max_age': 0,
+        'host_logs_max_size': 0,
+        'estimate': False,
+        'estimate_window': None,
+    }
+    defaults.update(overrides)
+    return argparse.Namespace(**defaults)
+
+
+def test_dry_run_against_fake_server(ip_list_file):
+    with FakeRouterOSServer(RouterProfile(checking_polls=2)) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"] * 3)
+        updater = MassUpdater(_make_args(ip_list, dry_run=True))
+        assert updater.run() is False
+        router = server.routers['127.0.0.1']
+        assert router.reboots == 0
+        assert router.commands.count('/system/package/update/check-for-updates') == 3
+
+    assert updater.results.processed == 3
+    assert min(updater.results.durations) > 0
+
+
+def test_update_installs_and_reboots(ip_list_file):
+    with FakeRouterOSServer(RouterProfile(reboot_time=0.1)) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        assert MassUpdater(_make_args(ip_list)).run() is False
+        router = server.routers['127.0.0.1']
+        assert router.reboots == 1
+        assert router.installed_version == '7.15.2'
+
+
+def test_ssl_connection(ip_list_file):
+    with FakeRouterOSServer(use_ssl=True) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}|SSL"])
+        assert MassUpdater(_make_args(ip_list, dry_run=True)).run() is False
+        assert server.connections == 1
+
+
+def test_wrong_password_fails_host(ip_list_file):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}|admin|wrong"])
+        updater = MassUpdater(_make_args(ip_list, dry_run=True))
+        assert updater.run() is True
+        assert list(updater.results.failed_hosts()) == ['127.0.0.1']
+
+
+def test_follow_update_status(ip_list_file):
+    profile = RouterProfile(checking_polls=0, check_duration=0.3, reboot_time=0.1)
+    with FakeRouterOSServer(profile) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        updater = MassUpdater(_make_args(ip_list, update_status='follow', update_check_delay=1.0))
+        assert updater.run() is False
+        router = server.routers['127.0.0.1']
+        assert router.commands.count('/system/package/update/print') == 1
+        assert router.reboots == 1
+
+
+def test_follow_falls_back_to_polling(ip_list_file):
+    with FakeRouterOSServer(RouterProfile(supports_follow=False)) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        updater = MassUpdater(_make_args(ip_list, dry_run=True, update_status='follow'))
+        assert updater.run() is False
+        assert server.routers['127.0.0.1'].commands.count('/system/package/update/print') >= 2
+
+
+@pytest.mark.parametrize('download_only', [False, True])
+def test_follow_timeout_fails_host_cleanly(ip_list_file, download_only):
+    profile = RouterProfile(checking_polls=0, check_duration=2.0)
+    with FakeRouterOSServer(profile) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        args = _make_args(
+            ip_list, update_status='follow', update_check_attempts=2, update_check_delay=0.1,
+            download_only=download_only,
+        )
+        updater = MassUpdater(args)
+        facts = {}
+        success, entry_lines = updater._process_host(
+            ('127.0.0.1', server.port, None, None, 0), [], None, False, False, 2, 0.1, 5, False, 'admin', 'test', facts,
+        )
+        # Like a polling timeout: no install, and only a download-only run counts it as failed
+        assert success is not download_only
+        assert any('Timeout waiting for update check' in line for line in entry_lines)
+        assert 'error' not in facts
+        assert server.routers['127.0.0.1'].reboots == 0
+
+
+def test_follow_timeout_mid_sentence_closes_connection():
+    ours, router = socket.socketpair()
+    api = Api(ApiProtocol(SocketTransport(ours), 'ASCII'))
+    try:
+        # The router starts a reply and stalls halfway through it
+        reply = encode_sentence('!re', '=status=checking for updates...', '.tag=mkmassupdate-follow', encoding='ASCII')
+        router.sendall(reply[:len(reply) // 2])
+        with pytest.raises(TimeoutError):
+            _follow_update_status(api, 0.2)
+        assert ours.fileno() == -1
+    finally:
+        router.close()
@@ -0,0 +1,109 @@
+import pytest
+import sys
+import os
+import tempfile
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from mkmassupdate import Inventory, InventorySelectError, MassUpdater, _split_version, _version_key
+from tests.fake_routeros import FakeRouterOSServer, RouterProfile
+from tests.test_integration import _make_args
+
+
+@pytest.fixture
+def inventory_path():
+    with tempfile.TemporaryDirectory() as directory:
+        yield os.path.join(directory, 'inventory.sqlite')
+
+
+@pytest.fixture
+def inventory(inventory_path):
+    inventory = Inventory(inventory_path)
+    inventory.import_lines(["10.0.0.1", "10.0.0.2:8730|ops|secret", "10.0.0.3|SSL"], 8728, site='milano', tags=['core'])
+    inventory.import_lines(["10.1.0.1", "10.1.0.2"], 8728, site='roma')
+    inventory.update_facts('10.0.0.1', 8728, {'model': 'hAP ac2', 'version': '6.49.10', 'channel': 'long-term'})
+    inventory.update_facts('10.0.0.2', 8730, {'model': 'hAP ax3', 'version': '7.14.3', 'channel': 'stable'})
+    inventory.update_facts('10.1.0.1', 8728, {'model': 'CCR2004-1G-12S+2XS', 'version': '7.15.2', 'channel': 'stable'})
+    yield inventory
+    inventory.close()
+
+
+def _addresses(rows):
+    return [row[0] for row in rows]
+
+
+def test_version_key_orders_versions():
+    assert _version_key('6.49.10') < _version_key('7') < _version_key('7.9') < _version_key('7.14.3')
+    assert _version_key('7.15beta2') == _version_key('7.15')
+    assert _version_key('N/A') is None
+
+
+def test_split_version_extracts_channel():
+    assert _split_version('7.14.3 (stable)') == ('7.14.3', 'stable')
+    assert _split_version('7.15beta2') == ('7.15beta2', None)
+
+
+def test_import_keeps_host_line_fields(inventory):
+    rows = inventory.select('address=10.0.0.*')
+    assert rows == [
+        ('10.0.0.1', 8728, None, None, False, 'milano'),
+        ('10.0.0.2', 8730, 'ops', 'secret', False, 'milano'),
+        ('10.0.0.3', 8729, None, None, True, 'milano'),
+    ]
+
+
+def test_reimport_updates_in_place(inventory):
+    inventory.import_lines(["10.1.0.1|admin|new"], 8728)
+    assert inventory.select('address=10.1.0.1') == [('10.1.0.1', 8728, 'admin', 'new', False, 'roma')]
+    assert len(inventory.select()) == 5
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("model=hAP* and version<7", ['10.0.0.1']),
+    ("model=hap*", ['10.0.0.1', '10.0.0.2']),
+    ("version>=7.14", ['10.0.0.2', '10.1.0.1']),
+    ("version=7", ['10.0.0.2', '10.1.0.1']),
+    ("version=7.14.3", ['10.0.0.2']),
+    ("tag=core and not site=milano", []),
+    ("tag!=core", ['10.1.0.1', '10.1.0.2']),
+    ("site=roma or channel=long-term", ['10.0.0.1', '10.1.0.1', '10.1.0.2']),
+    ("(site=roma or model=\"hAP ax3\") and channel=stable", ['10.0.0.2', '10.1.0.1']),
+    ("port>8728", ['10.0.0.2', '10.0.0.3']),
+])
+def test_select_expressions(inventory, expr, expected):
+    assert _addresses(inventory.select(expr)) == expected
+
+
+@pytest.mark.parametrize("expr", ["model", "colour=red", "model<hAP*", "tag>a", "version<abc", "(site=roma", "site=roma and"])
+def test_invalid_select_raises(inventory, expr):
+    with pytest.raises(InventorySelectError):
+        inventory.select(expr)
+
+
+def test_tag_and_set_site(inventory):
+    assert inventory.tag('site=roma', add=['edge'], remove=[]) == 2
+    assert _addresses(inventory.select('tag=ed*')) == ['10.1.0.1', '10.1.0.2']
+    inventory.tag('address=10.1.0.2', add=[], remove=['edge'])
+    assert _addresses(inventory.select('tag=edge')) == ['10.1.0.1']
+    assert inventory.set_site('address=10.1.0.*', 'napoli') == 2
+    assert _addresses(inventory.select('site=napoli')) == ['10.1.0.1', '10.1.0.2']
+
+
+def test_run_from_inventory_records_facts(inventory_path):
+    profile = RouterProfile(board_name='hAP ac2', channel='long-term', installed_version='6.49.10')
+    with FakeRouterOSServer(profile) as server:
+        inventory = Inventory(inventory_path)
+        inventory.import_lines([f"127.0.0.1:{server.port}", "127.0.0.2:1"], 8728, site='lab')
+        inventory.close()
+
+        updater = MassUpdater(_make_args('missing.txt', dry_run=True, inventory=inventory_path, select=f"port={server.port}"))
+        assert updater.run() is False
+        assert (updater.results.processed, updater.results.ok) == (1, 1)
+        assert list(server.routers) == ['127.0.0.1']
+
+    inventory = Inventory(inventory_path)
+    details = inventory.details(f"port={server.port}")
+    inventory.close()
+    assert details == [('127.0.0.1', server.port, 'lab', server.routers['127.0.0.1'].identity, 'hAP ac2', '6.49.10', 'long-term')]
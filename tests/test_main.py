@@ -19,14 +19,57 @@ def _make_args(**overrides: bool | str | int | float | None) -> argparse.Namespa
         'port': 8728,
         'update_check_attempts': 15,
         'update_check_delay': 2.0,
+        'update_status': 'poll',
         'no_colors': False,
         'dry_run': True,
         'start_line': 1,
         'debug': False,
         'cloud_password': None,
+        'cloud_backup_max_age': 0.0,
         'upgrade_firmware': False,
         'ssl': False,
         'custom_commands': None,
+        'breaker_threshold': 0,
+        'segment_prefix': 24,
+        'breaker_probe_after': 0.0,
+        'export_archive': None,
+        'export_binary': False,
+        'inventory': None,
+        'select': None,
+        'discover_concurrency': 256,
+        'discover_timeout': 1.0,
+        'credentials': None,
+        'max_login_failures': 5,
+        'state_db': None,
+        'retries': 3,
+        'retry_base_delay': 5.0,
+        'retry_max_delay': 60.0,
+        'retry_budget': 0.0,
+        'progress': 'auto',
+        'heartbeat_interval': 30.0,
+        'adaptive_timeouts': False,
+        'timeout_multiplier': 4.0,
+        'timeout_floor': 2.0,
+        'timeout_ceiling': 120.0,
+        'download_only': False,
+        'reboot_staged': False,
+        'offload': False,
+        'collect': False,
+        'dns_ttl': 0.0,
+        'dns_concurrency': 64,
+        'host_logs': None,
+        'history_db': None,
+        'host_retries': 0,
+        'host_retry_delay': 30.0,
+        'host_retry_max_delay': 300.0,
+        'result_spill_threshold': 10000,
+        'fleet_export': None,
+        'fleet_field': [],
+        'host_log_shards': 16,
+        'host_logs_max_age': 0,
+        'host_logs_max_size': 0,
+        'estimate': False,
+        'estimate_window': None,
     }
     defaults.update(overrides)
     return argparse.Namespace(**defaults)
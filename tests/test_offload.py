@@ -0,0 +1,105 @@
+import pytest
+import sys
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import time
+from unittest.mock import MagicMock, patch
+from mkmassupdate import MassUpdater, _collect_offload, _offload_script, _start_offload
+from tests.fake_routeros import FakeRouterOSServer, RouterProfile
+from tests.test_integration import _make_args
+
+
+def test_offload_script_firmware_block():
+    assert 'routerboard upgrade' in _offload_script(15, 2.0, True)
+    assert 'routerboard upgrade' not in _offload_script(15, 2.0, False)
+    assert ':delay 2000ms' in _offload_script(15, 2.0, False)
+    assert '$tries < 15' in _offload_script(15, 2.0, False)
+
+
+def test_offload_script_fails_incomplete_check():
+    script = _offload_script(15, 2.0, False)
+    # The failure branch comes before any install or up-to-date decision
+    assert script.index('failed ') < script.index('installing ') < script.index('up-to-date ')
+    assert '"New version|up to date|Downloaded"' in script
+
+
+def test_start_offload_dry_run_touches_nothing():
+    api = MagicMock()
+    entry_lines = []
+    with patch('mkmassupdate._execute_router_command') as execute:
+        assert _start_offload(api, entry_lines, True, False, 15, 2.0) is True
+    execute.assert_not_called()
+    assert 'Dry-run' in entry_lines[0]
+
+
+def _collect_with(comment, installed):
+    entry_lines, facts = [], {}
+    script = {'.id': '*1', 'comment': comment}
+    commands = []
+
+    def execute(api, command, entry_lines):
+        commands.append(command)
+        return [{'installed-version': installed}]
+
+    with patch('mkmassupdate._find_offload_script', return_value=script), \
+            patch('mkmassupdate._execute_router_command', side_effect=execute):
+        result = _collect_offload(MagicMock(), entry_lines, False, facts)
+    removed = ('/system/script/remove', {'numbers': '*1'}) in commands
+    return result, facts, removed
+
+
+def test_collect_outcomes():
+    assert _collect_with('mkmassupdate 2026-01-01 10:00:00 up-to-date 7.15', '7.15') == (True, {}, True)
+    assert _collect_with('mkmassupdate 2026-01-01 10:00:00 installing 7.14 7.15', '7.15') == (True, {'updated_to': '7.15'}, True)
+    assert _collect_with('mkmassupdate 2026-01-01 10:00:00 installing 7.14 7.15', '7.14') == (False, {}, False)
+    assert _collect_with('mkmassupdate 2026-01-01 10:00:00 checking', '7.14') == (False, {}, False)
+    assert _collect_with('mkmassupdate 2026-01-01 10:00:00 queued', '7.14') == (False, {}, False)
+    assert _collect_with('mkmassupdate 2026-01-01 10:00:00 failed ERROR: could not resolve dns name', '7.14') == (False, {}, False)
+    assert _collect_with('mkmassupdate 2026-01-01 10:00:00 failed checking for updates...', '7.14') == (False, {}, False)
+    assert _collect_with('written by hand', '7.14') == (False, {}, False)
+
+
+def test_collect_without_job():
+    entry_lines = []
+    with patch('mkmassupdate._find_offload_script', return_value=None):
+        assert _collect_offload(MagicMock(), entry_lines, False) is False
+    assert 'No offload job' in entry_lines[0]
+
+
+def test_offload_then_collect(ip_list_file):
+    with FakeRouterOSServer(RouterProfile(reboot_time=0.1)) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        assert MassUpdater(_make_args(ip_list, offload=True)).run() is False
+        router = server.routers['127.0.0.1']
+        assert '/system/package/update/check-for-updates' not in router.commands
+        assert router.reboots == 1
+        assert 'installing' in router.scripts['mkmassupdate_offload']['comment']
+
+        time.sleep(0.2)
+        updater = MassUpdater(_make_args(ip_list, collect=True))
+        assert updater.run() is False
+        assert router.installed_version == '7.15.2'
+        assert 'mkmassupdate_offload' not in router.scripts
+
+
+def test_collect_reports_failed_check(ip_list_file):
+    with FakeRouterOSServer(RouterProfile(check_error='ERROR: could not resolve dns name')) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        assert MassUpdater(_make_args(ip_list, offload=True)).run() is False
+        router = server.routers['127.0.0.1']
+        assert router.scripts['mkmassupdate_offload']['comment'].endswith('failed ERROR: could not resolve dns name')
+        updater = MassUpdater(_make_args(ip_list, collect=True))
+        assert updater.run() is True
+        assert list(updater.results.failed_hosts()) == ['127.0.0.1']
+        assert router.reboots == 0
+
+
+def test_collect_reports_missing_job(ip_list_file):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        updater = MassUpdater(_make_args(ip_list, collect=True))
+        assert updater.run() is True
+        assert list(updater.results.failed_hosts()) == ['127.0.0.1']
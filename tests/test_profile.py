@@ -0,0 +1,72 @@
+import pytest
+import sys
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import os
+import queue
+import tempfile
+import threading
+import time
+import mkmassupdate
+from mkmassupdate import SamplingProfiler, _profile_category
+
+
+def test_profile_category():
+    assert _profile_category('/usr/lib/python3.11/queue.py', 'get') == 'queue'
+    assert _profile_category('/usr/lib/python3.11/ssl.py', 'recv') == 'tls'
+    assert _profile_category('/site-packages/librouteros/connections.py', 'read') == 'socket'
+    assert _profile_category('/site-packages/librouteros/protocol.py', 'readSentence') == 'librouteros'
+    assert _profile_category('/usr/lib/python3.11/logging/__init__.py', 'handle') == 'logging'
+    assert _profile_category('/root/mkmassupdate.py', '_worker') is None
+
+
+def _busy(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def _wait_for_log_lock(stop):
+    with mkmassupdate.log_lock:
+        pass
+
+
+def test_profiler_samples_waits_and_cpu():
+    stop = threading.Event()
+    q = queue.Queue()
+    mkmassupdate.log_lock.acquire()
+    threads = [
+        threading.Thread(target=_busy, args=(stop,), name="Busy-1"),
+        threading.Thread(target=_wait_for_log_lock, args=(stop,), name="Locked-1"),
+        threading.Thread(target=q.get, name="Idle-1"),
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'profile', 'run.folded')
+        for thread in threads:
+            thread.start()
+        profiler = SamplingProfiler(path, interval=0.002)
+        try:
+            time.sleep(0.4)
+        finally:
+            mkmassupdate.log_lock.release()
+            q.put(None)
+            stop.set()
+            profiler.close()
+            for thread in threads:
+                thread.join()
+
+        assert profiler.categories[('log_lock', 'wait')] > 0
+        assert profiler.categories[('queue', 'wait')] > 0
+        if hasattr(time, 'pthread_getcpuclockid'):
+            assert sum(count for (_, state), count in profiler.categories.items() if state == 'cpu') > 0
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert any(line.startswith('Locked;') for line in lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        assert int(count) > 0 and stack.endswith(('[cpu]', '[wait]'))
+        with open(f"{path}.txt", encoding='utf-8') as f:
+            report = f.read()
+        assert report.startswith('Profile: ')
+        assert 'log_lock' in report and 'queue' in report
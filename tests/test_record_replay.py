@@ -0,0 +1,70 @@
+import pytest
+import sys
+import os
+import json
+import glob
+import tempfile
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from mkmassupdate import MassUpdater, _setup_recorder
+from tests.fake_routeros import FakeRouterOSServer, ReplayRouterOSServer, RouterProfile
+from tests.test_integration import _make_args
+
+
+@pytest.fixture
+def record_dir():
+    with tempfile.TemporaryDirectory() as directory:
+        yield directory
+    _setup_recorder(None)
+
+
+def _record_run(record_dir, ip_list_file, profile):
+    _setup_recorder(record_dir)
+    with FakeRouterOSServer(profile) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        assert MassUpdater(_make_args(ip_list, dry_run=True)).run() is False
+    _setup_recorder(None)
+    return glob.glob(os.path.join(record_dir, '*.jsonl'))
+
+
+def test_record_writes_sanitized_transcript(record_dir, ip_list_file):
+    paths = _record_run(record_dir, ip_list_file, RouterProfile())
+    assert len(paths) == 1
+
+    with open(paths[0], encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert records[0]['host'] == '127.0.0.1'
+    login = next(r for r in records if r.get('words', [None])[0] == '/login')
+    assert '=password=********' in login['words']
+    assert '=password=test' not in json.dumps(records)
+    outgoing = [r['words'][0] for r in records if r.get('dir') == 'out']
+    assert '/system/package/update/check-for-updates' in outgoing
+
+
+def test_replay_reproduces_run(record_dir, ip_list_file):
+    _record_run(record_dir, ip_list_file, RouterProfile(checking_polls=3, latency=0.02))
+
+    server = ReplayRouterOSServer(record_dir, speed=10, host='127.0.0.1', address_for=lambda index: '127.0.0.1')
+    with server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        updater = MassUpdater(_make_args(ip_list, dry_run=True, password='anything'))
+        assert updater.run() is False
+    assert (updater.results.processed, updater.results.ok) == (1, 1)
+
+
+def test_replay_unknown_command_traps(record_dir, ip_list_file):
+    _record_run(record_dir, ip_list_file, RouterProfile())
+    commands = tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False, encoding='utf-8')
+    commands.write("- command: /interface/print\n")
+    commands.close()
+    try:
+        server = ReplayRouterOSServer(record_dir, speed=10, host='127.0.0.1', address_for=lambda index: '127.0.0.1')
+        with server:
+            ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+            updater = MassUpdater(_make_args(ip_list, dry_run=True, custom_commands=commands.name))
+            assert updater.run() is True
+    finally:
+        os.unlink(commands.name)
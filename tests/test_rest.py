@@ -0,0 +1,99 @@
+import pytest
+import sys
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import socket
+import librouteros
+from librouteros.query import Key
+from mkmassupdate import (
+    HOST_REST, HOST_SSL, MassUpdater, _connect_to_router, _host_flags_suffix, parse_host_line,
+    rest_sessions,
+)
+from tests.fake_routeros import FakeRestServer, RouterProfile
+from tests.test_integration import _make_args
+
+
+@pytest.fixture(autouse=True)
+def _empty_pool():
+    rest_sessions.close()
+    yield
+    rest_sessions.close()
+
+
+def test_password_that_looks_like_a_flag():
+    assert parse_host_line('10.0.0.1|admin|REST', 8728) == ('10.0.0.1', 8728, 'admin', 'REST', 0)
+    assert parse_host_line('10.0.0.1|admin|SSL', 8728) == ('10.0.0.1', 8728, 'admin', 'SSL', 0)
+    assert parse_host_line('10.0.0.1|admin|REST|SSL', 8728) == ('10.0.0.1', 8729, 'admin', 'REST', HOST_SSL)
+    assert parse_host_line('10.0.0.1|admin|SSL|REST|SSL', 8728) == ('10.0.0.1', 443, 'admin', 'SSL', HOST_REST | HOST_SSL)
+
+
+def test_parse_rest_flags():
+    assert parse_host_line('10.0.0.1|REST', 8728) == ('10.0.0.1', 80, None, None, HOST_REST)
+    assert parse_host_line('10.0.0.1|REST|SSL', 8728) == ('10.0.0.1', 443, None, None, HOST_REST | HOST_SSL)
+    assert parse_host_line('10.0.0.1:8443|admin|pw|SSL|REST', 8728) == ('10.0.0.1', 8443, 'admin', 'pw', HOST_REST | HOST_SSL)
+    assert parse_host_line('10.0.0.1|SSL', 8728) == ('10.0.0.1', 8729, None, None, True)
+    assert _host_flags_suffix(HOST_REST | HOST_SSL) == '|REST|SSL'
+    assert _host_flags_suffix(0) == ''
+
+
+def _connect(server, password='test'):
+    return _connect_to_router(('127.0.0.1', server.port, None, None, HOST_REST), 'admin', password, 5)
+
+
+def test_commands_paths_and_queries():
+    with FakeRestServer() as server:
+        api = _connect(server)
+        assert list(api('/system/identity/print')) == [{'name': 'router-127.0.0.1'}]
+        assert list(api('/system/script/add', name='s1', source=':put 1')) == [{'ret': '*1'}]
+        name_key, id_key = Key('name'), Key('.id')
+        assert list(api.path('/system', 'script').select(id_key).where(name_key == 's1')) == [{'.id': '*1'}]
+        assert list(api.path('/system', 'script').select(id_key).where(name_key == 'other')) == []
+        api.close()
+
+
+def test_trap_and_wrong_password():
+    with FakeRestServer() as server:
+        api = _connect(server)
+        with pytest.raises(librouteros.exceptions.TrapError, match='no new version available'):
+            list(api('/system/package/update/install'))
+        api.close()
+        with pytest.raises(librouteros.exceptions.TrapError, match='invalid user name or password'):
+            _connect(server, password='wrong')
+
+
+def test_pooled_connection_is_reused():
+    with FakeRestServer() as server:
+        for _ in range(3):
+            api = _connect(server)
+            list(api('/system/resource/print'))
+            api.close()
+        assert server.connections == 1
+
+
+def test_stale_pooled_connection_is_replaced():
+    with FakeRestServer() as server:
+        api = _connect(server)
+        api.close()
+        # As if the router had dropped the idle connection
+        key = ('127.0.0.1', server.port, False)
+        conn = rest_sessions.get(key)
+        conn.sock.shutdown(socket.SHUT_RDWR)
+        rest_sessions.put(key, conn)
+        api = _connect(server)
+        assert list(api('/system/identity/print')) == [{'name': 'router-127.0.0.1'}]
+        api.close()
+        assert server.connections == 2
+
+
+def test_update_over_rest(ip_list_file):
+    with FakeRestServer(RouterProfile(reboot_time=0.1)) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}|REST"])
+        updater = MassUpdater(_make_args(ip_list, update_status='follow'))
+        assert updater.run() is False
+        router = server.routers['127.0.0.1']
+        assert router.reboots == 1
+        assert router.installed_version == '7.15.2'
+        assert '/system/package/update/check-for-updates' in router.commands
@@ -0,0 +1,92 @@
+import pytest
+import sys
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import threading
+from mkmassupdate import RunResults, _peak_memory_bytes
+
+
+def test_counters_and_host_lists():
+    results = RunResults()
+    results.record('10.0.0.1', True, False, 1.0)
+    results.record('10.0.0.2', False, False, 2.0)
+    results.record('10.0.0.3', False, True, 0.0)
+    assert (results.processed, results.ok, results.failed, results.skipped) == (3, 1, 2, 1)
+    assert list(results.failed_hosts()) == ['10.0.0.2']
+    assert list(results.skipped_hosts()) == ['10.0.0.3']
+
+
+def test_failed_hosts_spill_to_disk():
+    results = RunResults(spill_threshold=100)
+    for i in range(250):
+        results.record(f"10.0.{i // 250}.{i % 250}", False, i % 10 == 0, 1.0)
+    assert results.spilled == 200
+    assert len(results._hosts) == 50
+    failed = list(results.failed_hosts())
+    skipped = list(results.skipped_hosts())
+    assert len(failed) == 225 and len(skipped) == 25
+    assert failed[0] == '10.0.0.1' and skipped[-1] == '10.0.0.240'
+    # Reading does not disturb later spills
+    for i in range(100):
+        results.record(f"10.1.0.{i}", False, False, 1.0)
+    assert len(list(results.failed_hosts())) == 325
+    results.close()
+
+
+def test_iteration_does_not_hold_the_lock():
+    results = RunResults(spill_threshold=10)
+    for i in range(25):
+        results.record(f"10.0.0.{i}", False, False, 1.0)
+    seen = []
+    # Recording from another thread mid-iteration used to wait for the iterator to finish
+    for host in results.failed_hosts():
+        seen.append(host)
+        if len(seen) == 1:
+            worker = threading.Thread(target=results.record, args=('10.0.1.1', False, False, 1.0))
+            worker.start()
+            worker.join(timeout=5)
+            assert not worker.is_alive()
+    assert seen[:25] == [f"10.0.0.{i}" for i in range(25)]
+    results.close()
+
+
+def test_successes_are_not_kept_per_host():
+    results = RunResults()
+    for i in range(100000):
+        results.record(f"10.{i >> 16}.{(i >> 8) & 255}.{i & 255}", True, False, 0.5)
+    assert results._hosts == []
+    assert results.durations.itemsize == 4 and len(results.durations) == 100000
+
+
+def test_percentile():
+    results = RunResults()
+    assert results.percentile(0.5) is None
+    for duration in range(1, 101):
+        results.record('h', True, False, float(duration))
+    assert results.percentile(0.5) == 50.0
+    assert results.percentile(0.95) == 95.0
+
+
+def test_concurrent_records():
+    results = RunResults(spill_threshold=50)
+
+    def work(worker):
+        for i in range(500):
+            results.record(f"{worker}-{i}", i % 2 == 0, False, 0.1)
+
+    threads = [threading.Thread(target=work, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results.processed == 4000 and results.ok == 2000
+    assert len(set(results.failed_hosts())) == 2000
+    results.close()
+
+
+def test_peak_memory_reported():
+    peak = _peak_memory_bytes()
+    assert peak is None or peak > 1024 * 1024
@@ -0,0 +1,106 @@
+import pytest
+import sys
+import socket
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import librouteros
+import mkmassupdate
+from mkmassupdate import RetryBudget, RetryPolicy, execute_with_retry, _parse_args, _retry_class
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(mocker):
+    yield mocker.patch('mkmassupdate.time.sleep')
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    budget = RetryBudget(ratio=0.5, min_retries=1)
+    monkeypatch.setattr(mkmassupdate, 'retry_budget', budget)
+    return budget
+
+
+class TestRetryPolicy:
+    def test_exponential_without_jitter(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=100.0, jitter=False)
+        assert [policy.delay(a) for a in range(4)] == [1.0, 2.0, 4.0, 8.0]
+
+    def test_delay_capped(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=5.0, jitter=False)
+        assert policy.delay(10) == 5.0
+
+    def test_full_jitter_within_bounds(self):
+        policy = RetryPolicy(base_delay=2.0, max_delay=60.0)
+        delays = [policy.delay(2) for _ in range(200)]
+        assert all(0 <= d <= 8.0 for d in delays)
+        assert len(set(delays)) > 1
+
+
+class TestRetryBudget:
+    def test_allows_floor_then_ratio(self):
+        budget = RetryBudget(ratio=0.5, min_retries=2)
+        assert budget.try_acquire()
+        assert budget.try_acquire()
+        assert not budget.try_acquire()
+        for _ in range(10):
+            budget.record_call()
+        assert budget.try_acquire()
+        assert budget.denied == 1
+
+    def test_window_expires(self, mocker):
+        clock = mocker.patch('mkmassupdate.time.monotonic', return_value=100.0)
+        budget = RetryBudget(ratio=0.0, min_retries=1, window=10)
+        assert budget.try_acquire()
+        assert not budget.try_acquire()
+        clock.return_value = 111.0
+        assert budget.try_acquire()
+
+
+class TestRetryClass:
+    def test_socket_error_is_network(self):
+        assert _retry_class('/system/identity/print', socket.error()) == 'network'
+
+    def test_transient_cloud_trap(self):
+        error = librouteros.exceptions.TrapError(message='could not connect to cloud')
+        assert _retry_class('/system/backup/cloud/upload-file', error) == 'cloud'
+
+    def test_other_trap_not_retried(self):
+        error = librouteros.exceptions.TrapError(message='failure: already have user with this name')
+        assert _retry_class('/user/add', error) is None
+
+
+class TestExecuteWithRetry:
+    def test_non_transient_trap_raises_immediately(self, mocker):
+        api = mocker.Mock(side_effect=librouteros.exceptions.TrapError(message='no such command'))
+        with pytest.raises(librouteros.exceptions.TrapError):
+            execute_with_retry(api, '/bogus')
+        assert api.call_count == 1
+
+    def test_transient_cloud_trap_retried(self, mocker, no_sleep):
+        error = librouteros.exceptions.TrapError(message='connection timeout')
+        api = mocker.Mock(side_effect=[error, iter([])])
+        assert execute_with_retry(api, '/system/backup/cloud/print') == []
+        assert api.call_count == 2
+        assert no_sleep.call_count == 1
+
+    def test_gives_up_after_max_retries(self, mocker):
+        api = mocker.Mock(side_effect=socket.error('down'))
+        with pytest.raises(socket.error):
+            execute_with_retry(api, '/system/identity/print', max_retries=2)
+        assert api.call_count == 2
+
+    def test_budget_stops_retries(self, mocker, budget):
+        api = mocker.Mock(side_effect=socket.error('down'))
+        with pytest.raises(socket.error):
+            execute_with_retry(api, '/system/identity/print', max_retries=5)
+        # one retry from the floor, then the budget is spent
+        assert api.call_count == 2
+        assert budget.denied == 1
+
+
+def test_retry_budget_is_opt_in(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['prog', '-u', 'admin', '-p', 'pass'])
+    assert _parse_args().retry_budget == 0.0
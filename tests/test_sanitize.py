@@ -5,7 +5,7 @@ sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
 import logging
 logging.disable(logging.CRITICAL)
 
-from mkmassupdate import _sanitize_command_item
+from mkmassupdate import _sanitize_command_item, _sanitize_api_word
 
 
 def test_sanitize_password_param():
@@ -55,3 +55,21 @@ def test_sanitize_pwd_param():
     result = _sanitize_command_item(item)
     cmd, params = result
     assert params['pwd'] == '********'
+
+
+def test_sanitize_api_word_attribute():
+    assert _sanitize_api_word('=password=secret123') == '=password=********'
+
+
+def test_sanitize_api_word_query():
+    assert _sanitize_api_word('?=secret=abc') == '?=secret=********'
+
+
+def test_sanitize_api_word_reply_key():
+    assert _sanitize_api_word('=secret-download-key=abc') == '=secret-download-key=********'
+
+
+def test_sanitize_api_word_keeps_other_words():
+    assert _sanitize_api_word('/login') == '/login'
+    assert _sanitize_api_word('=name=admin') == '=name=admin'
+    assert _sanitize_api_word('.tag=1') == '.tag=1'
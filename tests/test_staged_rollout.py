@@ -0,0 +1,103 @@
+import pytest
+import sys
+import os
+import tempfile
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from unittest.mock import MagicMock, patch
+from mkmassupdate import MassUpdater, StateStore, _download_updates, _reboot_staged
+from tests.fake_routeros import FakeRouterOSServer, RouterProfile
+from tests.test_integration import _make_args
+
+
+@pytest.fixture
+def state_path():
+    with tempfile.TemporaryDirectory() as directory:
+        yield os.path.join(directory, 'state.sqlite')
+
+
+def _staged(state_path):
+    store = StateStore(state_path)
+    try:
+        return store.staged()
+    finally:
+        store.close()
+
+
+def test_record_staged(state_path):
+    store = StateStore(state_path)
+    store.record_staged('10.0.0.1', '7.15.2', False)
+    store.record_staged('10.0.0.2', None, True)
+    store.record_staged('10.0.0.3', '7.15.2', False)
+    store.record_staged('10.0.0.3', None, False)
+    assert store.staged() == {'10.0.0.1': ('7.15.2', False), '10.0.0.2': (None, True)}
+    store.close()
+
+
+def test_download_updates_up_to_date():
+    api = MagicMock()
+    entry_lines: list[str] = []
+    rows = [{'installed-version': '7.15.2', 'latest-version': '7.15.2'}]
+    assert _download_updates(api, rows, entry_lines, False, 3, 0.0) == (True, None)
+    api.path.assert_not_called()
+
+
+def test_download_updates_times_out():
+    api = MagicMock()
+    entry_lines: list[str] = []
+    rows = [{'installed-version': '7.14.3', 'latest-version': '7.15.2'}]
+    downloading = [{'status': 'downloading 40%'}]
+    with patch('mkmassupdate.execute_with_retry'), \
+         patch('mkmassupdate._execute_router_command', return_value=downloading):
+        assert _download_updates(api, rows, entry_lines, False, 2, 0.0) == (False, None)
+    assert 'Timeout waiting for the download of 7.15.2' in entry_lines[-1]
+
+
+def test_reboot_staged_skips_missing_packages():
+    api = MagicMock()
+    entry_lines: list[str] = []
+    status = [{'installed-version': '7.14.3', 'status': 'New version is available'}]
+    with patch('mkmassupdate._execute_router_command', return_value=status), \
+         patch('mkmassupdate._reboot_router') as reboot:
+        assert _reboot_staged(api, '7.15.2', False, entry_lines) is False
+        reboot.assert_not_called()
+
+
+def test_reboot_staged_already_installed():
+    api = MagicMock()
+    entry_lines: list[str] = []
+    status = [{'installed-version': '7.15.2', 'status': 'System is already up to date'}]
+    with patch('mkmassupdate._execute_router_command', return_value=status), \
+         patch('mkmassupdate._reboot_router') as reboot:
+        assert _reboot_staged(api, '7.15.2', False, entry_lines) is True
+        reboot.assert_not_called()
+
+
+def test_download_then_reboot_staged(ip_list_file, state_path):
+    with FakeRouterOSServer(RouterProfile(reboot_time=0.1)) as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        assert MassUpdater(_make_args(ip_list, state_db=state_path, download_only=True)).run() is False
+        router = server.routers['127.0.0.1']
+        assert router.reboots == 0
+        assert router.installed_version == '7.14.3'
+        assert '/system/package/update/install' not in router.commands
+        assert _staged(state_path) == {'127.0.0.1': ('7.15.2', False)}
+
+        router.commands.clear()
+        assert MassUpdater(_make_args(ip_list, state_db=state_path, reboot_staged=True)).run() is False
+        assert router.reboots == 1
+        assert router.installed_version == '7.15.2'
+        assert '/system/package/update/check-for-updates' not in router.commands
+        assert _staged(state_path) == {}
+
+
+def test_reboot_staged_ignores_unstaged_hosts(ip_list_file, state_path):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        updater = MassUpdater(_make_args(ip_list, state_db=state_path, reboot_staged=True))
+        assert updater.run() is False
+        assert server.connections == 0
+        assert updater.results.processed == 0
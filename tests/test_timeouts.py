@@ -0,0 +1,101 @@
+import pytest
+import sys
+import os
+import tempfile
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from unittest.mock import MagicMock, patch
+import mkmassupdate
+from mkmassupdate import HostTiming, MassUpdater, StateStore, _download_updates, execute_with_retry
+from tests.fake_routeros import FakeRouterOSServer
+from tests.test_integration import _make_args
+
+
+@pytest.fixture
+def state_path():
+    with tempfile.TemporaryDirectory() as directory:
+        yield os.path.join(directory, 'state.sqlite')
+
+
+def test_rtt_p99_needs_enough_samples(state_path):
+    store = StateStore(state_path)
+    store.record_rtts('10.0.0.1', [0.1, 0.2], [])
+    assert store.rtt_p99('10.0.0.1') == {}
+    store.record_rtts('10.0.0.1', [0.3], [0.05] * 99 + [0.9])
+    assert store.rtt_p99('10.0.0.1') == {'connect': 0.3, 'command': 0.05}
+    store.close()
+
+
+def test_rtt_history_is_bounded(state_path):
+    store = StateStore(state_path)
+    store.record_rtts('10.0.0.1', [5.0] * 10, [])
+    store.record_rtts('10.0.0.1', [0.1] * 100, [])
+    assert store.rtt_p99('10.0.0.1') == {'connect': 0.1}
+    store.close()
+
+
+def test_host_timing_clamps_to_floor_and_ceiling(state_path):
+    updater = MassUpdater(_make_args('unused', state_db=state_path, adaptive_timeouts=True))
+    updater.state = StateStore(state_path)
+    updater.state.record_rtts('10.0.0.1', [0.01] * 5, [100.0] * 5)
+    timing = updater._host_timing('10.0.0.1')
+    assert timing.connect_timeout == 2.0
+    assert timing.command_timeout == 120.0
+    assert timing.slow_timeout == 120.0
+    unknown = updater._host_timing('10.0.0.2')
+    assert unknown.connect_timeout is None and unknown.command_timeout is None
+    updater.state.close()
+
+
+def test_host_timing_without_adaptive_only_samples(state_path):
+    updater = MassUpdater(_make_args('unused', state_db=state_path))
+    updater.state = StateStore(state_path)
+    updater.state.record_rtts('10.0.0.1', [0.5] * 5, [0.5] * 5)
+    timing = updater._host_timing('10.0.0.1')
+    assert timing.connect_timeout is None and timing.command_timeout is None
+    assert MassUpdater(_make_args('unused'))._host_timing('10.0.0.1') is None
+    updater.state.close()
+
+
+def test_execute_with_retry_sets_socket_timeout():
+    api = MagicMock(return_value=iter([{'name': 'router'}]))
+    mkmassupdate._host_timing.current = HostTiming(2.0, 3.0, 30.0)
+    try:
+        execute_with_retry(api, '/system/identity/print')
+        api.protocol.transport.sock.settimeout.assert_called_with(3.0)
+        execute_with_retry(api, '/system/package/update/check-for-updates')
+        api.protocol.transport.sock.settimeout.assert_called_with(30.0)
+        assert len(mkmassupdate._host_timing.current.command_rtts) == 1
+    finally:
+        mkmassupdate._host_timing.current = None
+
+
+def test_package_download_keeps_slow_timeout():
+    # The download goes through a Path, so the command name is just 'download'
+    api = MagicMock()
+    package_path = api.path.return_value
+    status = [{'installed-version': '7.14', 'latest-version': '7.15', 'status': 'New version is available'}]
+    mkmassupdate._host_timing.current = HostTiming(2.0, 3.0, 30.0)
+    try:
+        with patch('mkmassupdate._execute_router_command', return_value=[{'status': 'Downloaded, please reboot'}]):
+            assert _download_updates(api, status, [], False, 1, 0.0) == (True, '7.15')
+        package_path.assert_called_once_with('download')
+        package_path.protocol.transport.sock.settimeout.assert_called_with(30.0)
+    finally:
+        mkmassupdate._host_timing.current = None
+
+
+def test_runs_record_and_use_rtts(ip_list_file, state_path):
+    with FakeRouterOSServer() as server:
+        ip_list = ip_list_file([f"127.0.0.1:{server.port}"])
+        for _ in range(3):
+            updater = MassUpdater(_make_args(ip_list, dry_run=True, state_db=state_path, adaptive_timeouts=True))
+            assert updater.run() is False
+        store = StateStore(state_path)
+        p99 = store.rtt_p99('127.0.0.1')
+        store.close()
+        assert set(p99) == {'connect', 'command'}
+        assert p99['connect'] < 2.0
@@ -0,0 +1,71 @@
+import pytest
+import sys
+import os
+import json
+import socket
+import tempfile
+sys.path.insert(0, '/mnt/dropbox/Documenti/Mikrotik/MikroTik-Mass-Updater')
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import mkmassupdate
+from mkmassupdate import ChromeTracer, NullTracer, _setup_tracer, execute_with_retry
+
+
+@pytest.fixture
+def trace_path():
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    yield path
+    os.unlink(path)
+    _setup_tracer(None)
+
+
+def _load_events(path):
+    with open(path, encoding='utf-8') as f:
+        return [e for e in json.load(f)['traceEvents'] if e['ph'] == 'X']
+
+
+def test_null_tracer_returns_shared_span():
+    tracer = NullTracer()
+    assert tracer.span('a', host='x') is tracer.span('b')
+
+
+def test_setup_tracer_disabled_by_default():
+    assert isinstance(_setup_tracer(None), NullTracer)
+    assert mkmassupdate.tracer.enabled is False
+
+
+def test_nested_spans_written(trace_path):
+    tracer = ChromeTracer(trace_path)
+    with tracer.span('host', host='10.0.0.1') as host_span:
+        with tracer.span('connect'):
+            pass
+        host_span.set(success=True)
+    tracer.close()
+
+    events = {e['name']: e for e in _load_events(trace_path)}
+    assert events['host']['args'] == {'host': '10.0.0.1', 'success': True}
+    host, connect = events['host'], events['connect']
+    assert host['ts'] <= connect['ts']
+    assert connect['ts'] + connect['dur'] <= host['ts'] + host['dur']
+
+
+def test_span_records_exception_type(trace_path):
+    tracer = ChromeTracer(trace_path)
+    with pytest.raises(TimeoutError):
+        with tracer.span('connect'):
+            raise TimeoutError
+    tracer.close()
+    assert _load_events(trace_path)[0]['args']['error'] == 'TimeoutError'
+
+
+def test_execute_with_retry_traces_attempts_and_sleeps(trace_path, mocker):
+    _setup_tracer(trace_path)
+    api = mocker.Mock(side_effect=[socket.error('boom'), iter([{'name': 'r1'}])])
+    assert execute_with_retry(api, '/system/identity/print', retry_delay=0) == [{'name': 'r1'}]
+    mkmassupdate.tracer.close()
+
+    names = [e['name'] for e in _load_events(trace_path)]
+    assert names == ['attempt', 'retry_sleep', 'attempt']